@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+
+from chart_spec import REDUCERS
+
+# --- カテゴリカルなX軸の集計 ---
+# グループ分け（カテゴリ番号）はデータセットとX列ごとに1回、集計値は列ごとに全種類を1回でまとめて求めて使い回す。
+STREAM_REDUCERS = ["sum", "mean", "count"]  # 大容量モードで全行分を集計済みのもの
+OTHER_LABEL = "その他"
+
+
+class GroupIndex:
+    # X列の値をカテゴリ番号に置き換えたもの（並びは登場順。欠損はどのグループにも入れない）
+    def __init__(self, keys):
+        codes, labels = pd.factorize(keys, sort=False, use_na_sentinel=True)
+        valid = codes >= 0
+        self.labels = pd.Index(np.asarray(labels, dtype=object))
+        self.codes = codes[valid]
+        self.rows = None if valid.all() else np.flatnonzero(valid)  # 欠損を除いた行（全部有効なら None）
+        self.order = np.argsort(self.codes, kind="stable")  # グループ順に並べ替える添字
+
+    @property
+    def n_groups(self):
+        return len(self.labels)
+
+    def take(self, values):
+        return values if self.rows is None else values[self.rows]
+
+    def nbytes(self):
+        row_bytes = self.rows.nbytes if self.rows is not None else 0
+        return self.codes.nbytes + self.order.nbytes + row_bytes + int(self.labels.memory_usage(deep=True))
+
+
+def reduce_all(codes, values, n_groups, order=None):
+    # 1列分の全ての集計値を bincount と並べ替え1回で求める（欠損は除く。std は pandas と同じ ddof=1）
+    ok = ~np.isnan(values)
+    v = np.where(ok, values, 0.0)
+    count = np.bincount(codes, weights=ok, minlength=n_groups)
+    total = np.bincount(codes, weights=v, minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        dev = np.where(ok, values - mean[codes], 0.0)
+        std = np.sqrt(np.bincount(codes, weights=dev * dev, minlength=n_groups) / (count - 1))
+    std[count < 2] = np.nan
+
+    # グループ内で値を昇順に並べ（欠損は末尾）、先頭・末尾・真ん中を取り出す
+    if order is None:
+        order = np.argsort(codes, kind="stable")
+    g, sv = codes[order], values[order]
+    sv = sv[np.lexsort((sv, g))]  # lexsort は NaN を末尾に置く
+    starts = np.searchsorted(g, np.arange(n_groups))
+    n = count.astype(np.int64)
+    has = n > 0
+    s, k = starts[has], n[has]
+    minimum, maximum, median = (np.full(n_groups, np.nan) for _ in range(3))
+    minimum[has] = sv[s]
+    maximum[has] = sv[s + k - 1]
+    median[has] = (sv[s + (k - 1) // 2] + sv[s + k // 2]) / 2
+    return {"sum": total, "mean": mean, "median": median, "count": count, "min": minimum, "max": maximum, "std": std}
+
+
+def group_stats(index, values):
+    return reduce_all(index.codes, index.take(values), index.n_groups, index.order)
+
+
+def top_groups(ranking, top_n):
+    # 値が大きい順に top_n 個を選ぶ（表示は元の登場順のまま）
+    rank = np.nan_to_num(ranking, nan=-np.inf)
+    return np.sort(np.argsort(-rank, kind="stable")[:top_n])
+
+
+def aggregate(index, values_by_col, reducer, top_n=None, stats=None):
+    # values_by_col は {列名: 全行分のfloat配列}、stats は作り置きの {列名: group_stats の結果}
+    # 戻り値は (ラベル, {列名: 集計値}, 「その他」にまとめたグループ数)
+    stats = stats or {col: group_stats(index, values) for col, values in values_by_col.items()}
+    columns = {col: stats[col][reducer] for col in values_by_col}
+    if not top_n or index.n_groups <= top_n + 1:
+        return index.labels, columns, 0
+    keep = top_groups(columns[next(iter(columns))], top_n)
+    # 残り全部を1つのグループとして集計し直す（平均・中央値なども正しく求まるように）
+    remap = np.full(index.n_groups, top_n, dtype=np.int64)
+    remap[keep] = np.arange(top_n)
+    codes = remap[index.codes]
+    for col, values in values_by_col.items():
+        other = reduce_all(codes, index.take(values), top_n + 1)[reducer][-1]
+        columns[col] = np.append(columns[col][keep], other)
+    return index.labels[keep].append(pd.Index([OTHER_LABEL], dtype=object)), columns, index.n_groups - top_n
+
+
+def aggregate_stream(sums, sizes, y_axes, reducer, top_n=None):
+    # 大容量モード：読み込み時に求めたグループごとの合計と行数から集計する（中央値などは求められない）
+    sums, sizes = sums[y_axes], sizes.reindex(sums.index)
+    if top_n and len(sums) > top_n + 1:
+        ranking = sizes if reducer == "count" else (sums[y_axes[0]] / sizes if reducer == "mean" else sums[y_axes[0]])
+        keep = top_groups(ranking.to_numpy(dtype=float), top_n)
+        rest = np.setdiff1d(np.arange(len(sums)), keep)
+        other = pd.DataFrame([sums.iloc[rest].sum()], index=pd.Index([OTHER_LABEL], dtype=object))
+        sums = pd.concat([sums.iloc[keep], other])
+        sizes = pd.concat([sizes.iloc[keep], pd.Series([sizes.iloc[rest].sum()], index=other.index)])
+        n_other = len(rest)
+    else:
+        n_other = 0
+    if reducer == "count":
+        columns = {col: sizes.to_numpy(dtype=float) for col in y_axes}
+    elif reducer == "mean":
+        columns = {col: (sums[col] / sizes).to_numpy(dtype=float) for col in y_axes}
+    else:
+        columns = {col: sums[col].to_numpy(dtype=float) for col in y_axes}
+    return pd.Index(sums.index, dtype=object), columns, n_other
+
+
+def _thinned_notice(df, stream):
+    # 大容量モードで、集計せずに間引いた行をそのまま描く場合
+    if stream is None or stream.stride == 1:
+        return []
+    return [("info", f"💡 大容量モードのため、全{stream.row_count}行のうち、{stream.stride}行ごとの区間の先頭と"
+                     f"各列の最小・最大の行（{len(df)}行）で描いています。")]
+
+
+def plot_frame(df, spec, stream, profile):
+    # 描画に使う表。カテゴリカルなX軸で重複がある場合は集計する（種類が多い棒グラフ・円グラフは上位以外を「その他」にまとめる）
+    # 戻り値は (表, 再現用のコード, [(level, message), ...])。集計しない場合は元のデータをそのまま返す（コピーしない）
+    chart_type, x_axis, y_axes = spec["chart_type"], spec["x_axis"], spec["y_axes"]
+    notices = []
+    if not y_axes or chart_type not in ["折れ線グラフ", "散布図", "棒グラフ", "複合グラフ", "円グラフ"]:
+        return df, "plot_df = df", notices
+    for col in y_axes:
+        if not profile.is_numeric(col):
+            notices.append(("warning", f"⚠️ '{col}' は数値データではないため、正しく表示されない可能性があります。数値の列を選択してください。"))
+    if not x_axis or profile.is_numeric(x_axis) or profile.is_datetime(x_axis):
+        return df, "plot_df = df", notices + _thinned_notice(df, stream)
+
+    reducer, label = spec["reducer"], REDUCERS[spec["reducer"]]
+    top_n = spec["top_n"] if chart_type in ["棒グラフ", "円グラフ"] else None
+    aggregated = None
+    if stream is not None and x_axis in stream.group_sums and reducer in STREAM_REDUCERS:
+        # 大容量モードでは読み込み時に計算した全行分の合計・行数を使う
+        duplicated = len(stream.group_counts[x_axis]) < stream.row_count
+        if duplicated or top_n:
+            aggregated = aggregate_stream(stream.group_sums[x_axis], stream.group_counts[x_axis], y_axes, reducer, top_n)
+    else:
+        duplicated = profile.has_duplicates(x_axis)
+        if duplicated or top_n:
+            if stream is not None:
+                notices.append(("warning", f"⚠️ '{x_axis}' の{label}は、間引いたデータで集計しています。"))
+            aggregated = aggregate(profile.group_index(x_axis), {c: profile.values(c) for c in y_axes}, reducer, top_n,
+                                   stats={c: profile.group_stats(x_axis, c) for c in y_axes})
+    if aggregated is None or not (duplicated or aggregated[2]):
+        return df, "plot_df = df", notices + _thinned_notice(df, stream)
+
+    labels, columns, n_other = aggregated
+    if duplicated:
+        notices.append(("info", f"💡 '{x_axis}' に重複があるため、値の{label}を表示します。"))
+    if n_other:
+        notices.append(("info", f"💡 '{x_axis}' の種類が多いため、上位{top_n}件以外の{n_other}件を「{OTHER_LABEL}」にまとめています。"))
+    snippet = f"plot_df = df.groupby('{x_axis}', sort=False)[{y_axes}].{reducer}().reset_index()"
+    if n_other:
+        snippet += (f"\nkeep = plot_df['{y_axes[0]}'].nlargest({top_n}).index.sort_values()"
+                    f"\nother = df[~df['{x_axis}'].isin(plot_df.loc[keep, '{x_axis}']) & df['{x_axis}'].notna()][{y_axes}].agg('{reducer}')"
+                    f"\nplot_df = pd.concat([plot_df.loc[keep], pd.DataFrame([{{'{x_axis}': '{OTHER_LABEL}', **other}}])], ignore_index=True)")
+    return pd.DataFrame({x_axis: labels, **columns}), snippet, notices
@@ -0,0 +1,90 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from chart_builder import build_figure
+from chart_spec import EXPORT_FORMATS, load_spec
+from data_loader import ParseCache, load_path
+from downsample import RENDER_DPI
+
+# --- 複数のCSV × チャート仕様をまとめて描画するコマンド ---
+# 例: python batch_render.py --csv data/*.csv --spec specs/*.json --format png pdf --out out/
+
+# ワーカーごとのパース結果（同じCSVは1つのワーカーで1回だけ読む）
+_parse_cache = None
+
+
+def _init_worker(max_bytes):
+    global _parse_cache
+    _parse_cache = ParseCache(max_entries=4, max_bytes=max_bytes)
+
+
+def output_stem(csv_path, spec_path):
+    name = lambda p: os.path.splitext(os.path.basename(p))[0]
+    return f"{name(csv_path)}__{name(spec_path)}"
+
+
+def render_job(csv_path, spec_path, out_dir, formats, dpi):
+    result = {"csv": csv_path, "spec": spec_path, "outputs": [], "error": None,
+              "parse": 0.0, "build": 0.0, "save": 0.0}
+    try:
+        start = time.perf_counter()
+        df = load_path(csv_path, _parse_cache)
+        spec = load_spec(spec_path)
+        result["parse"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        fig, code, notices = build_figure(df, spec)
+        result["build"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        stem = os.path.join(out_dir, output_stem(csv_path, spec_path))
+        for file_format in formats:
+            path = f"{stem}.{file_format}"
+            fig.savefig(path, format=file_format, dpi=dpi, bbox_inches='tight')
+            result["outputs"].append(path)
+        result["save"] = time.perf_counter() - start
+        result["notices"] = [message for _, message in notices]
+    except Exception as e:
+        # 1つの失敗で全体を止めない（最後の一覧で報告する）
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def print_summary(results, wall, out=sys.stdout):
+    print(f"{'job':<40} {'parse':>8} {'build':>8} {'save':>8}  status", file=out)
+    for r in results:
+        job = output_stem(r["csv"], r["spec"])
+        status = "ok" if r["error"] is None else f"FAILED ({r['error']})"
+        print(f"{job:<40} {r['parse']:>7.2f}s {r['build']:>7.2f}s {r['save']:>7.2f}s  {status}", file=out)
+    failed = sum(r["error"] is not None for r in results)
+    busy = sum(r["parse"] + r["build"] + r["save"] for r in results)
+    print(f"{len(results)} jobs, {failed} failed, {wall:.2f}s wall, {busy:.2f}s total in workers", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="GraphyPad のチャート仕様(JSON)をCSVに適用して画像をまとめて書き出します。")
+    parser.add_argument("--csv", nargs="+", required=True, help="入力ファイル（CSV・Parquet・Feather/Arrow・Excel）")
+    parser.add_argument("--spec", nargs="+", required=True, help="チャート仕様のJSONファイル")
+    parser.add_argument("--out", default="out", help="出力先ディレクトリ")
+    parser.add_argument("--format", nargs="+", default=["png"], choices=EXPORT_FORMATS, help="出力形式")
+    parser.add_argument("--dpi", type=int, default=RENDER_DPI)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--max-bytes", type=int, default=1024 ** 3, help="ワーカーごとのパース結果の上限（バイト）")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out, exist_ok=True)
+    # CSVごとに並べて投入し、同じファイルの仕事が同じワーカーに続けて渡りやすくする
+    jobs = [(csv_path, spec_path) for csv_path in args.csv for spec_path in args.spec]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(args.max_bytes,)) as pool:
+        futures = [pool.submit(render_job, c, s, args.out, args.format, args.dpi) for c, s in jobs]
+        results = [f.result() for f in futures]
+    print_summary(results, time.perf_counter() - start)
+    return 1 if any(r["error"] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import numpy as np
+import pandas as pd
+
+from chart_spec import CHART_TYPES
+
+# --- 読み込み・列情報・集計・描画・PNG書き出しの時間を段階ごとに測るベンチマーク ---
+# 同梱のサンプルCSVと同じ形の合成データを、行数・列数・文字コードを変えて作り（乱数の種を固定）、
+# 1つの条件ごとに新しいプロセスで測る（最大メモリ使用量を条件ごとに分けて記録するため）。結果はJSONに書き出す。
+# 例: python benchmark.py --rows 1e3 1e5 --cols 3 50 --out bench.json
+#     python benchmark.py --out new.json --compare bench.json
+SHAPES = ["experiment", "category", "stats"]
+ENCODINGS = {"utf-8": "utf-8-sig", "shift-jis": "cp932"}  # 同梱のサンプルはBOM付きUTF-8
+CATEGORIES = ["食費", "光熱費", "通信費", "遊び", "交通費", "書籍", "衣服", "医療費", "貯金", "その他"]
+SERIES = 3  # 1つのグラフに描く列の数
+
+
+def make_frame(shape, rows, cols, seed=0):
+    # 同梱のサンプルCSVと同じ形の表（cols は列の総数）
+    rng = np.random.default_rng(seed)
+    data = {}
+    if shape == "experiment":
+        # sample_experiment.csv：時間と、ゆっくり変化する温度の列
+        data["時間(s)"] = np.arange(rows) * 5
+        for i in range(max(cols - 1, 1)):
+            walk = np.cumsum(rng.normal(0, 0.3, rows))
+            data[f"温度{i + 1}(℃)"] = np.round(20 + i + walk, 1)
+    elif shape == "category":
+        # sample_category.csv：通番・項目（カテゴリ）と、金額・満足度の列
+        data["通番"] = np.arange(1, rows + 1)
+        data["項目"] = np.asarray(CATEGORIES, dtype=object)[rng.integers(0, len(CATEGORIES), rows)]
+        for i in range(max(cols - 2, 1)):
+            if i % 2 == 0:
+                data[f"金額{i // 2 + 1}(円)"] = rng.integers(500, 10_000, rows)
+            else:
+                data[f"満足度{i // 2 + 1}"] = rng.integers(1, 6, rows)
+    elif shape == "stats":
+        # sample_stats.csv：平均・ばらつきの違うグループの測定値
+        for i in range(max(cols, 1)):
+            data[f"グループ{i + 1}"] = np.round(rng.normal(70 + 3 * i, 8 + i % 5, rows), 1)
+    else:
+        raise ValueError(f"unknown shape: {shape}")
+    return pd.DataFrame(data)
+
+
+def make_csv(shape, rows, cols, encoding, seed=0):
+    return make_frame(shape, rows, cols, seed).to_csv(index=False).encode(ENCODINGS[encoding])
+
+
+def chart_specs(df):
+    # 形ごとに意味のある組み合わせでグラフの仕様を作る（全ての形を合わせると8種類すべてを測る）
+    columns = list(df.columns)
+    category = "項目" if "項目" in columns else None
+    numeric = [c for c in columns if c != category and pd.api.types.is_numeric_dtype(df[c])]
+    x_axis = category or columns[0]
+    values = [c for c in numeric if c != x_axis][:SERIES] or numeric[:1]
+    specs = {}
+    for chart_type in CHART_TYPES:
+        spec = {"chart_type": chart_type, "x_axis": x_axis, "y_axes": values}
+        if chart_type in ["ヒストグラム", "箱ひげ図", "バイオリンプロット"]:
+            spec.update(x_axis=None, y_axes=numeric[:SERIES])
+        elif chart_type == "円グラフ":
+            # 円グラフは項目（カテゴリ）の列がある形だけで測る（数値のX軸では1行ごとに扇形ができてしまう）
+            if category is None:
+                continue
+            spec.update(y_axes=values[:1])
+        elif chart_type == "複合グラフ":
+            types = ["Line", "Bar", "Scatter"]
+            spec["y_configs"] = {c: {"type": types[i % len(types)]} for i, c in enumerate(values)}
+            spec["y_axis_mapping"] = {c: min(i, 2) for i, c in enumerate(values)}
+        specs[chart_type] = spec
+    return specs
+
+
+def _timed(func, repeat):
+    # 何回か実行して最短の時間を使う（最後の戻り値も返す）
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        times.append(time.perf_counter() - start)
+    return min(times), value
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト単位
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(case, repeat, dpi):
+    # 1つの条件（形・行数・列数・文字コード）を測る。新しいプロセスで呼ばれる
+    from aggregation import plot_frame
+    from chart_builder import build_figure
+    from chart_spec import normalize_spec
+    from data_loader import parse_csv
+    from profiling import ColumnProfile
+
+    result = dict(case, stages={}, draw_cold={}, draw_warm={}, encode={}, aggregate={}, errors={})
+    base_rss = peak_rss_mb()
+    data = make_csv(case["shape"], case["rows"], case["cols"], case["encoding"], case["seed"])
+    result["csv_bytes"] = len(data)
+
+    stages = result["stages"]
+    stages["parse"], df = _timed(lambda: parse_csv(data), repeat)
+    data = None  # 読み込んだ後は元のバイト列を持たない
+
+    def build_profile():
+        profile = ColumnProfile(df)
+        profile.compute_all()
+        return profile
+    stages["profile"], profile = _timed(build_profile, repeat)
+
+    for chart_type, spec in chart_specs(df).items():
+        spec = normalize_spec(spec)
+        try:
+            # 集計（カテゴリカルなX軸）は列情報に作り置きされるので、描画の前に1回目だけを測る
+            start = time.perf_counter()
+            plot_frame(df, spec, None, profile)
+            result["aggregate"][chart_type] = time.perf_counter() - start
+            # 初回の描画：新しい列情報で1回だけ（描画用の配列・グループ分け・要約を作るところから）
+            start = time.perf_counter()
+            build_figure(df, spec, profile=ColumnProfile(df))
+            result["draw_cold"][chart_type] = time.perf_counter() - start
+            # 再描画：作り置きのある列情報で repeat 回の最短（見た目だけを変えた場合などに近い）
+            result["draw_warm"][chart_type], (fig, _, _) = _timed(lambda: build_figure(df, spec, profile=profile), repeat)
+
+            def encode():
+                buf = io.BytesIO()
+                fig.savefig(buf, format="png", dpi=dpi, bbox_inches="tight")
+                return buf.getvalue()
+            result["encode"][chart_type], png = _timed(encode, repeat)
+            result.setdefault("png_bytes", {})[chart_type] = len(png)
+        except Exception as e:
+            result["errors"][chart_type] = f"{type(e).__name__}: {e}"
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    result["base_rss_mb"] = base_rss
+    return result
+
+
+def environment():
+    import matplotlib
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "numpy": np.__version__, "pandas": pd.__version__, "matplotlib": matplotlib.__version__,
+            "commit": commit, "started": datetime.now().isoformat(timespec="seconds")}
+
+
+def flatten(result):
+    # 比較用に {"parse": 秒, "draw_cold/折れ線グラフ": 秒, ...} の形にする
+    times = dict(result["stages"])
+    for stage in ("aggregate", "draw_cold", "draw_warm", "encode"):
+        times.update({f"{stage}/{chart}": t for chart, t in result[stage].items()})
+    return times
+
+
+def case_id(r):
+    return f"{r['shape']}-{r['rows']}x{r['cols']}-{r['encoding']}"
+
+
+def compare(results, baseline, tolerance, min_seconds=0.005, out=sys.stdout):
+    # 基準の結果と同じ条件・段階を比べ、tolerance（割合）より遅くなったものを返す
+    base = {case_id(r): flatten(r) for r in baseline["results"] if "error" not in r}
+    regressions = []
+    for r in results:
+        old = base.get(case_id(r))
+        if old is None:
+            continue
+        for stage, t in flatten(r).items():
+            t_old = old.get(stage)
+            if t_old is None or max(t, t_old) < min_seconds:
+                continue  # 短すぎる段階は測定の揺れの方が大きい
+            ratio = t / t_old if t_old > 0 else float("inf")
+            if ratio > 1 + tolerance:
+                regressions.append((case_id(r), stage, t_old, t, ratio))
+    for cid, stage, t_old, t, ratio in regressions:
+        print(f"SLOWER  {cid:<32} {stage:<24} {t_old * 1e3:>9.1f}ms -> {t * 1e3:>9.1f}ms  (x{ratio:.2f})", file=out)
+    print(f"{len(regressions)} regressions over {tolerance:.0%}", file=out)
+    return regressions
+
+
+def print_summary(results, out=sys.stdout):
+    print(f"{'case':<32} {'parse':>8} {'profile':>8} {'draw1st':>8} {'redraw':>8} {'encode':>8} {'peak RSS':>10}", file=out)
+    for r in results:
+        if "error" in r:
+            print(f"{case_id(r):<32} FAILED ({r['error']})", file=out)
+            continue
+        s = r["stages"]
+        cold, warm, encode = sum(r["draw_cold"].values()), sum(r["draw_warm"].values()), sum(r["encode"].values())
+        rss = f"{r['peak_rss_mb']:.0f}MB" if r["peak_rss_mb"] is not None else "-"
+        print(f"{case_id(r):<32} {s['parse']:>7.3f}s {s['profile']:>7.3f}s {cold:>7.3f}s {warm:>7.3f}s {encode:>7.3f}s {rss:>10}", file=out)
+        for chart_type, error in r["errors"].items():
+            print(f"  {chart_type}: {error}", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="GraphyPad の読み込み・集計・描画の時間を、合成データで段階ごとに測ります。")
+    parser.add_argument("--shapes", nargs="+", default=SHAPES, choices=SHAPES, help="データの形（同梱のサンプルCSVに対応）")
+    parser.add_argument("--rows", nargs="+", type=float, default=[1e3, 1e4, 1e5], help="行数（1e3〜1e7）")
+    parser.add_argument("--cols", nargs="+", type=int, default=[3, 20], help="列数（1〜200）")
+    parser.add_argument("--encodings", nargs="+", default=list(ENCODINGS), choices=list(ENCODINGS))
+    parser.add_argument("--repeat", type=int, default=3, help="各段階の実行回数（最短の時間を記録）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dpi", type=int, default=None, help="PNGの解像度（省略時は画面表示と同じ）")
+    parser.add_argument("--out", default="benchmark.json", help="結果を書き出すJSONファイル")
+    parser.add_argument("--compare", default=None, help="比べる基準の結果（JSON）。遅くなった段階があれば終了コード1")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="遅くなったとみなす割合")
+    args = parser.parse_args(argv)
+
+    rows = [int(n) for n in args.rows]
+    if not all(1e3 <= n <= 1e7 for n in rows) or not all(1 <= n <= 200 for n in args.cols):
+        parser.error("行数は1e3〜1e7、列数は1〜200の範囲で指定してください")
+    if args.dpi is None:
+        from downsample import RENDER_DPI
+        args.dpi = RENDER_DPI
+
+    cases = [{"shape": shape, "rows": n, "cols": cols, "encoding": encoding, "seed": args.seed}
+             for shape in args.shapes for n in rows for cols in args.cols for encoding in args.encodings]
+    results = []
+    for i, case in enumerate(cases, 1):
+        print(f"[{i}/{len(cases)}] {case_id(case)}", file=sys.stderr, flush=True)
+        # 条件ごとに新しいプロセスを使う（前の条件のメモリやキャッシュを持ち越さない）
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            try:
+                results.append(pool.submit(run_case, case, args.repeat, args.dpi).result())
+            except Exception as e:
+                results.append(dict(case, error=f"{type(e).__name__}: {e}"))
+
+    report = {"environment": environment(), "settings": vars(args), "results": results}
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    print_summary(results)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        ok = [r for r in results if "error" not in r]
+        if compare(ok, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
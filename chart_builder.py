@@ -0,0 +1,487 @@
+import inspect
+import io
+
+import japanize_matplotlib  # noqa: F401（日本語フォントの登録）
+import numpy as np
+import pandas as pd
+import matplotlib.dates as mdates
+from matplotlib.colors import LinearSegmentedColormap, LogNorm, to_rgba
+from matplotlib.figure import Figure
+from matplotlib.ticker import MultipleLocator
+
+import downsample
+import telemetry
+from aggregation import plot_frame
+from chart_spec import RESAMPLE_METHODS, axis_style, fmt, normalize_spec
+from column_stats import histogram_edges
+from downsample import (DENSITY_CELL_PX, DENSITY_THRESHOLD, DOWNSAMPLE_THRESHOLD, RENDER_DPI,
+                        density_grid, minmax_indices, pixel_indices, resample_time, time_step)
+from profiling import ColumnProfile, timestamp_days
+
+
+def fmt_interval(seconds):
+    for unit, size in (("日", 86_400), ("時間", 3_600), ("分", 60)):
+        if seconds >= size and seconds % size == 0:
+            return f"{seconds // size}{unit}"
+    return f"{seconds}秒"
+
+
+# --- 見た目の設定（ラベル・文字サイズ・凡例・目盛・グリッド・範囲）の反映 ---
+# 作り直さずに更新する場合（figure_model）も同じ関数を使う。2回目以降は、前回の設定で変えた範囲・目盛・凡例を
+# 描画直後の状態に戻してから反映し直す。
+LINE_TYPES = ["折れ線グラフ", "散布図", "棒グラフ", "複合グラフ"]
+
+
+def apply_style(handles, spec):
+    axes = handles["axes"]
+    ax = axes[0]
+    chart_type, x_axis = spec["chart_type"], spec["x_axis"]
+    font_title, font_label_global, font_tick_global = spec["fonts"]
+    xmin_val, xmax_val, ymin_val, ymax_val = spec["limits"]
+    x_major_step, x_minor_step, y_major_step, y_minor_step = spec["ticks"]
+    grid_major, grid_minor, tick_dir = spec["grid"]
+    with_limits = chart_type != "円グラフ"
+
+    if "locators" not in handles:
+        # 描画直後の目盛の決め方（日付・カテゴリの目盛を含む）を覚えておく
+        handles["locators"] = (ax.xaxis.get_major_locator(), ax.xaxis.get_minor_locator(),
+                               ax.yaxis.get_major_locator(), ax.yaxis.get_minor_locator())
+    else:
+        x_major, x_minor, y_major, y_minor = handles["locators"]
+        ax.xaxis.set_major_locator(x_major)
+        ax.xaxis.set_minor_locator(x_minor)
+        ax.yaxis.set_major_locator(y_major)
+        ax.yaxis.set_minor_locator(y_minor)
+        if ax.get_legend() is not None:
+            ax.get_legend().remove()
+        if with_limits:
+            for target_ax in axes.values():
+                target_ax.autoscale()
+
+    # 各軸の個別設定
+    if chart_type in LINE_TYPES:
+        for i, target_ax in axes.items():
+            a_label, a_label_fs, a_tick_fs, a_min, a_max = axis_style(spec["axis_configs"].get(i, {}), spec["fonts"])
+            target_ax.set_ylabel(a_label, fontsize=a_label_fs, color='black')
+            target_ax.tick_params(axis='y', labelsize=a_tick_fs, colors='black')
+            if a_min is not None: target_ax.set_ylim(bottom=a_min)
+            if a_max is not None: target_ax.set_ylim(top=a_max)
+
+    if chart_type != "円グラフ":
+        ax.set_xlabel(fmt(spec["x_name"], spec["x_unit"]) or (x_axis if x_axis else ""), fontsize=font_label_global, color='black')
+
+    ax.set_title(spec["title"], fontsize=font_title, color='black', pad=20)
+
+    if len(spec["y_axes"]) > 1 and chart_type not in ["円グラフ", "ヒストグラム"]:
+        # 全ての軸から凡例情報を収集
+        h_all, l_all = [], []
+        for a_idx in sorted(axes.keys()):
+            h, l = axes[a_idx].get_legend_handles_labels()
+            h_all.extend(h)
+            l_all.extend(l)
+        if h_all:
+            ax.legend(h_all, l_all)
+    elif chart_type == "ヒストグラム":
+        ax.legend()
+    
+    ax.tick_params(labelsize=font_tick_global, colors='black')
+
+    # --- 目盛・グリッドの詳細設定適用 ---
+    if chart_type in LINE_TYPES:
+        # 先に補助目盛を有効化（後から呼ぶとLocatorがリセットされるため）
+        if x_minor_step or y_minor_step or grid_minor:
+            ax.minorticks_on()
+    
+        # 目盛間隔の設定
+        if x_major_step: ax.xaxis.set_major_locator(MultipleLocator(x_major_step))
+        if x_minor_step: ax.xaxis.set_minor_locator(MultipleLocator(x_minor_step))
+        if y_major_step: ax.yaxis.set_major_locator(MultipleLocator(y_major_step))
+        if y_minor_step: ax.yaxis.set_minor_locator(MultipleLocator(y_minor_step))
+    
+        # 目盛自体の見た目調整
+        ax.tick_params(which='major', labelsize=font_tick_global, colors='black', length=6, direction=tick_dir)
+        ax.tick_params(which='minor', colors='black', length=3, direction=tick_dir)
+    
+        # グリッド
+        if grid_major:
+            ax.grid(True, which='major', linestyle='--', alpha=0.3, color='gray')
+        else:
+            ax.grid(False, which='major')
+        if grid_minor:
+            ax.grid(True, which='minor', linestyle=':', alpha=0.2, color='gray')
+        else:
+            ax.grid(False, which='minor')
+
+    if with_limits:
+        if xmin_val is not None: ax.set_xlim(left=xmin_val)
+        if xmax_val is not None: ax.set_xlim(right=xmax_val)
+        if ymin_val is not None: ax.set_ylim(bottom=ymin_val)
+        if ymax_val is not None: ax.set_ylim(top=ymax_val)
+        ax.set_aspect(spec["aspect"])
+
+
+# --- 描画本体（Streamlitに依存しない） ---
+# 戻り値は (Figure, 再現用のPythonコード, [(level, message), ...])
+# handles に辞書を渡すと、軸（{番号: Axes}）と系列ごとの描画物（{列名: (種類, Artist, 棒の幅)}）を書き込む
+def build_figure(df, spec, stream=None, profile=None, handles=None):
+    spec = normalize_spec(spec)
+    if profile is None:
+        profile = ColumnProfile(df, stream)
+    missing = [c for c in [spec["x_axis"], spec["facet"]] + spec["y_axes"] if c is not None and c not in profile.columns]
+    if missing:
+        raise ValueError(f"データに列がありません: {', '.join(map(str, missing))}")
+    if spec["facet"] is not None:
+        # 分割表示は別モジュールで組み立てる（パネルごとの軸が別なので、見た目だけの変更にも handles は使わない）
+        from facets import build_facet_figure
+        return build_facet_figure(df, spec, stream, profile)
+    chart_type, x_axis, y_axes = spec["chart_type"], spec["x_axis"], spec["y_axes"]
+    y_configs, y_axis_mapping, axis_configs = spec["y_configs"], spec["y_axis_mapping"], spec["axis_configs"]
+    hist_bins, chart_title, x_name, x_unit = spec["hist_bins"], spec["title"], spec["x_name"], spec["x_unit"]
+    font_title, font_label_global, font_tick_global = spec["fonts"]
+    width_val, height_val = spec["size"]
+    aspect_val, downsample_on, scatter_style = spec["aspect"], spec["downsample"], spec["scatter_style"]
+    xmin_val, xmax_val, ymin_val, ymax_val = spec["limits"]
+    x_major_step, x_minor_step, y_major_step, y_minor_step = spec["ticks"]
+    grid_major, grid_minor, tick_dir = spec["grid"]
+
+    # pyplotを通さずに作る（グローバルな図の一覧に残らないので閉じ忘れがない）
+    fig = Figure(figsize=(width_val, height_val), facecolor='white')
+    ax = fig.subplots()
+    ax.set_facecolor('white')
+
+    code_snippets = []
+    notices = []
+    helpers = []  # 生成コードに埋め込む関数（間引き処理など）
+    series = {}  # 列名 -> (種類, Artist, 棒の幅)。見た目だけの変更を図に直接反映するために使う
+
+    # データの数値チェックと集計（集計しない場合は元のデータをそのまま読むだけで、コピーしない）
+    with telemetry.stage("aggregate"):
+        plot_df, agg_snippet, agg_notices = plot_frame(df, spec, stream, profile)
+    notices += agg_notices
+
+    # 日時のX軸：表示範囲の行だけを取り出し、点が画面の幅より多ければ一定の間隔ごとにまとめる
+    time_x = (chart_type in ["折れ線グラフ", "散布図", "棒グラフ", "複合グラフ"] and x_axis is not None
+              and profile.is_datetime(x_axis) and plot_df is df)
+    if time_x:
+        x_days = profile.values(x_axis)
+        if spec["time_window"]:
+            lo, hi = (timestamp_days(t) for t in spec["time_window"])
+            if profile.is_sorted(x_axis):
+                # 昇順に並んでいれば二分探索で切り出す（範囲外の行は読まない）
+                rows = slice(int(np.searchsorted(x_days, lo, side="left")), int(np.searchsorted(x_days, hi, side="right")))
+            else:
+                rows = (x_days >= lo) & (x_days <= hi)
+        else:
+            rows = slice(None)
+        x_days = x_days[rows]
+        columns = {c: profile.values(c)[rows] for c in y_axes}
+        time_code = [f"df['{x_axis}'] = pd.to_datetime(df['{x_axis}'])"]
+        if spec["time_window"]:
+            w_lo, w_hi = spec["time_window"]
+            notices.append(("info", f"💡 {w_lo} 〜 {w_hi} の{len(x_days)}行を表示しています。"))
+            time_code.append(f"df = df[(df['{x_axis}'] >= '{w_lo}') & (df['{x_axis}'] <= '{w_hi}')]")
+        width_px = int(width_val * RENDER_DPI)
+        n_buckets = width_px // 4 if any(conf.get("type") == "Bar" for conf in y_configs.values()) else width_px
+        if spec["resample"] != "off" and y_axes and len(x_days) > n_buckets and np.isfinite(x_days).any():
+            step = time_step(np.nanmax(x_days) - np.nanmin(x_days), n_buckets)
+            for c in y_axes:
+                x_res, columns[c] = resample_time(x_days, columns[c], step, spec["resample"])
+            x_days = x_res
+            seconds = int(round(step * 86_400))
+            notices.append(("info", f"💡 点が多いため、{fmt_interval(seconds)}ごとの{RESAMPLE_METHODS[spec['resample']]}にまとめて表示しています（{len(x_days)}点）。"))
+            # 間隔の区切りは1970-01-01から数える（resample_time と同じ）。行のない間隔は作らない
+            time_code.append(f"resampled = df.set_index('{x_axis}')[{y_axes}].resample('{seconds}s', origin='epoch')\n"
+                             f"plot_df = resampled.{spec['resample']}()[resampled.size() > 0].reset_index()")
+        else:
+            time_code.append("plot_df = df")
+        agg_snippet = "\n".join(time_code)
+        # matplotlib の日付の数値（既定では1970-01-01からの日数）に合わせる
+        plot_df = pd.DataFrame({x_axis: x_days + mdates.date2num(np.datetime64("1970-01-01T00:00:00")), **columns}, copy=False)
+
+    def values(col):
+        # 数値列の描画用float配列。元のデータなら列情報に作り置きしたものを使い、集計した場合だけ作り直す
+        if plot_df is df:
+            return profile.values(col)
+        return plot_df[col].to_numpy(dtype=float, na_value=np.nan)
+
+    def dist_stats(cols):
+        # ヒストグラム・箱ひげ図・バイオリンプロット用の列の要約（値が1つもない列は除く）
+        stats = {col: profile.column_stats(col) for col in cols}
+        return {col: summary for col, summary in stats.items() if summary.count}
+
+    if chart_type in ["折れ線グラフ", "散布図", "棒グラフ", "複合グラフ"]:
+        # X軸が数値かどうかを判定
+        is_numeric_x = pd.api.types.is_numeric_dtype(plot_df[x_axis])
+    
+        # 軸の初期化
+        axes = {0: ax}
+    
+        # 座標の決定
+        if is_numeric_x and (chart_type != "棒グラフ" or time_x):
+            # 実数値ベース
+            x_plot = values(x_axis)  # float にしておく（縮小した整数型でも差分があふれないように）
+            use_index_x = False
+        else:
+            # カテゴリベース
+            x_plot = np.arange(len(plot_df))
+            use_index_x = True
+    
+        bar_cols = [c for c, conf in y_configs.items() if conf.get("type") == "Bar"]
+        if bar_cols:
+            if not use_index_x and len(df) > 1:
+                # 数値軸の場合、データの最小間隔に合わせて棒の幅を計算
+                diffs = np.diff(np.sort(x_plot))
+                min_diff = np.min(diffs[diffs > 0]) if any(diffs > 0) else 1.0
+                total_width = min_diff * 0.8
+            else:
+                total_width = 0.8
+            width = total_width / len(bar_cols)
+    
+        max_axis_idx = max(y_axis_mapping.values()) if y_axis_mapping else 0
+        for i in range(1, max_axis_idx+1):
+            new_ax = ax.twinx()
+            if i > 1:
+                new_ax.spines["right"].set_position(("axes", 1.0 + (i-1)*0.15))
+            axes[i] = new_ax
+            code_snippets.append(f"ax{i} = ax.twinx()")
+            if i > 1:
+                code_snippets.append(f"ax{i}.spines['right'].set_position(('axes', {1.0 + (i-1)*0.15}))")
+
+        # 間引きの単位（保存するPNGのピクセル数）
+        width_px, height_px = int(width_val * RENDER_DPI), int(height_val * RENDER_DPI)
+
+        bar_count = 0
+        for col in y_axes:
+            conf = y_configs[col]
+            p_type = conf["type"]
+            p_color = conf["color"]
+            p_size = conf["size"]
+            p_label = col if conf["show_legend"] else "_nolegend_"
+        
+            a_idx = y_axis_mapping.get(col, 0)
+            target_ax = axes[a_idx]
+            ax_prefix = f"ax{a_idx}" if a_idx > 0 else "ax"
+
+            # 点が非常に多い散布図は点ではなく密度（格子ごとの点の数）で描く
+            y_numeric = pd.api.types.is_numeric_dtype(plot_df[col])
+            use_density = (p_type == "Scatter" and not use_index_x and y_numeric
+                           and (scatter_style == "密度" or (scatter_style == "自動" and len(plot_df) > DENSITY_THRESHOLD)))
+
+            # 点が多すぎる折れ線・散布図は画面の解像度に合わせて間引く
+            x_draw, y_draw = x_plot, values(col) if y_numeric else plot_df[col]
+            x_code, y_code = "x_plot", f"plot_df['{col}']"
+            if (downsample_on and p_type in ["Line", "Scatter"] and len(plot_df) > DOWNSAMPLE_THRESHOLD
+                    and not use_density and not use_index_x and y_numeric):
+                y_values = y_draw
+                if p_type == "Line":
+                    keep = minmax_indices(x_plot, y_values, width_px)
+                    keep_code = f"minmax_indices(x_plot, {y_code}.to_numpy(dtype=float), {width_px})"
+                    helper = minmax_indices
+                else:
+                    keep = pixel_indices(x_plot, y_values, width_px, height_px)
+                    keep_code = f"pixel_indices(x_plot, {y_code}.to_numpy(dtype=float), {width_px}, {height_px})"
+                    helper = pixel_indices
+                if helper not in helpers:
+                    helpers.append(helper)
+                x_draw, y_draw = x_plot[keep], y_values[keep]
+                code_snippets.append(f"keep = {keep_code}")
+                x_code, y_code = "x_plot[keep]", f"{y_code}.to_numpy(dtype=float)[keep]"
+                notices.append(("info", f"💡 '{col}' は{len(plot_df)}点中{len(keep)}点に間引いて描画しています（画面の解像度で見分けられる点のみ）。"))
+
+            if use_density:
+                n_x, n_y = max(width_px // DENSITY_CELL_PX, 1), max(height_px // DENSITY_CELL_PX, 1)
+                counts, extent = density_grid(x_plot, y_draw, n_x, n_y)
+                # 点の少ないセルは薄く、0件のセルは透明にする
+                cmap = LinearSegmentedColormap.from_list(f"density_{col}", [to_rgba(p_color, 0.15), p_color])
+                im = target_ax.imshow(np.ma.masked_equal(counts, 0), extent=extent, origin='lower', aspect='auto',
+                                      interpolation='nearest', cmap=cmap, norm=LogNorm())
+                fig.colorbar(im, ax=target_ax, label=f"{col}（点の数）")
+                series[col] = ("density", target_ax.scatter([], [], color=p_color, label=p_label), None)  # 凡例用
+                if density_grid not in helpers:
+                    helpers.append(density_grid)
+                code_snippets.append("from matplotlib.colors import LinearSegmentedColormap, LogNorm")
+                code_snippets.append(f"counts, extent = density_grid(x_plot, {y_code}.to_numpy(dtype=float), {n_x}, {n_y})")
+                code_snippets.append(f"cmap = LinearSegmentedColormap.from_list('density', [{to_rgba(p_color, 0.15)}, '{p_color}'])")
+                code_snippets.append(f"im = {ax_prefix}.imshow(np.ma.masked_equal(counts, 0), extent=extent, origin='lower', aspect='auto', interpolation='nearest', cmap=cmap, norm=LogNorm())")
+                code_snippets.append(f"fig.colorbar(im, ax={ax_prefix}, label='{col}（点の数）')")
+                code_snippets.append(f"{ax_prefix}.scatter([], [], color='{p_color}', label='{p_label}')")
+                notices.append(("info", f"💡 '{col}' は{len(plot_df)}点あるため、密度（{n_x}×{n_y}の格子ごとの点の数）で表示しています。"))
+            elif p_type == "Line":
+                line, = target_ax.plot(x_draw, y_draw, marker='o', color=p_color, linewidth=p_size, markersize=p_size*2, label=p_label)
+                series[col] = ("line", line, None)
+                code_snippets.append(f"{ax_prefix}.plot({x_code}, {y_code}, marker='o', color='{p_color}', linewidth={p_size}, markersize={p_size*2}, label='{p_label}')")
+            elif p_type == "Scatter":
+                series[col] = ("scatter", target_ax.scatter(x_draw, y_draw, s=p_size*10, color=p_color, label=p_label, alpha=0.7), None)
+                code_snippets.append(f"{ax_prefix}.scatter({x_code}, {y_code}, s={p_size*10}, color='{p_color}', label='{p_label}', alpha=0.7)")
+            elif p_type == "Bar":
+                current_width = width * p_size
+                if len(bar_cols) > 0:
+                    offset = (bar_count - len(bar_cols)/2 + 0.5) * width
+                    series[col] = ("bar", target_ax.bar(x_plot + offset, y_draw, current_width, color=p_color, label=p_label), width)
+                    code_snippets.append(f"{ax_prefix}.bar(x_plot + {offset}, plot_df['{col}'], {current_width}, color='{p_color}', label='{p_label}')")
+                    bar_count += 1
+                else:
+                    series[col] = ("bar", target_ax.bar(x_plot, y_draw, width=current_width, color=p_color, label=p_label), width)
+                    code_snippets.append(f"{ax_prefix}.bar(x_plot, plot_df['{col}'], width={current_width}, color='{p_color}', label='{p_label}')")
+    
+        if use_index_x:
+            ax.set_xticks(x_plot)
+            ax.set_xticklabels(plot_df[x_axis])
+            code_snippets.insert(0, f"ax.set_xticks(x_plot)\nax.set_xticklabels(plot_df['{x_axis}'])")
+        elif time_x:
+            # 1行ごとのラベルではなく、表示範囲に合わせた日付の目盛にする
+            locator = mdates.AutoDateLocator()
+            ax.xaxis.set_major_locator(locator)
+            ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+            code_snippets.insert(0, "locator = mdates.AutoDateLocator()\n"
+                                    "ax.xaxis.set_major_locator(locator)\nax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))")
+
+        # 描画に使ったX座標と同じものを作る（カテゴリは0からの連番、日時は matplotlib の日付の数値）
+        if use_index_x:
+            code_snippets.insert(0, "x_plot = np.arange(len(plot_df))\n")
+        elif time_x:
+            code_snippets.insert(0, f"import matplotlib.dates as mdates\nx_plot = mdates.date2num(plot_df['{x_axis}'])\n")
+        else:
+            code_snippets.insert(0, f"x_plot = plot_df['{x_axis}'].to_numpy(dtype=float)\n")
+
+        # 各軸の個別設定（図への反映は apply_style でまとめて行う）
+        for i in axes:
+            a_label, a_label_fs, a_tick_fs, a_min, a_max = axis_style(axis_configs.get(i, {}), spec["fonts"])
+            ax_prefix = f"ax{i}" if i > 0 else "ax"
+            code_snippets.append(f"{ax_prefix}.set_ylabel('{a_label}', fontsize={a_label_fs})")
+            code_snippets.append(f"{ax_prefix}.tick_params(axis='y', labelsize={a_tick_fs})")
+            if a_min is not None: code_snippets.append(f"{ax_prefix}.set_ylim(bottom={a_min})")
+            if a_max is not None: code_snippets.append(f"{ax_prefix}.set_ylim(top={a_max})")
+
+    elif chart_type == "ヒストグラム":
+        axes = {0: ax}
+        if stream is not None:
+            # 細かいヒストグラムを指定の階級数にまとめ直して描画
+            hist_cols = [c for c in y_axes if c in stream.summaries]
+            edges, counts = stream.histogram(hist_cols, hist_bins)
+            if hist_cols:
+                ax.hist([edges[:-1]] * len(hist_cols), bins=edges, weights=counts, label=hist_cols, alpha=0.7)
+        else:
+            # 並べ替え済みの値から各階級の度数を求めて描画（階級数を変えても生データは読み直さない）
+            stats = dist_stats(y_axes)
+            hist_cols = list(stats)
+            if hist_cols:
+                edges = histogram_edges(min(stats[c].min for c in hist_cols), max(stats[c].max for c in hist_cols), hist_bins)
+                counts = [stats[c].counts(edges) for c in hist_cols]
+                ax.hist([edges[:-1]] * len(hist_cols), bins=edges, weights=counts, label=hist_cols, alpha=0.7)
+        code_snippets.append(f"ax.hist([df[col].dropna() for col in {y_axes}], bins={hist_bins}, label={y_axes}, alpha=0.7)")
+    
+    elif chart_type == "円グラフ":
+        axes = {0: ax}
+        val_col = y_axes[0]
+        ax.pie(plot_df[val_col], labels=plot_df[x_axis], autopct='%1.1f%%', startangle=90, counterclock=False)
+        code_snippets.append(f"ax.pie(plot_df['{val_col}'], labels=plot_df['{x_axis}'], autopct='%1.1f%%', startangle=90, counterclock=False)")
+    
+    elif chart_type == "箱ひげ図":
+        axes = {0: ax}
+        if stream is not None:
+            ax.bxp([stream.summaries[c].box_stats(c) for c in y_axes if c in stream.summaries])
+        else:
+            # ax.boxplot と同じ決め方の統計量を、列の要約から描く
+            ax.bxp([summary.box_stats(col) for col, summary in dist_stats(y_axes).items()])
+        code_snippets.append(f"ax.boxplot([df[col].dropna() for col in {y_axes}])\nax.set_xticks(range(1, {len(y_axes) + 1}), labels={y_axes})")
+    
+    elif chart_type == "バイオリンプロット":
+        axes = {0: ax}
+        if stream is not None:
+            y_axes = [c for c in y_axes if c in stream.summaries]
+            ax.violin([stream.summaries[c].violin_stats() for c in y_axes], showmeans=True)
+        else:
+            y_axes = list(dist_stats(y_axes))
+            ax.violin([profile.column_stats(c).violin_stats() for c in y_axes], showmeans=True)
+        ax.set_xticks(range(1, len(y_axes) + 1))
+        ax.set_xticklabels(y_axes)
+        code_snippets.append(f"ax.violinplot([df[col].dropna() for col in {y_axes}], showmeans=True)")
+
+
+    handles = {} if handles is None else handles
+    handles.update(axes=axes, series=series)
+    apply_style(handles, spec)
+
+    # Pythonコードの生成
+    # 間引きを使った場合は同じ関数をコードに埋め込む（同じ図を再現できるように）
+    helper_code = ""
+    if helpers:
+        helper_code = "\n# 画面解像度に合わせた間引き\n" + "\n\n".join(
+            inspect.getsource(f) for f in [downsample._finite_index, downsample._pixel_cells, downsample.bucket_extremes] + helpers)
+
+    full_code = f"""import pandas as pd
+import matplotlib.pyplot as plt
+import japanize_matplotlib
+import numpy as np
+{helper_code}
+# データを読み込む
+df = pd.read_csv('data.csv')
+
+# 集計 (カテゴリカルなX軸で重複がある場合)
+{agg_snippet}
+
+fig, ax = plt.subplots(figsize=({width_val}, {height_val}))
+
+{chr(10).join(code_snippets)}
+
+ax.set_title('{chart_title}', fontsize={font_title})
+"""
+    if chart_type != "円グラフ":
+        full_code += f"ax.set_xlabel('{fmt(x_name, x_unit)}', fontsize={font_label_global})\n"
+    
+    full_code += f"ax.tick_params(labelsize={font_tick_global})\n"
+    
+    # 凡例のコード生成
+    if len(y_axes) > 1 and chart_type not in ["円グラフ", "ヒストグラム"]:
+        full_code += """
+# 全ての軸から凡例情報を収集
+lines_all, labels_all = [], []
+for i in range(6): # ax, ax1, ..., ax5 をチェック
+    ax_name = 'ax' if i == 0 else f'ax{i}'
+    if ax_name in locals():
+        target_ax = locals()[ax_name]
+        lns, lbs = target_ax.get_legend_handles_labels()
+        lines_all.extend(lns)
+        labels_all.extend(lbs)
+ax.legend(lines_all, labels_all)
+"""
+    elif chart_type == "ヒストグラム":
+        full_code += "ax.legend()\n"
+        full_code += "from matplotlib.ticker import MultipleLocator\n"
+        if x_major_step: full_code += f"ax.xaxis.set_major_locator(MultipleLocator({x_major_step}))\n"
+        if x_minor_step: full_code += f"ax.xaxis.set_minor_locator(MultipleLocator({x_minor_step}))\n"
+        if y_major_step: full_code += f"ax.yaxis.set_major_locator(MultipleLocator({y_major_step}))\n"
+        if y_minor_step: full_code += f"ax.yaxis.set_minor_locator(MultipleLocator({y_minor_step}))\n"
+        
+        if grid_major:
+            full_code += "ax.grid(True, which='major', linestyle='--', alpha=0.3)\n"
+        if grid_minor:
+            full_code += "ax.minorticks_on()\n"
+            full_code += "ax.grid(True, which='minor', linestyle=':', alpha=0.2)\n"
+        
+        full_code += f"ax.tick_params(which='both', direction='{tick_dir}')\n"
+
+    
+    # スケール設定をコードに追加
+    if chart_type in ["折れ線グラフ", "散布図", "棒グラフ", "複合グラフ", "ヒストグラム", "箱ひげ図", "バイオリンプロット"]:
+        if xmin_val is not None: full_code += f"ax.set_xlim(left={xmin_val})\n"
+        if xmax_val is not None: full_code += f"ax.set_xlim(right={xmax_val})\n"
+        if ymin_val is not None: full_code += f"ax.set_ylim(bottom={ymin_val})\n"
+        if ymax_val is not None: full_code += f"ax.set_ylim(top={ymax_val})\n"
+        if aspect_val != 'auto':
+            val_str = f"'{aspect_val}'" if isinstance(aspect_val, str) else aspect_val
+            full_code += f"ax.set_aspect({val_str})\n"
+
+    full_code += "plt.show()"
+
+    return fig, full_code, notices
+
+
+def render_figure(df, spec, file_format="png", dpi=RENDER_DPI, stream=None, profile=None):
+    with telemetry.stage("build_figure"):
+        fig, code, notices = build_figure(df, spec, stream=stream, profile=profile)
+    buf = io.BytesIO()
+    with telemetry.stage("savefig", format=file_format, dpi=dpi):
+        fig.savefig(buf, format=file_format, dpi=dpi, bbox_inches='tight')
+    return buf.getvalue(), code, notices
@@ -0,0 +1,88 @@
+import json
+
+# --- チャート仕様（サイドバーの設定・JSONのチャート仕様） ---
+# 描画ライブラリ（matplotlib・日本語フォント）を読み込まずに使えるよう、描画本体とは分けておく。
+
+CHART_TYPES = ["折れ線グラフ", "散布図", "棒グラフ", "複合グラフ", "ヒストグラム", "円グラフ", "箱ひげ図", "バイオリンプロット"]
+DEFAULT_COLORS = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf"]
+EXPORT_FORMATS = ["png", "svg", "pdf"]
+# カテゴリカルなX軸で重複がある場合の集計方法
+REDUCERS = {"sum": "合計", "mean": "平均", "median": "中央値", "count": "件数", "min": "最小", "max": "最大", "std": "標準偏差"}
+# 日時のX軸で点が画面の幅より多い場合に、一定の間隔ごとにまとめる方法
+RESAMPLE_METHODS = {"mean": "平均", "min": "最小", "max": "最大", "sum": "合計", "off": "まとめない"}
+# 列の値ごとにパネルを分けて並べる場合（分割表示）の軸の共有のしかた
+FACET_SHARE = {"both": "縦軸・横軸とも共通", "x": "横軸だけ共通", "y": "縦軸だけ共通", "none": "パネルごと"}
+FACET_TYPES = ["折れ線グラフ", "散布図", "棒グラフ", "複合グラフ", "ヒストグラム", "箱ひげ図", "バイオリンプロット"]
+MAX_FACETS = 36  # これより種類が多い場合は、行数の多い順にこの数だけ並べる
+
+# サイドバーの設定と同じ項目（JSONのチャート仕様で省略した項目はこの値になる）
+DEFAULT_SPEC = {
+    "chart_type": "折れ線グラフ", "x_axis": None, "y_axes": [],
+    "y_configs": {}, "y_axis_mapping": {}, "axis_configs": {}, "hist_bins": 20,
+    "title": None, "x_name": None, "x_unit": "",
+    "fonts": [24, 18, 14],
+    "size": [10.0, 6.0], "aspect": "auto",
+    "downsample": True, "scatter_style": "自動",
+    "reducer": "sum", "top_n": None,
+    "resample": "mean", "time_window": None,
+    "facet": None, "facet_share": "both", "facet_cols": None,
+    "limits": [None, None, None, None],
+    "ticks": [None, None, None, None],
+    "grid": [True, False, "in"],
+}
+
+
+# ラベル整形用関数
+def fmt(n, u):
+    if n and u: return f"{n} ({u})"
+    return n if n else (f"({u})" if u else "")
+
+
+def axis_style(conf, fonts):
+    # 各Y軸の (ラベル, ラベルの文字サイズ, 目盛の文字サイズ, 下限, 上限)
+    _, font_label_global, font_tick_global = fonts
+    return (fmt(conf.get("name", ""), conf.get("unit", "")), conf.get("label_size", font_label_global),
+            conf.get("tick_size", font_tick_global), conf.get("min"), conf.get("max"))
+
+
+def default_series(chart_type, i):
+    p_type = {"折れ線グラフ": "Line", "散布図": "Scatter", "棒グラフ": "Bar"}.get(chart_type, "Line")
+    size = 1.0 if p_type == "Bar" else (8.0 if p_type == "Scatter" else 3.0)
+    return {"type": p_type, "color": DEFAULT_COLORS[i % len(DEFAULT_COLORS)], "size": size, "show_legend": True}
+
+
+def normalize_spec(spec):
+    # 省略された項目を補い、JSONで文字列になった軸番号を整数に戻す
+    spec = dict(DEFAULT_SPEC, **spec)
+    chart_type, y_axes = spec["chart_type"], list(spec["y_axes"])
+    if chart_type not in CHART_TYPES:
+        raise ValueError(f"unknown chart_type: {chart_type}")
+    if spec["reducer"] not in REDUCERS:
+        raise ValueError(f"unknown reducer: {spec['reducer']}")
+    if spec["resample"] not in RESAMPLE_METHODS:
+        raise ValueError(f"unknown resample method: {spec['resample']}")
+    if spec["facet_share"] not in FACET_SHARE:
+        raise ValueError(f"unknown facet_share: {spec['facet_share']}")
+    if spec["facet"] is not None and chart_type not in FACET_TYPES:
+        raise ValueError(f"{chart_type} は分割表示できません")
+    spec["y_axes"] = y_axes
+    spec["y_configs"] = {col: dict(default_series(chart_type, i), **spec["y_configs"].get(col, {}))
+                         for i, col in enumerate(y_axes)}
+    spec["y_axis_mapping"] = {col: int(spec["y_axis_mapping"].get(col, 0)) for col in y_axes}
+    axis_configs = {int(k): v for k, v in spec["axis_configs"].items()}
+    axis_configs.setdefault(0, {"name": y_axes[0] if y_axes else "", "unit": "", "min": None, "max": None,
+                                "label_size": 18, "tick_size": 14})
+    spec["axis_configs"] = axis_configs
+    if spec["title"] is None:
+        if y_axes and chart_type in ["折れ線グラフ", "散布図", "棒グラフ"] and spec["x_axis"]:
+            spec["title"] = f"{', '.join(y_axes)} vs {spec['x_axis']}"
+        else:
+            spec["title"] = f"{chart_type}: {', '.join(y_axes)}" if y_axes else chart_type
+    if spec["x_name"] is None:
+        spec["x_name"] = spec["x_axis"] or ""
+    return spec
+
+
+def load_spec(path):
+    with open(path, encoding="utf-8") as f:
+        return normalize_spec(json.load(f))
@@ -0,0 +1,101 @@
+import numpy as np
+
+# --- ヒストグラム・箱ひげ図・バイオリンプロット用の列の要約 ---
+# 欠損を除いて並べ替えた値を列ごとに1回だけ作り、階級の度数・分位点・ひげ・KDEはそこから求める。
+# 階級数を変えても生データは読み直さず、並べ替え済みの値を二分探索するだけで済む。
+KDE_BINS = 4096
+KDE_POINTS = 100  # ax.violinplot と同じ評価点の数
+EXACT_KDE_ROWS = 10_000  # これ以下で、帯域幅が細かい階級より狭い場合は直接計算する
+MAX_FLIERS = 10_000
+
+
+def gaussian_smooth(counts, sigma_bins):
+    # 度数をガウス核で平滑化する（FFTによる畳み込み。端で折り返さないように0で埋めてから計算）
+    half = max(int(np.ceil(4 * sigma_bins)), 1)
+    kernel = np.exp(-0.5 * (np.arange(-half, half + 1) / sigma_bins) ** 2)
+    kernel /= kernel.sum()
+    n = len(counts) + len(kernel) - 1
+    size = 1 << (n - 1).bit_length()
+    full = np.fft.irfft(np.fft.rfft(counts, size) * np.fft.rfft(kernel, size), size)[:n]
+    return np.maximum(full[half:half + len(counts)], 0.0)
+
+
+def scott_bandwidth(std, count):
+    # KDEの帯域幅（ax.violinplot・scipy の gaussian_kde と同じ Scott の方法）。大容量モードでも同じものを使う
+    return std * count ** (-1 / 5)
+
+
+def histogram_edges(lo, hi, bins):
+    # np.histogram と同じ階級の決め方（全て同じ値なら前後0.5ずつ広げる）
+    if lo == hi:
+        lo, hi = lo - 0.5, hi + 0.5
+    return np.linspace(lo, hi, bins + 1)
+
+
+class ColumnStats:
+    def __init__(self, sorted_values):
+        self.values = sorted_values  # 欠損を除いて昇順に並べたもの（列情報の配列を共有する）
+        self.count = len(sorted_values)
+        self.min = float(sorted_values[0]) if self.count else np.nan
+        self.max = float(sorted_values[-1]) if self.count else np.nan
+        self.mean = float(sorted_values.mean()) if self.count else np.nan
+        self.std = float(sorted_values.std(ddof=1)) if self.count > 1 else 0.0
+        self._box = {}
+        self._violin = None
+
+    def quantile(self, q):
+        # np.percentile（linear）と同じ補間を、並べ替え済みの値から直接求める
+        pos = np.asarray(q, dtype=float) * (self.count - 1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, self.count - 1)
+        return self.values[lo] + (self.values[hi] - self.values[lo]) * (pos - lo)
+
+    def counts(self, edges):
+        # 各階級の度数（最後の階級だけ右端を含める。np.histogram と同じ）
+        idx = np.searchsorted(self.values, edges, side="left")
+        idx[-1] = np.searchsorted(self.values, edges[-1], side="right")
+        return np.diff(idx)
+
+    def box_stats(self, label, whis=1.5):
+        # ax.bxp にそのまま渡せる形式（matplotlib の boxplot と同じ決め方）
+        if whis not in self._box:
+            q1, med, q3 = self.quantile([0.25, 0.5, 0.75])
+            iqr = q3 - q1
+            lo_i = np.searchsorted(self.values, q1 - whis * iqr, side="left")
+            hi_i = np.searchsorted(self.values, q3 + whis * iqr, side="right")
+            # ひげの端は範囲内の実際の値（四分位点より内側にはしない）
+            whislo = min(float(self.values[lo_i]), q1)
+            whishi = max(float(self.values[hi_i - 1]), q3)
+            fliers = np.concatenate([self.values[:lo_i], self.values[hi_i:]])
+            if len(fliers) > MAX_FLIERS:
+                # 外れ値が多すぎる場合は等間隔に間引く（両端は必ず残す）
+                keep = np.unique(np.linspace(0, len(fliers) - 1, MAX_FLIERS).astype(np.int64))
+                fliers = fliers[keep]
+            self._box[whis] = {"med": med, "q1": q1, "q3": q3, "whislo": whislo, "whishi": whishi,
+                               "mean": self.mean, "fliers": fliers}
+        return dict(self._box[whis], label=label)
+
+    def violin_stats(self, points=KDE_POINTS):
+        # ax.violin にそのまま渡せる形式
+        if self._violin is None:
+            coords = np.linspace(self.min, self.max, points)
+            bandwidth = scott_bandwidth(self.std, self.count)
+            width = (self.max - self.min) / KDE_BINS
+            if bandwidth <= 0 or width <= 0:
+                vals = np.where(np.isclose(coords, self.min), 1.0, 0.0)
+            elif bandwidth < 2 * width and self.count <= EXACT_KDE_ROWS:
+                z = (coords[:, None] - self.values[None, :]) / bandwidth
+                vals = np.exp(-0.5 * z ** 2).sum(axis=1) / (self.count * bandwidth * np.sqrt(2 * np.pi))
+            else:
+                # 細かい階級の度数を平滑化して、階級の中心の値から補間する
+                edges = np.linspace(self.min, self.max, KDE_BINS + 1)
+                smooth = gaussian_smooth(self.counts(edges).astype(float), bandwidth / width)
+                vals = np.interp(coords, edges[:-1] + width / 2, smooth / (self.count * width))
+            self._violin = {"coords": coords, "vals": vals, "mean": self.mean,
+                            "median": float(self.quantile(0.5)), "min": self.min, "max": self.max}
+        return self._violin
+
+    def nbytes(self):
+        # 並べ替え済みの値は列情報の配列として数えるので含めない
+        fliers = sum(b["fliers"].nbytes for b in self._box.values())
+        return fliers + (self._violin["vals"].nbytes * 2 if self._violin is not None else 0) + 256
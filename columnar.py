@@ -0,0 +1,120 @@
+import importlib.util
+import io
+import os
+
+import pandas as pd
+
+from data_loader import HAS_PYARROW, compact_frame
+
+# --- CSV以外の入力：Parquet・Feather/Arrow IPC・Excel ---
+# 列の情報はファイルのスキーマ（フッター・ヘッダー）だけを読んで取り出し、
+# データ本体はグラフに使う列だけを読む。source はバイト列かファイルパス（パスならメモリマップで開く）。
+# Arrow の表から DataFrame への変換では、列ごとに別のブロックにして変換済みのバッファから解放する（全体の2重持ちを避ける）。
+HAS_OPENPYXL = importlib.util.find_spec("openpyxl") is not None
+SCHEMA_SAMPLE_ROWS = 100  # Excel は型の情報を持たないので、先頭のこの行数から型を推定する
+
+FILE_KINDS = {
+    ".parquet": "parquet", ".pq": "parquet",
+    ".feather": "arrow", ".arrow": "arrow", ".ipc": "arrow",
+    ".xlsx": "excel", ".xlsm": "excel",
+}
+UPLOAD_TYPES = ["csv", "tsv", "txt"] + [ext[1:] for ext in FILE_KINDS]
+
+
+def file_kind(name):
+    return FILE_KINDS.get(os.path.splitext(name)[1].lower(), "csv")
+
+
+def _require(kind):
+    if kind in ("parquet", "arrow") and not HAS_PYARROW:
+        raise ImportError("Parquet・Arrow形式の読み込みには pyarrow が必要です（pip install pyarrow）")
+    if kind == "excel" and not HAS_OPENPYXL:
+        raise ImportError("Excelの読み込みには openpyxl が必要です（pip install openpyxl）")
+
+
+def _arrow_source(source):
+    import pyarrow as pa
+    if isinstance(source, (str, os.PathLike)):
+        return pa.memory_map(os.fspath(source))
+    # バイト列はコピーせずにそのままArrowのバッファとして読む
+    return pa.BufferReader(source)
+
+
+def _open_ipc(source):
+    import pyarrow as pa
+    try:
+        return pa.ipc.open_file(_arrow_source(source))
+    except pa.ArrowInvalid:
+        # ファイル形式ではなくストリーム形式で書かれたもの
+        return pa.ipc.open_stream(_arrow_source(source))
+
+
+def _excel_source(source):
+    return source if isinstance(source, (str, os.PathLike)) else io.BytesIO(source)
+
+
+def read_schema(source, kind, sheet_name=None):
+    # データ本体を読まずに列名・型・行数（わかる場合）とシート名を返す
+    _require(kind)
+    if kind == "parquet":
+        import pyarrow.parquet as pq
+        meta = pq.ParquetFile(_arrow_source(source)).metadata
+        schema = meta.schema.to_arrow_schema()
+        dtypes = schema.empty_table().to_pandas().dtypes
+        return {"columns": list(schema.names), "dtypes": dict(dtypes), "rows": meta.num_rows, "sheets": None}
+    if kind == "arrow":
+        schema = _open_ipc(source).schema
+        dtypes = schema.empty_table().to_pandas().dtypes
+        return {"columns": list(schema.names), "dtypes": dict(dtypes), "rows": None, "sheets": None}
+    with pd.ExcelFile(_excel_source(source)) as book:
+        sheets = book.sheet_names
+        head = book.parse(sheet_name if sheet_name is not None else sheets[0], nrows=SCHEMA_SAMPLE_ROWS)
+    head.columns = [str(c) for c in head.columns]
+    return {"columns": list(head.columns), "dtypes": dict(head.dtypes), "rows": None, "sheets": sheets}
+
+
+class SchemaColumns:
+    # スキーマだけから作る列の一覧（ColumnProfile と同じ問い合わせ方）。グラフに使う列を選んでから、その列だけを読み込むために使う
+    def __init__(self, schema):
+        self.columns = list(schema["columns"])
+        self.numeric = {c: pd.api.types.is_numeric_dtype(schema["dtypes"][c]) for c in self.columns}
+
+    def numeric_cols(self, exclude=None):
+        return [c for c in self.columns if self.numeric[c] and c != exclude]
+
+    def other_cols(self, exclude=None):
+        return [c for c in self.columns if not self.numeric[c] and c != exclude]
+
+
+def _finish(df, kind, compact, **source_format):
+    df.columns = [str(c) for c in df.columns]
+    df.attrs["source_format"] = dict(source_format, format=kind)
+    return compact_frame(df) if compact else df
+
+
+def parse_parquet(source, columns=None, compact=False):
+    _require("parquet")
+    import pyarrow.parquet as pq
+    # 選ばれた列のページだけを読む
+    table = pq.read_table(_arrow_source(source), columns=columns)
+    return _finish(table.to_pandas(split_blocks=True, self_destruct=True), "parquet", compact)
+
+
+def parse_arrow(source, columns=None, compact=False):
+    _require("arrow")
+    # 無圧縮のIPCはバッファ（メモリマップ・アップロードのバイト列）を参照するだけなので、全体を開いてから列を選んでも読むのは選んだ列だけ
+    # （1つのバッチで書かれたファイルの欠損のない数値列などは、変換後もそのバッファを参照する読み取り専用の配列になる）
+    table = _open_ipc(source).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    return _finish(table.to_pandas(split_blocks=True, self_destruct=True), "arrow", compact)
+
+
+def parse_excel(source, columns=None, sheet_name=0, compact=False):
+    _require("excel")
+    df = pd.read_excel(_excel_source(source), sheet_name=sheet_name,
+                       usecols=(lambda c: str(c) in columns) if columns is not None else None)
+    return _finish(df, "excel", compact, sheet=sheet_name)
+
+
+PARSERS = {"parquet": parse_parquet, "arrow": parse_arrow, "excel": parse_excel}
@@ -0,0 +1,252 @@
+import codecs
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import re
+
+import pandas as pd
+
+import telemetry
+from memory_cache import BudgetedLRU
+
+
+# --- アップロードされたファイルの内容ハッシュ ---
+def content_digest(data):
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def cache_key(digest, options=None):
+    # ファイルの中身と読み込みオプションの両方をキーにする
+    if not options:
+        return digest
+    return f"{digest}:{json.dumps(options, sort_keys=True, default=str)}"
+
+
+def frame_nbytes(obj):
+    # 文字列列も含めた実メモリ量（キャッシュの予算管理に使う）
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    return int(obj.nbytes())
+
+
+def dataset_key(digest, options, parse):
+    return cache_key(digest, dict(options, parser=parse.__name__))
+
+
+# --- パース結果のキャッシュ（LRU + メモリ予算） ---
+class ParseCache(BudgetedLRU):
+    def sizeof(self, value):
+        return frame_nbytes(value)
+
+    def get_or_parse(self, data, options, parse, digest=None):
+        key = dataset_key(digest or content_digest(data), options, parse)
+        df = self.get(key)
+        if df is None:
+            df = self.put(key, parse(data, **options))
+        return df
+
+
+def load_path(path, cache, parse=None):
+    # サーバー側のファイルは中身のハッシュの代わりにパスと更新時刻をキーにする（ヒット時はファイルを読まない）
+    from columnar import PARSERS, file_kind  # columnar は data_loader を使うので、ここで読み込む
+    kind = file_kind(path)
+    parse = parse or PARSERS.get(kind, parse_csv)
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}:{parse.__name__}"
+    df = cache.get(key)
+    if df is None:
+        if kind in PARSERS:
+            # Parquet・Arrow・Excelはパスのまま渡す（Arrow系はメモリマップで開く）
+            df = cache.put(key, parse(path))
+        else:
+            with open(path, "rb") as f:
+                df = cache.put(key, parse(f.read()))
+    return df
+
+
+# --- 文字コード・区切り文字の判定（先頭だけを1回読む） ---
+SNIFF_BYTES = 64 * 1024
+DELIMITERS = [";", "\t", "|", ","]  # 同数の場合は先頭を優先（"1,5;2,5" 形式のため）
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+_NUMBER_RE = re.compile(r"^[+-]?(\d+([.,]\d*)?|[.,]\d+)([eE][+-]?\d+)?$")
+_INT_RE = re.compile(r"^[+-]?\d+$")
+_DECIMAL_COMMA_RE = re.compile(r"(^|;)\s*-?\d+,\d+\s*(;|$)", re.MULTILINE)
+
+
+def detect_encoding(head):
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith(codecs.BOM_UTF16_LE) or head.startswith(codecs.BOM_UTF16_BE):
+        return "utf-16"
+    # BOMなしUTF-16：ASCII部分の上位バイトがNULになる
+    if head.count(b"\x00") > len(head) // 4:
+        return "utf-16-le" if head[1::2].count(b"\x00") > head[0::2].count(b"\x00") else "utf-16-be"
+    try:
+        # 末尾で文字が途切れていてもエラーにしない（final=False）
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    try:
+        codecs.getincrementaldecoder("cp932")().decode(head, final=False)
+        return "cp932"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+def detect_delimiter(lines):
+    # 各行で出現数が揃っている候補のうち、最も多いものを選ぶ
+    best, best_count = ",", 0
+    for delim in DELIMITERS:
+        counts = [line.count(delim) for line in lines]
+        if not counts or min(counts) == 0:
+            continue
+        if max(counts) == min(counts) and counts[0] > best_count:
+            best, best_count = delim, counts[0]
+    if best_count == 0:
+        # 揃っていない場合はヘッダー行の出現数で判断
+        first = lines[0] if lines else ""
+        best = max(DELIMITERS, key=first.count) if any(d in first for d in DELIMITERS) else ","
+    return best
+
+
+def is_valid_utf8(data, block_size=1024 ** 2):
+    # 全体を一度に文字列化せず、ブロックごとに検証する
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    view = memoryview(data)
+    try:
+        for start in range(0, len(view), block_size):
+            decoder.decode(view[start:start + block_size], final=False)
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def _cell_type(field):
+    if _INT_RE.match(field):
+        return "int"
+    return "float" if _NUMBER_RE.match(field) else "text"
+
+
+def _headerless(lines, sep):
+    # 1行目がすべて数値で、続く行の各列の型（整数・小数・文字）とも揃っている場合だけヘッダーなしとみなす
+    # （年などの数値だけの見出しの下に小数が並ぶ場合は、今まで通りヘッダーとして読む）
+    rows = [[f.strip().strip('"') for f in line.split(sep)] for line in lines]
+    if len(rows) < 2 or not all(_NUMBER_RE.match(f) for f in rows[0]):
+        return False
+    for i, first in enumerate(rows[0]):
+        types = {_cell_type(row[i]) for row in rows[1:] if i < len(row) and row[i]}
+        if types and _cell_type(first) not in types:
+            return False
+    return True
+
+
+def sniff_csv(data, sample_size=SNIFF_BYTES):
+    head = bytes(data[:sample_size])
+    encoding = detect_encoding(head)
+    # 先頭がASCIIのみだとUTF-8とCP932の区別がつかないので、残りも検証する
+    if encoding == "utf-8" and head.isascii() and len(data) > sample_size and not is_valid_utf8(data):
+        encoding = "cp932"
+    text = codecs.getincrementaldecoder(encoding)(errors="replace").decode(head, final=False)
+    lines = text.splitlines()
+    if len(data) > sample_size and len(lines) > 1:
+        lines = lines[:-1]  # 途中で切れた最終行は使わない
+    lines = [line for line in lines if line.strip()][:50]
+
+    sep = detect_delimiter(lines)
+    header = None if _headerless(lines, sep) else 0
+    decimal = "," if sep == ";" and _DECIMAL_COMMA_RE.search("\n".join(lines[1:])) else "."
+    return {"encoding": encoding, "sep": sep, "header": header, "decimal": decimal}
+
+
+# --- CSVの読み込み（判定結果で1回だけパースする） ---
+def _read_csv(data, kwargs):
+    if HAS_PYARROW and kwargs.get("decimal", ".") == ".":
+        try:
+            return pd.read_csv(io.BytesIO(data), engine="pyarrow", **kwargs)
+        except Exception:
+            # pyarrowで読めない書式はCエンジンに任せる
+            pass
+    return pd.read_csv(io.BytesIO(data), **kwargs)
+
+
+def parse_csv(data, **options):
+    with telemetry.stage("sniff"):
+        sniffed = sniff_csv(data)
+    sniffed.update(options)
+    kwargs = dict(sniffed)
+    if kwargs["decimal"] == ".":
+        del kwargs["decimal"]
+    with telemetry.stage("read_csv", encoding=sniffed["encoding"]):
+        df = _read_csv(data, kwargs)
+    if sniffed["header"] is None:
+        df.columns = [f"列{i + 1}" for i in range(df.shape[1])]
+    with telemetry.stage("parse_datetimes"):
+        df = parse_datetimes(df)
+    df.attrs["source_format"] = sniffed
+    return df
+
+
+# --- 日付・時刻の列を読み込み時に1回だけ日時型に変換する ---
+DATETIME_SAMPLE = 100
+DATETIME_MIN_RATIO = 0.95  # 変換できた値がこの割合以上なら日時の列とみなす
+_DATETIME_RE = re.compile(r"^\d{4}[-/.]\d{1,2}[-/.]\d{1,2}([ T]\d{1,2}:\d{2}(:\d{2}(\.\d+)?)?)?\s*(Z|[+-]\d{2}:?\d{2})?$")
+
+
+def parse_datetimes(df):
+    # 先頭の値が全て日付の形をしている文字列列だけを変換する（形式は先頭の値から推定して全行に使う）
+    for i in range(df.shape[1]):
+        s = df.iloc[:, i]
+        if not (pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s)):
+            continue
+        sample = s.dropna().head(DATETIME_SAMPLE).astype(str).str.strip()
+        if sample.empty or not sample.str.match(_DATETIME_RE).all():
+            continue
+        try:
+            parsed = pd.to_datetime(s, errors="coerce")
+        except (ValueError, TypeError):
+            continue  # タイムゾーンが混在しているなど、1つの日時型にできないもの
+        if parsed.notna().sum() >= s.notna().sum() * DATETIME_MIN_RATIO:
+            df.isetitem(i, parsed)
+    return df
+
+
+# --- 読み込んだデータを省メモリな型に変換する ---
+CATEGORY_RATIO = 0.5  # 種類数が行数のこの割合未満の文字列列はカテゴリ型にする
+
+
+def _compact_column(s):
+    if pd.api.types.is_bool_dtype(s):
+        return s
+    if pd.api.types.is_integer_dtype(s):
+        return pd.to_numeric(s, downcast="integer")
+    if pd.api.types.is_float_dtype(s):
+        # float32 に変換して値が変わらない場合だけ縮める
+        small = s.astype("float32")
+        if ((small.astype("float64") == s) | s.isna()).all():
+            return small
+        return s
+    if pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s):
+        if len(s) and s.nunique() < len(s) * CATEGORY_RATIO:
+            return s.astype("category")
+        if HAS_PYARROW:
+            return s.astype(pd.StringDtype("pyarrow"))
+    return s
+
+
+def compact_frame(df):
+    before = frame_nbytes(df)
+    compact = df.copy(deep=False)
+    # 列名が重複していても扱えるように位置で置き換える
+    for i in range(df.shape[1]):
+        compact.isetitem(i, _compact_column(df.iloc[:, i]))
+    compact.attrs = dict(df.attrs, memory={"before": before, "after": frame_nbytes(compact)})
+    return compact
+
+
+def parse_csv_compact(data, **options):
+    return compact_frame(parse_csv(data, **options))
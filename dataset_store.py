@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import Counter, OrderedDict
+
+import pandas as pd
+
+from data_loader import HAS_PYARROW, ParseCache
+
+# --- 全セッション共通のデータ置き場 ---
+# 同じ内容のファイルは1つだけメモリに置き、どのセッションが使っているかを数えておく。
+# メモリ予算を超えたら、使われていないものから順にディスクへ退避し（Arrow IPC、書けないものはpickle）、
+# 再び必要になったらメモリマップで読み戻す（Arrow IPC の数値・文字列の列はコピーせず、ファイルの中身をそのまま参照する）。
+ATTRS_META_KEY = b"graphypad_attrs"
+
+
+def _spill_path(spill_dir, key):
+    return os.path.join(spill_dir, hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest())
+
+
+def write_spill(path, value):
+    # DataFrame は Arrow IPC（無圧縮・1つのバッチなので、メモリマップした中身を列の配列としてそのまま使える）、それ以外は pickle
+    # 読み戻した表がファイルを参照し続けるので、同じパスを上書きせず、別のファイルに書いてから置き換える
+    if HAS_PYARROW and isinstance(value, pd.DataFrame) and isinstance(value.index, pd.RangeIndex) \
+            and value.index.start == 0 and value.index.step == 1:
+        import pyarrow as pa
+        from pyarrow import feather
+        try:
+            table = pa.Table.from_pandas(value, preserve_index=False)
+        except (pa.ArrowException, TypeError, ValueError):
+            table = None
+        if table is not None:
+            meta = dict(table.schema.metadata or {})
+            meta[ATTRS_META_KEY] = json.dumps(value.attrs, default=str).encode("utf-8")
+            feather.write_feather(table.replace_schema_metadata(meta), path + ".arrow.tmp", compression="uncompressed",
+                                  chunksize=max(table.num_rows, 1))
+            os.replace(path + ".arrow.tmp", path + ".arrow")
+            return path + ".arrow"
+    pd.to_pickle(value, path + ".pkl")
+    return path + ".pkl"
+
+
+def read_spill(path):
+    if path.endswith(".arrow"):
+        from pyarrow import feather
+        table = feather.read_table(path, memory_map=True)
+        attrs = json.loads((table.schema.metadata or {}).get(ATTRS_META_KEY, b"{}"))
+        # 列ごとに別のブロックにすると、欠損のない数値列などはメモリマップの上の読み取り専用の配列になる（コピーしない）
+        df = table.to_pandas(split_blocks=True, self_destruct=True)
+        df.attrs = attrs
+        return df
+    return pd.read_pickle(path)
+
+
+class DatasetRef:
+    # セッションが持つ利用中の印。session_state から消える（セッション終了・別ファイルに切り替え）と自動で解放される
+    def __init__(self, store, key):
+        self.key = key
+        store._acquire(key)
+        weakref.finalize(self, store._release, key)
+
+
+class DatasetStore(ParseCache):
+    def __init__(self, max_entries=8, max_bytes=1024 ** 3, spill_dir=None, max_spill_bytes=8 * 1024 ** 3):
+        super().__init__(max_entries=max_entries, max_bytes=max_bytes)
+        base = spill_dir or os.path.join(tempfile.gettempdir(), "graphypad")
+        os.makedirs(base, exist_ok=True)
+        self.spill_dir = tempfile.mkdtemp(prefix="spill-", dir=base)
+        weakref.finalize(self, shutil.rmtree, self.spill_dir, True)
+        self.max_spill_bytes = max_spill_bytes
+        self.spills = 0
+        self.reloads = 0
+        self._on_disk = OrderedDict()  # key -> (path, ファイルの大きさ)。メモリに戻しても消さず、次の退避で書き直さない
+        self._disk_bytes = 0
+        self._refs = Counter()
+        self._victims = []
+        self._spill_lock = threading.Lock()
+
+    def ref(self, key):
+        return DatasetRef(self, key)
+
+    def _acquire(self, key):
+        with self._lock:
+            self._refs[key] += 1
+
+    def _release(self, key):
+        with self._lock:
+            self._refs[key] -= 1
+            if self._refs[key] <= 0:
+                del self._refs[key]
+
+    def get(self, key):
+        value = super().get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            entry = self._on_disk.get(key)
+        if entry is None:
+            return None
+        try:
+            value = read_spill(entry[0])
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self.misses -= 1  # 退避分の読み戻しは取りこぼしではない
+            self.reloads += 1
+        return self.put(key, value)
+
+    def put(self, key, value):
+        value = super().put(key, value)
+        self._spill_victims()
+        return value
+
+    def _evict(self):
+        # 使用中のセッションがないものを優先して追い出す（書き込みはロックの外で行う）
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            key = next((k for k in self._entries if not self._refs[k]), None) or next(iter(self._entries))
+            value, nbytes = self._entries.pop(key)
+            self._total_bytes -= nbytes
+            self._victims.append((key, value))
+
+    def _spill_victims(self):
+        with self._lock:
+            victims, self._victims = self._victims, []
+        with self._spill_lock:
+            for key, value in victims:
+                with self._lock:
+                    if key in self._on_disk:
+                        self._on_disk.move_to_end(key)
+                        continue
+                try:
+                    path = write_spill(_spill_path(self.spill_dir, key), value)
+                except (OSError, TypeError, ValueError, pickle.PicklingError):
+                    continue  # ディスクに書けなければ、ただ捨てる（次回はパースし直す）
+                with self._lock:
+                    size = os.path.getsize(path)
+                    self._on_disk[key] = (path, size)
+                    self._disk_bytes += size
+                    self.spills += 1
+                    self._trim_disk()
+
+    def _trim_disk(self):
+        # ディスク側の予算を超えたら、古く退避したものから消す
+        while self._on_disk and self._disk_bytes > self.max_spill_bytes:
+            _, (path, size) = self._on_disk.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        super().clear()
+        with self._lock:
+            for path, _ in self._on_disk.values():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._on_disk.clear()
+            self._disk_bytes = 0
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            spilled = [size for key, (_, size) in self._on_disk.items() if key not in self._entries]
+            stats.update({
+                "spilled_entries": len(spilled),
+                "spilled_bytes": sum(spilled),
+                "disk_bytes": self._disk_bytes,
+                "spills": self.spills,
+                "reloads": self.reloads,
+                "sessions": sum(self._refs.values()),
+                "shared": sum(1 for n in self._refs.values() if n > 1),
+            })
+        return stats
@@ -0,0 +1,112 @@
+import numpy as np
+
+
+# --- 画面解像度に合わせた間引き（描画する点の数をピクセル数程度に抑える） ---
+DOWNSAMPLE_THRESHOLD = 10_000
+RENDER_DPI = 150
+DENSITY_THRESHOLD = 200_000
+DENSITY_CELL_PX = 3  # 密度表示の1セルあたりのピクセル数
+
+
+def _finite_index(x, y):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    idx = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    return x[idx], y[idx], idx
+
+
+def bucket_extremes(bucket, y):
+    # 連続して並ぶバケットごとに、最小値と最大値の点（同じ値なら最初の1点）の位置を返す（y は欠損なし）
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    counts = np.diff(np.r_[starts, bucket.size])
+    keep = []
+    for reduce in (np.minimum, np.maximum):
+        hit = np.flatnonzero(y == np.repeat(reduce.reduceat(y, starts), counts))
+        keep.append(hit[np.r_[True, bucket[hit][1:] != bucket[hit][:-1]]])
+    return np.concatenate(keep)
+
+
+def minmax_indices(x, y, n_buckets):
+    # 折れ線用：横方向のピクセルごとに最小値と最大値の点だけを残す（山や谷は消えない）
+    xf, yf, idx = _finite_index(x, y)
+    if idx.size <= 2 * n_buckets + 2:
+        return idx
+    if np.all(xf[1:] >= xf[:-1]):
+        # X が単調増加なら値で区切る（点の密度に偏りがあってもピクセルに合う）
+        span = xf[-1] - xf[0]
+        pos = (xf - xf[0]) / span if span > 0 else np.zeros(xf.size)
+    else:
+        # それ以外は行の順番で区切る
+        pos = np.arange(xf.size) / (xf.size - 1)
+    # どちらの区切り方でも同じバケットの点は連続して並ぶ
+    bucket = np.minimum((pos * n_buckets).astype(np.int64), n_buckets - 1)
+    keep = np.concatenate([[0, xf.size - 1], bucket_extremes(bucket, yf)])
+    return idx[np.unique(keep)]
+
+
+def _pixel_cells(xf, yf, width_px, height_px):
+    # 値の範囲を格子に分割し、各点が入るセルの番号を返す
+    cells, extent = [], []
+    for values, n in ((xf, width_px), (yf, height_px)):
+        lo, hi = float(values.min()), float(values.max())
+        scaled = (values - lo) / (hi - lo) if hi > lo else np.zeros(values.size)
+        cells.append(np.minimum((scaled * n).astype(np.int64), n - 1))
+        extent += [lo, hi if hi > lo else lo + 1.0]
+    return cells[0], cells[1], extent
+
+
+def pixel_indices(x, y, width_px, height_px):
+    # 散布図用：同じピクセルに重なる点は1つだけ残す（見た目は変わらない）
+    xf, yf, idx = _finite_index(x, y)
+    if not idx.size:
+        return idx
+    cx, cy, _ = _pixel_cells(xf, yf, width_px, height_px)
+    _, first = np.unique(cy * width_px + cx, return_index=True)
+    return idx[np.sort(first)]
+
+
+def density_grid(x, y, width_px, height_px):
+    # 散布図の密度表示用：点を格子ごとに数える（描画の手間は点の数ではなくセルの数で決まる）
+    xf, yf, _ = _finite_index(x, y)
+    if not xf.size:
+        return np.zeros((height_px, width_px), dtype=np.int64), [0.0, 1.0, 0.0, 1.0]
+    cx, cy, extent = _pixel_cells(xf, yf, width_px, height_px)
+    counts = np.bincount(cy * width_px + cx, minlength=width_px * height_px)
+    return counts.reshape(height_px, width_px), extent
+
+
+# --- 日時のX軸：画面の幅に合わせた間隔ごとにまとめる（平均・最小・最大・合計） ---
+_SECOND = 1 / 86_400
+TIME_STEPS = [s * _SECOND for s in (1, 2, 5, 10, 15, 30)] + [m * 60 * _SECOND for m in (1, 2, 5, 10, 15, 30)] \
+    + [h / 24 for h in (1, 2, 3, 6, 12)] + [1, 2, 7, 14, 30, 91, 182, 365]  # 日数
+
+
+def time_step(span_days, n_buckets):
+    # 1ピクセルあたりの時間以上で、最も短い切りのよい間隔
+    target = span_days / max(n_buckets, 1)
+    return next((step for step in TIME_STEPS if step >= target), TIME_STEPS[-1] * np.ceil(target / TIME_STEPS[-1]))
+
+
+def resample_time(x, y, step, method):
+    # x は日数（float）。間隔の始まりの時刻と、間隔ごとにまとめた値を返す（値のない間隔は作らない）
+    ok = np.isfinite(x)
+    x, y = x[ok], np.asarray(y, dtype=float)[ok]
+    if not x.size:
+        return x, y
+    start = np.floor(x.min() / step) * step
+    bucket = np.floor((x - start) / step).astype(np.int64)
+    # 間隔の数は画面の幅程度なので、番号をそのまま添字にして選んだまとめ方だけを求める（並べ替えない）
+    n = int(bucket.max()) + 1
+    ok = ~np.isnan(y)
+    count = np.bincount(bucket, weights=ok, minlength=n)
+    if method in ["mean", "sum"]:
+        values = np.bincount(bucket, weights=np.where(ok, y, 0.0), minlength=n)
+        if method == "mean":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                values = values / count
+    else:
+        values = np.full(n, np.inf if method == "min" else -np.inf)
+        (np.minimum if method == "min" else np.maximum).at(values, bucket[ok], y[ok])
+        values[count == 0] = np.nan
+    used = np.flatnonzero(np.bincount(bucket, minlength=n))
+    return start + used * step, values[used]
@@ -0,0 +1,80 @@
+import io
+import re
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from chart_spec import EXPORT_FORMATS
+from memory_cache import BudgetedLRU
+
+# --- 画像の書き出し（ダウンロードを押したときだけ、別スレッドで描画する） ---
+MIME_TYPES = {"png": "image/png", "svg": "image/svg+xml", "pdf": "application/pdf"}
+
+
+def export_key(render_key, file_format, dpi):
+    # SVG・PDFはベクター形式なのでDPIに関係なく同じ結果になる
+    return f"{render_key}:{file_format}:{dpi if file_format == 'png' else ''}"
+
+
+def export_filename(title, render_key, file_format):
+    stem = re.sub(r'[\\/:*?"<>|\s]+', "_", title or "graph").strip("_") or "graph"
+    return f"{stem}_{render_key[:8]}.{file_format}"
+
+
+class ExportCache(BudgetedLRU):
+    def sizeof(self, value):
+        return len(value)
+
+
+class Exporter:
+    def __init__(self, workers=1, max_entries=32, max_bytes=256 * 1024 ** 2):
+        self.cache = ExportCache(max_entries=max_entries, max_bytes=max_bytes)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+        self._pending = {}  # key -> Future（同じ書き出しを二重に投入しない）
+        self._failed = {}  # key -> 例外（書き出し直すまで残し、画面に出し続ける）
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def pending(self, key):
+        with self._lock:
+            return self._pending.get(key)
+
+    def failure(self, key):
+        with self._lock:
+            return self._failed.get(key)
+
+    def submit(self, key, df, spec, file_format, dpi, stream=None, profile=None):
+        if file_format not in EXPORT_FORMATS:
+            raise ValueError(f"unsupported format: {file_format}")
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                self._failed.pop(key, None)
+                future = self._pending[key] = self._pool.submit(
+                    self._run, key, df, spec, file_format, dpi, stream, profile)
+        return future
+
+    def _run(self, key, df, spec, file_format, dpi, stream, profile):
+        from chart_builder import render_figure
+        try:
+            data, _, _ = render_figure(df, spec, file_format=file_format, dpi=dpi, stream=stream, profile=profile)
+            return self.cache.put(key, data)
+        except Exception as e:
+            with self._lock:
+                self._failed[key] = e
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+
+def zip_exports(files):
+    # files は {ファイル名: bytes}。PNG・PDFは圧縮済みなので、そのまま格納する
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, data in files.items():
+            compress = zipfile.ZIP_DEFLATED if name.endswith(".svg") else zipfile.ZIP_STORED
+            zf.writestr(name, data, compress_type=compress)
+    return buf.getvalue()
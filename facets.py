@@ -0,0 +1,335 @@
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import japanize_matplotlib  # noqa: F401（日本語フォントの登録）
+import numpy as np
+import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+from matplotlib.ticker import MultipleLocator
+
+import telemetry
+from aggregation import reduce_all, top_groups
+from chart_spec import FACET_SHARE, MAX_FACETS, REDUCERS, axis_style, fmt
+from column_stats import ColumnStats, histogram_edges
+from downsample import DOWNSAMPLE_THRESHOLD, RENDER_DPI, minmax_indices, pixel_indices
+from profiling import timestamp_days
+
+# --- 分割表示（列の値ごとのパネルを格子状に並べた1枚の図） ---
+# パネルの行は、X軸の集計と同じグループ分け（列情報に作り置きした group_index）から取り出す。
+# 行の取り出し・間引き・集計・分布の要約はパネルごとにスレッドで並列に行う（numpy の処理中はGILを手放すので複数のコアを使う）。
+# matplotlib の図は1つのスレッドからしか触れないので、描画は最後にまとめて行う（描くのは間引いた後の点だけ）。
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="facet")
+        return _pool
+
+
+def facet_panels(profile, col, max_facets=MAX_FACETS):
+    # (パネルの見出し, 各パネルの行番号（昇順）, 並べきれなかったグループの数)
+    index = profile.group_index(col)
+    sorted_codes = index.codes[index.order]
+    starts = np.searchsorted(sorted_codes, np.arange(index.n_groups + 1))
+    sizes = np.diff(starts)
+    keep = top_groups(sizes.astype(float), max_facets) if index.n_groups > max_facets else np.arange(index.n_groups)
+    rows = []
+    for g in keep:
+        pos = index.order[starts[g]:starts[g + 1]]
+        rows.append(pos if index.rows is None else index.rows[pos])
+    return [index.labels[g] for g in keep], rows, index.n_groups - len(keep)
+
+
+# --- パネルごとの処理（スレッドで並列に実行。列情報の配列は読むだけ） ---
+def _series_panel(ctx, rows):
+    x = ctx["x"]
+    if ctx["window"] is not None:
+        lo, hi = ctx["window"]
+        x_rows = x[rows]
+        rows = rows[(x_rows >= lo) & (x_rows <= hi)]
+    out = {"rows": len(rows), "series": {}, "bar_width": 0.8}
+    if ctx["codes"] is not None:
+        # カテゴリカルなX軸：パネル内でX軸の値ごとに集計する（並びは全パネル共通）
+        codes = ctx["codes"][rows]
+        ok = codes >= 0
+        positions = np.arange(ctx["n_labels"], dtype=float)
+        for col, values in ctx["ys"].items():
+            out["series"][col] = (positions, reduce_all(codes[ok], values[rows][ok], ctx["n_labels"])[ctx["reducer"]])
+        return out
+    x_rows = x[rows]
+    width_px, height_px = ctx["panel_px"]
+    for col, values in ctx["ys"].items():
+        y_rows = values[rows]
+        p_type = ctx["types"][col]
+        if ctx["downsample"] and p_type in ["Line", "Scatter"] and len(rows) > DOWNSAMPLE_THRESHOLD:
+            keep = minmax_indices(x_rows, y_rows, width_px) if p_type == "Line" else pixel_indices(x_rows, y_rows, width_px, height_px)
+            out["series"][col] = (x_rows[keep], y_rows[keep])
+        else:
+            out["series"][col] = (x_rows, y_rows)
+    if "Bar" in ctx["types"].values():
+        # 数値軸の棒の幅は、パネル内のデータの最小間隔に合わせる
+        diffs = np.diff(np.unique(x_rows[np.isfinite(x_rows)]))
+        out["bar_width"] = float(diffs.min()) * 0.8 if diffs.size else 0.8
+    return out
+
+
+def _dist_panel(ctx, rows):
+    stats = {}
+    for col, values in ctx["ys"].items():
+        v = values[rows]
+        v = np.sort(v[~np.isnan(v)])
+        if v.size:
+            stats[col] = ColumnStats(v)
+    out = {"rows": len(rows), "cols": list(stats)}
+    chart_type = ctx["chart_type"]
+    if chart_type == "ヒストグラム":
+        edges = ctx["edges"]
+        if edges is None and stats:
+            edges = histogram_edges(min(s.min for s in stats.values()), max(s.max for s in stats.values()), ctx["bins"])
+        out["edges"], out["counts"] = edges, [s.counts(edges) for s in stats.values()]
+    elif chart_type == "箱ひげ図":
+        out["box"] = [s.box_stats(col) for col, s in stats.items()]
+    else:
+        out["violin"] = [s.violin_stats() for s in stats.values()]
+    return out
+
+
+# --- 描画 ---
+def _draw_series(ax, res, spec, ctx):
+    y_configs = spec["y_configs"]
+    bar_cols = [c for c in spec["y_axes"] if y_configs[c]["type"] == "Bar"]
+    offset_x = ctx["x_offset"]
+    for col, (xs, ys) in res["series"].items():
+        conf = y_configs[col]
+        label = col if conf["show_legend"] else "_nolegend_"
+        if conf["type"] == "Line":
+            ax.plot(xs + offset_x, ys, marker='o', color=conf["color"], linewidth=conf["size"], markersize=conf["size"] * 2, label=label)
+        elif conf["type"] == "Scatter":
+            ax.scatter(xs + offset_x, ys, s=conf["size"] * 10, color=conf["color"], label=label, alpha=0.7)
+        else:
+            width = res["bar_width"] / len(bar_cols)
+            offset = (bar_cols.index(col) - len(bar_cols) / 2 + 0.5) * width
+            ax.bar(xs + offset_x + offset, ys, width * conf["size"], color=conf["color"], label=label)
+    if ctx["codes"] is not None:
+        ax.set_xticks(np.arange(ctx["n_labels"]))
+        ax.set_xticklabels(ctx["labels"])
+    elif ctx["datetime"]:
+        locator = mdates.AutoDateLocator()
+        ax.xaxis.set_major_locator(locator)
+        ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+
+
+def _draw_dist(ax, res, spec):
+    chart_type = spec["chart_type"]
+    if not res["cols"]:
+        return
+    if chart_type == "ヒストグラム":
+        edges = res["edges"]
+        ax.hist([edges[:-1]] * len(res["cols"]), bins=edges, weights=res["counts"], label=res["cols"], alpha=0.7)
+    elif chart_type == "箱ひげ図":
+        ax.bxp(res["box"])
+    else:
+        ax.violin(res["violin"], showmeans=True)
+        ax.set_xticks(range(1, len(res["cols"]) + 1))
+        ax.set_xticklabels(res["cols"])
+
+
+def _panel_code(spec, ctx):
+    # 生成コードの (ループの前に置く行, パネルごとの行)。パネルの処理（_series_panel・_dist_panel）と同じ手順にする
+    chart_type, x_axis, y_axes = spec["chart_type"], spec["x_axis"], spec["y_axes"]
+    if chart_type == "ヒストグラム":
+        if ctx["edges"] is None:
+            return [], [f"ax.hist([g[c].dropna() for c in {y_axes}], bins={spec['hist_bins']}, label={y_axes}, alpha=0.7)"]
+        # 横軸が共通なら、全パネルで同じ階級を使う
+        return ([f"values = df[{y_axes}].to_numpy(dtype=float)",
+                 f"bins = np.linspace(np.nanmin(values), np.nanmax(values), {spec['hist_bins'] + 1})"],
+                [f"ax.hist([g[c].dropna() for c in {y_axes}], bins=bins, label={y_axes}, alpha=0.7)"])
+    if chart_type == "箱ひげ図":
+        return [], [f"ax.boxplot([g[c].dropna() for c in {y_axes}])",
+                    f"ax.set_xticks(range(1, {len(y_axes) + 1}), labels={y_axes})"]
+    if chart_type == "バイオリンプロット":
+        return [], [f"ax.violinplot([g[c].dropna() for c in {y_axes}], showmeans=True)",
+                    f"ax.set_xticks(range(1, {len(y_axes) + 1}), labels={y_axes})"]
+
+    setup, lines = [], []
+    bar_cols = [c for c in y_axes if spec["y_configs"][c]["type"] == "Bar"]
+    if ctx["codes"] is not None:
+        # X軸の値ごとに集計し、全パネルで同じ並び（データ全体での登場順）にそろえる
+        setup.append(f"labels = df['{x_axis}'].dropna().unique()")
+        lines += [f"p = g.groupby('{x_axis}', sort=False)[{y_axes}].{spec['reducer']}().reindex(labels)",
+                  "x = np.arange(len(labels))"]
+        if bar_cols:
+            lines.append(f"width = {0.8 / len(bar_cols)}")
+    else:
+        if ctx["datetime"]:
+            setup += ["import matplotlib.dates as mdates", f"df['{x_axis}'] = pd.to_datetime(df['{x_axis}'])"]
+        lines.append("p = g")
+        if spec["time_window"]:
+            w_lo, w_hi = spec["time_window"]
+            lines.append(f"p = p[(p['{x_axis}'] >= '{w_lo}') & (p['{x_axis}'] <= '{w_hi}')]")
+        lines.append(f"x = mdates.date2num(p['{x_axis}'])" if ctx["datetime"] else f"x = p['{x_axis}'].to_numpy(dtype=float)")
+        if bar_cols:
+            # 棒の幅はパネル内のデータの最小間隔に合わせる
+            lines += ["diffs = np.diff(np.unique(x[np.isfinite(x)]))",
+                      f"width = (diffs.min() * 0.8 if diffs.size else 0.8) / {len(bar_cols)}"]
+    for col in y_axes:
+        conf = spec["y_configs"][col]
+        label = col if conf["show_legend"] else "_nolegend_"
+        if conf["type"] == "Line":
+            lines.append(f"ax.plot(x, p['{col}'], marker='o', color='{conf['color']}', linewidth={conf['size']}, markersize={conf['size'] * 2}, label='{label}')")
+        elif conf["type"] == "Scatter":
+            lines.append(f"ax.scatter(x, p['{col}'], s={conf['size'] * 10}, color='{conf['color']}', alpha=0.7, label='{label}')")
+        else:
+            offset = bar_cols.index(col) - len(bar_cols) / 2 + 0.5
+            lines.append(f"ax.bar(x + {offset} * width, p['{col}'], width * {conf['size']}, color='{conf['color']}', label='{label}')")
+    if ctx["codes"] is not None:
+        lines.append("ax.set_xticks(x, labels=labels)")
+    elif ctx["datetime"]:
+        lines += ["locator = mdates.AutoDateLocator()", "ax.xaxis.set_major_locator(locator)",
+                  "ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))"]
+    return setup, lines
+
+
+def build_facet_figure(df, spec, stream=None, profile=None):
+    # build_figure と同じ (Figure, 再現用のPythonコード, [(level, message), ...]) を返す。spec は正規化済み
+    chart_type, x_axis, y_axes, facet = spec["chart_type"], spec["x_axis"], spec["y_axes"], spec["facet"]
+    font_title, font_label_global, font_tick_global = spec["fonts"]
+    width_val, height_val = spec["size"]
+    xmin_val, xmax_val, ymin_val, ymax_val = spec["limits"]
+    x_major_step, x_minor_step, y_major_step, y_minor_step = spec["ticks"]
+    grid_major, grid_minor, tick_dir = spec["grid"]
+    notices = []
+    if stream is not None:
+        notices.append(("warning", f"⚠️ '{facet}' ごとの分割表示は、間引いたデータで描いています。"))
+    if any(spec["y_axis_mapping"].values()):
+        notices.append(("info", "💡 分割表示では、全ての系列を左の軸に描きます。"))
+
+    labels, panel_rows, hidden = facet_panels(profile, facet)
+    if hidden:
+        notices.append(("info", f"💡 '{facet}' の種類が多いため、行数の多い{len(labels)}件だけを並べています（残り{hidden}件）。"))
+    n = max(len(labels), 1)
+    ncols = min(spec["facet_cols"] or math.ceil(math.sqrt(n)), n)
+    nrows = math.ceil(n / ncols)
+    share = spec["facet_share"]
+    sharex, sharey = share in ["both", "x"], share in ["both", "y"]
+
+    # 全パネル共通の情報（列情報の配列はここで1回だけ作り、スレッドからは読むだけにする）
+    ctx = {"chart_type": chart_type, "ys": {c: profile.values(c) for c in y_axes},
+           "panel_px": (max(int(width_val * RENDER_DPI / ncols), 1), max(int(height_val * RENDER_DPI / nrows), 1))}
+    if chart_type in ["ヒストグラム", "箱ひげ図", "バイオリンプロット"]:
+        work = _dist_panel
+        ctx.update(bins=spec["hist_bins"], edges=None)
+        if chart_type == "ヒストグラム" and sharex:
+            stats = [profile.column_stats(c) for c in y_axes if profile.column_stats(c).count]
+            if stats:
+                ctx["edges"] = histogram_edges(min(s.min for s in stats), max(s.max for s in stats), spec["hist_bins"])
+    else:
+        work = _series_panel
+        categorical = not profile.is_numeric(x_axis) and not profile.is_datetime(x_axis)
+        ctx.update(types={c: spec["y_configs"][c]["type"] for c in y_axes}, downsample=spec["downsample"],
+                   reducer=spec["reducer"], datetime=profile.is_datetime(x_axis), window=None, codes=None,
+                   x_offset=mdates.date2num(np.datetime64("1970-01-01T00:00:00")) if profile.is_datetime(x_axis) else 0.0)
+        if categorical:
+            index = profile.group_index(x_axis)
+            codes = np.full(len(profile.values(y_axes[0])) if y_axes else 0, -1, dtype=np.int64)
+            codes[index.rows if index.rows is not None else slice(None)] = index.codes
+            ctx.update(codes=codes, n_labels=index.n_groups, labels=list(index.labels), x=None)
+            notices.append(("info", f"💡 各パネルで '{x_axis}' ごとの値の{REDUCERS[spec['reducer']]}を表示します。"))
+        else:
+            ctx["x"] = profile.values(x_axis)
+            if ctx["datetime"] and spec["time_window"]:
+                ctx["window"] = tuple(timestamp_days(t) for t in spec["time_window"])
+
+    with telemetry.stage("facet_panels", panels=len(labels)):
+        results = list(_executor().map(lambda rows: work(ctx, rows), panel_rows))
+
+    fig = Figure(figsize=(width_val, height_val), facecolor='white', layout='constrained')
+    axes = fig.subplots(nrows, ncols, sharex=sharex, sharey=sharey, squeeze=False).ravel()
+    for ax, label, res in zip(axes, labels, results):
+        ax.set_facecolor('white')
+        if work is _series_panel:
+            _draw_series(ax, res, spec, ctx)
+        else:
+            _draw_dist(ax, res, spec)
+        ax.set_title(f"{facet} = {label}（{res['rows']}行）", fontsize=font_tick_global, color='black')
+        ax.tick_params(labelsize=font_tick_global, colors='black', direction=tick_dir)
+        if x_minor_step or y_minor_step or grid_minor:
+            ax.minorticks_on()
+        if x_major_step: ax.xaxis.set_major_locator(MultipleLocator(x_major_step))
+        if x_minor_step: ax.xaxis.set_minor_locator(MultipleLocator(x_minor_step))
+        if y_major_step: ax.yaxis.set_major_locator(MultipleLocator(y_major_step))
+        if y_minor_step: ax.yaxis.set_minor_locator(MultipleLocator(y_minor_step))
+        ax.grid(grid_major, which='major', linestyle='--', alpha=0.3, color='gray')
+        if grid_minor:
+            ax.grid(True, which='minor', linestyle=':', alpha=0.2, color='gray')
+        if xmin_val is not None: ax.set_xlim(left=xmin_val)
+        if xmax_val is not None: ax.set_xlim(right=xmax_val)
+        if ymin_val is not None: ax.set_ylim(bottom=ymin_val)
+        if ymax_val is not None: ax.set_ylim(top=ymax_val)
+    for ax in axes[len(labels):]:
+        ax.set_visible(False)
+
+    fig.suptitle(spec["title"], fontsize=font_title, color='black')
+    x_label = fmt(spec["x_name"], spec["x_unit"]) or (x_axis or "")
+    y_label, y_label_fs, _, _, _ = axis_style(spec["axis_configs"].get(0, {}), spec["fonts"])
+    if x_label:
+        fig.supxlabel(x_label, fontsize=font_label_global, color='black')
+    if y_label and chart_type != "ヒストグラム":
+        fig.supylabel(y_label, fontsize=y_label_fs, color='black')
+    if len(y_axes) > 1:
+        # 凡例は図全体で1つだけ
+        handles, legend_labels = axes[0].get_legend_handles_labels()
+        if handles:
+            fig.legend(handles, legend_labels, loc='outside upper right')
+
+    setup_lines, panel_lines = _panel_code(spec, ctx)
+    setup_code = "".join(line + "\n" for line in setup_lines)
+    rows_expr = "len(p)" if work is _series_panel and spec["time_window"] else "len(g)"
+    style_lines = [f"ax.set_title(f'{facet} = {{name}}（{{{rows_expr}}}行）', fontsize={font_tick_global})",
+                   f"ax.tick_params(labelsize={font_tick_global}, direction='{tick_dir}')",
+                   f"ax.grid({grid_major}, which='major', linestyle='--', alpha=0.3, color='gray')"]
+    if grid_minor:
+        style_lines += ["ax.minorticks_on()", "ax.grid(True, which='minor', linestyle=':', alpha=0.2, color='gray')"]
+    for step, target in [(x_major_step, "xaxis.set_major_locator"), (x_minor_step, "xaxis.set_minor_locator"),
+                         (y_major_step, "yaxis.set_major_locator"), (y_minor_step, "yaxis.set_minor_locator")]:
+        if step: style_lines.append(f"ax.{target}(MultipleLocator({step}))")
+    for val, call in [(xmin_val, "set_xlim(left="), (xmax_val, "set_xlim(right="), (ymin_val, "set_ylim(bottom="), (ymax_val, "set_ylim(top=")]:
+        if val is not None: style_lines.append(f"ax.{call}{val})")
+    panel_code = "\n".join("    " + line for line in panel_lines + style_lines)
+    fig_code = [f"fig.suptitle('{spec['title']}', fontsize={font_title})"]
+    if x_label:
+        fig_code.append(f"fig.supxlabel('{x_label}', fontsize={font_label_global})")
+    if y_label and chart_type != "ヒストグラム":
+        fig_code.append(f"fig.supylabel('{y_label}', fontsize={y_label_fs})")
+    if len(y_axes) > 1:
+        fig_code.append("fig.legend(*axes.flat[0].get_legend_handles_labels(), loc='outside upper right')")
+    fig_code = "\n".join(fig_code)
+    code = f"""import pandas as pd
+import matplotlib.pyplot as plt
+import japanize_matplotlib
+import numpy as np
+from matplotlib.ticker import MultipleLocator
+
+# データを読み込む
+df = pd.read_csv('data.csv')
+{setup_code}
+# '{facet}' の値ごとに分ける（行数の多い順に最大{MAX_FACETS}件。並びはデータでの登場順）
+sizes = df['{facet}'].value_counts()
+groups = [(name, g) for name, g in df.groupby('{facet}', sort=False) if name in sizes.index[:{MAX_FACETS}]]
+
+fig, axes = plt.subplots({nrows}, {ncols}, figsize=({width_val}, {height_val}), sharex={sharex}, sharey={sharey}, squeeze=False, layout='constrained')
+for ax, (name, g) in zip(axes.flat, groups):
+{panel_code}
+for ax in axes.flat[len(groups):]:
+    ax.set_visible(False)
+
+{fig_code}
+plt.show()"""
+    notices.append(("info", f"💡 '{facet}' ごとに{len(labels)}枚のパネルに分けて表示しています（軸: {FACET_SHARE[share]}）。"))
+    return fig, code, notices
@@ -0,0 +1,96 @@
+import io
+
+import telemetry
+from chart_builder import apply_style, build_figure
+from chart_spec import normalize_spec
+from downsample import RENDER_DPI
+
+# --- セッションごとに描画済みの図を持ち続け、見た目だけの変更は図を作り直さずに反映する ---
+# グラフの種類・データ・列の選び方・集計や間引きの設定が変わったときだけ build_figure で作り直す。
+# 色・太さ・凡例の有無・ラベル・文字サイズ・範囲・目盛・グリッドは、前回の仕様との差分を描画物に直接反映する。
+
+# 変わると描く点や軸の数が変わる設定（図のサイズは間引き・集計の単位になるのでここに含める）
+REBUILD_KEYS = ["chart_type", "x_axis", "y_axes", "y_axis_mapping", "hist_bins", "size",
+                "downsample", "scatter_style", "reducer", "top_n", "resample", "time_window",
+                "facet", "facet_share", "facet_cols"]
+
+
+class FigureModel:
+    def __init__(self):
+        self.data_key = None
+        self.spec = None
+        self.fig = None
+        self.handles = None
+        self.notices = []
+        self.rebuilds = 0
+        self.updates = 0
+
+    def needs_rebuild(self, data_key, spec):
+        if self.fig is None or data_key != self.data_key:
+            return True
+        if any(spec[k] != self.spec[k] for k in REBUILD_KEYS):
+            return True
+        if spec["facet"] is not None:
+            return True  # 分割表示の図はパネルごとに軸が分かれているので、毎回作り直す
+        for col, conf in spec["y_configs"].items():
+            old = self.spec["y_configs"][col]
+            if conf["type"] != old["type"]:
+                return True
+            # 密度表示の色はカラーマップに焼き込まれている
+            kind = self.handles["series"].get(col, (None,))[0]
+            if kind == "density" and conf["color"] != old["color"]:
+                return True
+        return False
+
+    def render(self, data_key, df, spec, stream=None, profile=None, file_format="png", dpi=RENDER_DPI):
+        # 戻り値は render_figure と同じ (画像, コード, お知らせ)。図を更新しただけの場合、コードは None（必要なときに作る）
+        spec = normalize_spec(spec)
+        if self.needs_rebuild(data_key, spec):
+            handles = {}
+            with telemetry.stage("build_figure"):
+                fig, code, notices = build_figure(df, spec, stream=stream, profile=profile, handles=handles)
+            self.data_key, self.fig, self.handles, self.notices = data_key, fig, handles, notices
+            self.rebuilds += 1
+        else:
+            try:
+                with telemetry.stage("update_figure"):
+                    self.update(spec)
+            except Exception:
+                self.fig = None  # 途中まで変えた図は使わず、次回は作り直す
+                raise
+            code = None
+            self.updates += 1
+        self.spec = spec
+        buf = io.BytesIO()
+        with telemetry.stage("savefig", format=file_format, dpi=dpi):
+            self.fig.savefig(buf, format=file_format, dpi=dpi, bbox_inches='tight')
+        return buf.getvalue(), code, self.notices
+
+    def update(self, spec):
+        resized = set()  # 棒の幅を変えた軸（データの範囲を数え直す）
+        for col, (kind, artist, bar_width) in self.handles["series"].items():
+            conf, old = spec["y_configs"][col], self.spec["y_configs"][col]
+            if conf["show_legend"] != old["show_legend"]:
+                artist.set_label(col if conf["show_legend"] else "_nolegend_")
+            if kind == "density" or (conf["color"] == old["color"] and conf["size"] == old["size"]):
+                continue
+            color, size = conf["color"], conf["size"]
+            if kind == "line":
+                artist.set_color(color)
+                artist.set_linewidth(size)
+                artist.set_markersize(size * 2)
+            elif kind == "scatter":
+                artist.set_color(color)
+                artist.set_sizes([size * 10])
+            elif kind == "bar":
+                for patch in artist.patches:
+                    # 棒の中心はそのままで幅だけ変える
+                    center = patch.get_x() + patch.get_width() / 2
+                    patch.set_width(bar_width * size)
+                    patch.set_x(center - bar_width * size / 2)
+                    patch.set_facecolor(color)
+                    resized.add(patch.axes)
+        # 描いたときのデータの範囲は元の幅のままなので、作り直した図と同じ範囲になるよう数え直してから自動調整する
+        for target_ax in resized:
+            target_ax.relim()
+        apply_style(self.handles, spec)
@@ -0,0 +1,215 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from aggregation import plot_frame
+from chart_spec import DEFAULT_SPEC, RESAMPLE_METHODS, axis_style, fmt, normalize_spec
+from column_stats import histogram_edges
+from downsample import minmax_indices, resample_time, time_step
+from profiling import ColumnProfile, timestamp_days
+
+# --- ブラウザ側で描画するインタラクティブ表示（Vega-Lite） ---
+# matplotlib の代わりに、同じチャート仕様から Vega-Lite の仕様と描画用の表を作る。
+# 表は Streamlit が Arrow 形式（列ごとのバイナリ）で送り、拡大・移動はブラウザだけで行う（サーバーでは描き直さない）。
+# 保存用の画像（PNG・SVG・PDF）は今まで通り matplotlib で作る。
+RENDER_MODES = {"image": "画像（matplotlib）", "interactive": "インタラクティブ（ブラウザで描画）"}
+INTERACTIVE_TYPES = ["折れ線グラフ", "散布図", "棒グラフ", "複合グラフ", "ヒストグラム"]
+CLIENT_MAX_POINTS = 50_000  # ブラウザに送る行数の上限（拡大しても形が崩れないよう、画面の幅よりずっと多くする）
+POINTS_PER_INCH = 72  # 図のサイズ（インチ）から表示の高さ（px）への換算
+AXIS_OFFSET_PX = 60  # 3本目以降の右側の軸の間隔
+
+
+def _axis(title, label_size, tick_size, grid, tick_step=None, **extra):
+    axis = {"title": title or None, "titleFontSize": label_size, "labelFontSize": tick_size, "grid": grid, **extra}
+    if tick_step:
+        # Vega-Lite には目盛の間隔そのものを決める設定がないので、最小の間隔として渡す（拡大すると細かくなる）
+        axis["tickMinStep"] = tick_step
+    return axis
+
+
+def _domain(lo, hi):
+    scale = {}
+    if lo is not None: scale["domainMin"] = lo
+    if hi is not None: scale["domainMax"] = hi
+    return scale
+
+
+def _time_frame(profile, spec, notices):
+    # 日時のX軸：表示範囲の行だけを取り出し、送る行数が上限を超える場合は一定の間隔ごとにまとめる
+    x_axis, y_axes = spec["x_axis"], spec["y_axes"]
+    x_days = profile.values(x_axis)
+    rows = slice(None)
+    if spec["time_window"]:
+        lo, hi = (timestamp_days(t) for t in spec["time_window"])
+        if profile.is_sorted(x_axis):
+            rows = slice(int(np.searchsorted(x_days, lo, side="left")), int(np.searchsorted(x_days, hi, side="right")))
+        else:
+            rows = (x_days >= lo) & (x_days <= hi)
+    x_days = x_days[rows]
+    columns = {c: profile.values(c)[rows] for c in y_axes}
+    if spec["resample"] != "off" and len(x_days) > CLIENT_MAX_POINTS and np.isfinite(x_days).any():
+        step = time_step(np.nanmax(x_days) - np.nanmin(x_days), CLIENT_MAX_POINTS)
+        for c in y_axes:
+            x_res, columns[c] = resample_time(x_days, columns[c], step, spec["resample"])
+        x_days = x_res
+        notices.append(("info", f"💡 点が多いため、一定の間隔ごとの{RESAMPLE_METHODS[spec['resample']]}にまとめて送っています（{len(x_days)}点）。"))
+    return pd.to_datetime(x_days * 86_400e9, unit="ns"), columns
+
+
+def _series_frame(df, spec, stream, profile, notices):
+    # X列と各系列の値だけを持つ表（列名は Vega-Lite のフィールド名として安全な x, y0, y1, ... にする）
+    x_axis, y_axes = spec["x_axis"], spec["y_axes"]
+    plot_df, _, agg_notices = plot_frame(df, spec, stream, profile)
+    notices += agg_notices
+    if plot_df is df and profile.is_datetime(x_axis):
+        x, columns = _time_frame(profile, spec, notices)
+        return pd.DataFrame({"x": x, **{f"y{i}": columns[c] for i, c in enumerate(y_axes)}}), "temporal"
+
+    if plot_df is df:
+        columns = {c: profile.values(c) for c in y_axes}
+        x = profile.values(x_axis) if profile.is_numeric(x_axis) else df[x_axis].to_numpy()
+    else:
+        columns = {c: plot_df[c].to_numpy(dtype=float, na_value=np.nan) for c in y_axes}
+        x = plot_df[x_axis].to_numpy()
+    x_type = "quantitative" if plot_df is df and profile.is_numeric(x_axis) else "nominal"
+    frame = pd.DataFrame({"x": x, **{f"y{i}": columns[c] for i, c in enumerate(y_axes)}}, copy=False)
+    if len(frame) > CLIENT_MAX_POINTS:
+        # 系列ごとに山と谷を残す点を選び、その和集合の行だけを送る
+        # （カテゴリのX軸は行の順番に並べて描くので、行の位置で区切る）
+        pos = x if x_type == "quantitative" else np.arange(len(frame), dtype=float)
+        n_buckets = max(CLIENT_MAX_POINTS // (2 * len(y_axes)), 1)
+        keep = np.unique(np.concatenate([minmax_indices(pos, columns[c], n_buckets) for c in y_axes]))
+        notices.append(("info", f"💡 {len(frame)}行のうち、拡大しても形が変わらない{len(keep)}行だけをブラウザに送っています。"))
+        frame = frame.iloc[keep]
+    return frame, x_type
+
+
+def _series_chart(df, spec, stream, profile, notices):
+    y_axes, y_configs, mapping = spec["y_axes"], spec["y_configs"], spec["y_axis_mapping"]
+    _, font_label_global, font_tick_global = spec["fonts"]
+    xmin_val, xmax_val, ymin_val, ymax_val = spec["limits"]
+    x_major_step, _, y_major_step, _ = spec["ticks"]
+    grid_major = spec["grid"][0]
+    data, x_type = _series_frame(df, spec, stream, profile, notices)
+
+    x_enc = {"field": "x", "type": x_type,
+             "axis": _axis(fmt(spec["x_name"], spec["x_unit"]) or spec["x_axis"], font_label_global, font_tick_global,
+                           grid_major, x_major_step if x_type == "quantitative" else None)}
+    if x_type == "nominal":
+        x_enc["sort"] = None  # データの並び順のまま
+    else:
+        x_enc["scale"] = _domain(xmin_val, xmax_val)
+
+    # 凡例は全ての軸で1つの色の尺度にまとめる
+    legend_cols = [c for c in y_axes if y_configs[c]["show_legend"]]
+    color_scale = {"domain": legend_cols, "range": [y_configs[c]["color"] for c in legend_cols]}
+    bar_cols = [c for c in y_axes if y_configs[c]["type"] == "Bar"]
+
+    groups = {}
+    for i, col in enumerate(y_axes):
+        conf = y_configs[col]
+        a_idx = mapping.get(col, 0)
+        a_label, a_label_fs, a_tick_fs, a_min, a_max = axis_style(spec["axis_configs"].get(a_idx, {}), spec["fonts"])
+        if a_idx == 0:
+            # 全体のY軸の範囲は左の軸の設定より優先する（matplotlib の図と同じ）
+            a_min = ymin_val if ymin_val is not None else a_min
+            a_max = ymax_val if ymax_val is not None else a_max
+        extra = {"orient": "left"} if a_idx == 0 else {"orient": "right", "offset": (a_idx - 1) * AXIS_OFFSET_PX}
+        y_enc = {"field": f"y{i}", "type": "quantitative",
+                 "axis": _axis(a_label, a_label_fs, a_tick_fs, grid_major and a_idx == 0,
+                               y_major_step if a_idx == 0 else None, **extra),
+                 "scale": dict(_domain(a_min, a_max), zero=conf["type"] == "Bar")}
+        if conf["type"] == "Line":
+            mark = {"type": "line", "point": True, "strokeWidth": conf["size"]}
+        elif conf["type"] == "Scatter":
+            mark = {"type": "point", "filled": True, "size": conf["size"] * 10, "opacity": 0.7}
+        else:
+            mark = {"type": "bar"}
+        mark["clip"] = True
+        encoding = {"x": x_enc, "y": y_enc,
+                    "tooltip": [{"field": "x", "type": x_type, "title": spec["x_axis"]},
+                                {"field": f"y{i}", "type": "quantitative", "title": col}]}
+        if conf["show_legend"]:
+            encoding["color"] = {"field": "series", "type": "nominal", "scale": color_scale, "legend": {"title": None}}
+        else:
+            mark["color"] = conf["color"]
+        if conf["type"] == "Bar" and x_type == "nominal" and len(bar_cols) > 1:
+            # 棒を横に並べる（幅は並べた区画いっぱい）
+            encoding["xOffset"] = {"field": "series", "type": "nominal", "scale": {"domain": bar_cols}}
+        elif conf["type"] == "Bar" and x_type == "nominal":
+            mark["width"] = {"band": 0.8 * conf["size"]}
+        # 系列名は列として送らず、層ごとに定数の series 欄を足す（縦長の表と同じ形で色と棒の位置を決める）
+        layer = {"transform": [{"calculate": json.dumps(col), "as": "series"}], "mark": mark, "encoding": encoding}
+        groups.setdefault(a_idx, []).append(layer)
+
+    if x_type != "nominal":
+        # 拡大・移動（Y軸が複数ある場合は横方向だけ）
+        encodings = ["x"] if len(groups) > 1 else ["x", "y"]
+        groups[min(groups)][0]["params"] = [{"name": "zoom", "select": {"type": "interval", "encodings": encodings},
+                                             "bind": "scales"}]
+    # 同じ軸の系列は尺度を共有し、軸ごとに独立させる
+    chart = {"layer": [{"layer": layers} for _, layers in sorted(groups.items())]}
+    if len(groups) > 1:
+        chart["resolve"] = {"scale": {"y": "independent"}, "axis": {"y": "independent"}}
+    return data, chart
+
+
+def _histogram_chart(df, spec, stream, profile, notices):
+    # 度数はサーバーで数え（階級数を変えても生データは読み直さない）、ブラウザには階級ごとの度数だけを送る
+    y_axes, bins = spec["y_axes"], spec["hist_bins"]
+    _, font_label_global, font_tick_global = spec["fonts"]
+    xmin_val, xmax_val, ymin_val, ymax_val = spec["limits"]
+    if stream is not None:
+        cols = [c for c in y_axes if c in stream.summaries]
+        edges, counts = stream.histogram(cols, bins)
+    else:
+        stats = {c: profile.column_stats(c) for c in y_axes}
+        cols = [c for c, summary in stats.items() if summary.count]
+        edges = histogram_edges(min(stats[c].min for c in cols), max(stats[c].max for c in cols), bins) if cols else np.zeros(1)
+        counts = [stats[c].counts(edges) for c in cols]
+    data = pd.DataFrame({"start": np.tile(edges[:-1], len(cols)), "end": np.tile(edges[1:], len(cols)),
+                         "count": np.concatenate(counts) if cols else np.zeros(0),
+                         "series": np.repeat(np.asarray(cols, dtype=object), len(edges) - 1)})
+    axis = _axis(fmt(spec["x_name"], spec["x_unit"]), font_label_global, font_tick_global, spec["grid"][0])
+    chart = {
+        "mark": {"type": "bar", "opacity": 0.7, "clip": True},
+        "encoding": {
+            "x": {"field": "start", "type": "quantitative", "bin": {"binned": True}, "axis": axis,
+                  "scale": _domain(xmin_val, xmax_val)},
+            "x2": {"field": "end"},
+            "y": {"field": "count", "type": "quantitative", "stack": None, "title": "度数",
+                  "axis": _axis("度数", font_label_global, font_tick_global, spec["grid"][0]),
+                  "scale": _domain(ymin_val, ymax_val)},
+            "color": {"field": "series", "type": "nominal", "legend": {"title": None}},
+            "tooltip": [{"field": "series", "title": "列"}, {"field": "start", "title": "から"},
+                        {"field": "end", "title": "まで"}, {"field": "count", "title": "度数"}],
+        },
+        "params": [{"name": "zoom", "select": {"type": "interval", "encodings": ["x"]}, "bind": "scales"}],
+    }
+    return data, chart
+
+
+def interactive_chart(df, spec, stream=None, profile=None):
+    # 戻り値は (描画用の表, Vega-Lite の仕様, [(level, message), ...])
+    spec = normalize_spec(spec)
+    if spec["chart_type"] not in INTERACTIVE_TYPES:
+        raise ValueError(f"インタラクティブ表示に対応していないグラフです: {spec['chart_type']}")
+    if profile is None:
+        profile = ColumnProfile(df, stream)
+    notices = []
+    if spec["chart_type"] == "ヒストグラム":
+        data, chart = _histogram_chart(df, spec, stream, profile, notices)
+    else:
+        data, chart = _series_chart(df, spec, stream, profile, notices)
+
+    _, x_minor_step, _, y_minor_step = spec["ticks"]
+    # 目盛の向きは既定から変えた場合だけ知らせる（Vega-Lite の目盛は常に外向き）
+    tick_dir_changed = spec["grid"][2] != DEFAULT_SPEC["grid"][2]
+    if x_minor_step or y_minor_step or spec["grid"][1] or tick_dir_changed or spec["aspect"] != "auto":
+        notices.append(("info", "💡 インタラクティブ表示では、補助目盛・補助グリッド・目盛の向き・縦横比は反映されません（保存する画像には反映されます）。"))
+    chart.update({
+        "title": {"text": spec["title"], "fontSize": spec["fonts"][0]},
+        "height": int(spec["size"][1] * POINTS_PER_INCH),
+    })
+    return data, chart, notices
@@ -1,11 +1,25 @@
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-import japanize_matplotlib
-import io
-import json
-import numpy as np
-from matplotlib.ticker import MultipleLocator
+import os
+import functools
+from datetime import timedelta
+from concurrent.futures import wait
+from data_loader import content_digest, dataset_key, parse_csv, parse_csv_compact
+from columnar import PARSERS, UPLOAD_TYPES, SchemaColumns, file_kind, read_schema
+from dataset_store import DatasetStore
+from render_cache import RenderCache, chart_spec_key
+from profiling import ProfileCache
+from streaming import STREAM_THRESHOLD_BYTES, stream_csv
+from downsample import DENSITY_THRESHOLD, DOWNSAMPLE_THRESHOLD, RENDER_DPI
+from exporter import MIME_TYPES, Exporter, export_filename, export_key, zip_exports
+from chart_spec import CHART_TYPES, DEFAULT_COLORS, FACET_SHARE, FACET_TYPES, MAX_FACETS, REDUCERS, RESAMPLE_METHODS
+from interactive import INTERACTIVE_TYPES, RENDER_MODES, interactive_chart
+import telemetry
+# matplotlib・日本語フォント（chart_builder）と描画サービスのクライアントは、最初のグラフを描くときに読み込む
+
+# 常駐の描画サービス（render_service.py）を使う場合はURLを指定する
+RENDER_URL = os.environ.get("GRAPHYPAD_RENDER_URL")
+# 段階ごとの計測パネルを常に出す場合は 1 にする（URLに ?debug=1 を付けても出る）
+DEBUG = os.environ.get("GRAPHYPAD_DEBUG") == "1"
 
 # --- デザイン：以前のカスタムCSSをStreamlitに注入 ---
 def local_css():
@@ -67,6 +81,119 @@ def local_css():
 
 local_css()
 
+# --- サンプルCSV（リポジトリ同梱のUTF-8 BOM付きファイルをそのまま配る） ---
+SAMPLE_FILES = ["sample_experiment.csv", "sample_category.csv", "sample_stats.csv"]
+
+@st.cache_resource
+def get_sample_files():
+    base = os.path.dirname(os.path.abspath(__file__))
+    samples = {}
+    for name in SAMPLE_FILES:
+        with open(os.path.join(base, name), "rb") as f:
+            samples[name] = f.read()
+    return samples
+
+# --- パース済みデータの置き場（全セッション共通、予算を超えたらディスクへ退避） ---
+@st.cache_resource
+def get_parse_cache():
+    return DatasetStore(max_entries=8, max_bytes=1024 ** 3, max_spill_bytes=8 * 1024 ** 3)
+
+def upload_digest(uploaded_file):
+    # 同じアップロードの再ハッシュを避けるため、セッション内でダイジェストを覚えておく
+    digests = st.session_state.setdefault("upload_digests", {})
+    file_key = getattr(uploaded_file, "file_id", None) or (uploaded_file.name, uploaded_file.size)
+    digest = digests.get(file_key)
+    if digest is None:
+        with telemetry.stage("hash", bytes=uploaded_file.size):
+            digest = digests[file_key] = content_digest(uploaded_file.getvalue())
+    return digest
+
+def spool_upload(uploaded_file):
+    # 描画サービスから読めるよう、アップロードをサービスのデータ置き場（共有の一時フォルダ）に1回だけ書き出す
+    from render_service import SPOOL_DIR
+    path = os.path.join(SPOOL_DIR, f"{upload_digest(uploaded_file)}.csv")
+    if not os.path.exists(path):
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(uploaded_file.getvalue())
+        os.replace(tmp_path, path)
+    return path
+
+def upload_schema(uploaded_file, kind, sheet_name=None):
+    # 列の情報はファイルのスキーマだけから取り出す（データ本体は読まない）
+    schemas = st.session_state.setdefault("upload_schemas", {})
+    schema_key = (upload_digest(uploaded_file), sheet_name)
+    if schema_key not in schemas:
+        schemas[schema_key] = read_schema(uploaded_file.getvalue(), kind, sheet_name)
+    return schemas[schema_key]
+
+def load_uploaded(uploaded_file, parse=parse_csv, **options):
+    digest = upload_digest(uploaded_file)
+    # キャッシュにあればアップロードの中身は読み直さない
+    key = dataset_key(digest, options, parse)
+    cache = get_parse_cache()
+    df = cache.get(key)
+    if df is None:
+        with telemetry.stage("parse", parser=parse.__name__, bytes=uploaded_file.size):
+            df = cache.put(key, parse(uploaded_file.getvalue(), **options))
+    # このセッションが使っている間は、他のデータより後に退避されるようにする
+    ref = st.session_state.get("dataset_ref")
+    if ref is None or ref.key != key:
+        st.session_state.dataset_ref = cache.ref(key)
+    return df, key
+
+# --- 描画済みグラフのキャッシュ（全セッション共通） ---
+@st.cache_resource
+def get_render_cache():
+    return RenderCache(max_entries=64, max_bytes=256 * 1024 ** 2)
+
+# --- 列情報（型・件数・最小最大、描画用の配列など）のキャッシュ（全セッション共通） ---
+@st.cache_resource
+def get_profile_cache():
+    return ProfileCache(max_entries=32, max_bytes=512 * 1024 ** 2)
+
+@st.cache_resource
+def get_exporter():
+    return Exporter(workers=1, max_entries=32, max_bytes=256 * 1024 ** 2)
+
+# --- 診断用の計測（再実行のたびに記録先を決め直す。計測しない場合は何もしない） ---
+debug = DEBUG or st.query_params.get("debug") == "1"
+if debug:
+    telemetry.log_to_stderr()
+recorder = telemetry.activate(telemetry.Recorder(memory=st.session_state.get("telemetry_memory", "rss")) if debug else None)
+profiler = telemetry.start_profile() if debug and st.session_state.pop("profile_next_run", False) else None
+
+
+def fragment_stage(name):
+    # フラグメントの本体を1つの段階として測る。スクリプト全体の再実行では上の記録先に入り、
+    # フラグメントだけの再実行（見た目の変更・ページ送り・書き出し）では記録先がないので、ここで作ってその場に表示する
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not debug or telemetry.active() is not None:
+                with telemetry.stage(name):
+                    return func(*args, **kwargs)
+            own = telemetry.activate(telemetry.Recorder(memory=st.session_state.get("telemetry_memory", "rss"), fragment=name))
+            own_profiler = telemetry.start_profile() if st.session_state.pop("profile_next_run", False) else None
+            try:
+                with telemetry.stage(name):
+                    result = func(*args, **kwargs)
+            finally:
+                telemetry.activate(None)
+                if own_profiler is not None:
+                    st.session_state.cprofile = telemetry.finish_profile(own_profiler)
+                own.log()
+                own.close()
+            top = [r for r in own.records if r["depth"] == 0]
+            st.caption(f"🛠 この部分だけの再実行（{name}）: {sum(r.get('wall_ms', 0.0) for r in top):.0f} ms"
+                       f"（CPU {sum(r.get('cpu_ms', 0.0) for r in top):.0f} ms）"
+                       + (" ・ cProfile を記録しました（サイドバーの Debug から保存できます）" if own_profiler is not None else ""))
+            st.dataframe(own.table(), hide_index=True, use_container_width=True)
+            return result
+        return wrapper
+    return decorate
+
 # タイトル（以前のスタイル）
 st.title("GraphyPad")
 st.markdown("<p style='color: #8b949e; margin-top: -15px;'>高校生のためのグラフ作成ツール</p>", unsafe_allow_html=True)
@@ -74,523 +201,484 @@ st.markdown("<p style='color: #8b949e; margin-top: -15px;'>高校生のための
 # --- サイドバー：以前のセクション構成を再現 ---
 with st.sidebar:
     st.header("Data Input")
-    uploaded_file = st.file_uploader("CSVファイルを選択", type="csv")
+    uploaded_file = st.file_uploader("データファイルを選択（CSV・Parquet・Feather/Arrow・Excel）", type=UPLOAD_TYPES)
     
     df = None
-    if uploaded_file:
+    stream = None
+    catalog = None  # 軸の選択肢にする列の一覧（読み込んだデータの列情報、列ファイルならスキーマ）
+    kind = file_kind(uploaded_file.name) if uploaded_file else None
+    if uploaded_file and kind != "csv":
+        use_compact = st.toggle("省メモリモード", value=True,
+                                help="読み込んだデータを、値を変えずに小さい型（整数の縮小・カテゴリ型など）へ変換します。")
         try:
-            try:
-                df = pd.read_csv(uploaded_file)
-            except UnicodeDecodeError:
-                uploaded_file.seek(0)
-                df = pd.read_csv(uploaded_file, encoding='shift-jis')
+            options = {"compact": use_compact}
+            schema = upload_schema(uploaded_file, kind)
+            if kind == "excel":
+                options["sheet_name"] = st.selectbox("シート", schema["sheets"])
+                schema = upload_schema(uploaded_file, kind, options["sheet_name"])
+            # 軸の選択肢はスキーマから作り、データはグラフに使う列が決まってから読み込む（下の Axis Settings）
+            catalog = SchemaColumns(schema)
+            if schema["rows"] is not None:
+                st.caption(f"{schema['rows']:,}行 × {len(catalog.columns)}列（ファイルの情報より）")
+        except Exception as e:
+            st.error(f"Error: {e}")
+    elif uploaded_file:
+        use_stream = st.toggle("大容量モード（チャンク読み込み）", value=uploaded_file.size > STREAM_THRESHOLD_BYTES,
+                               help="全行を保持せず、グラフに必要な集計と間引いたデータだけを残します。")
+        use_compact = st.toggle("省メモリモード", value=True, disabled=use_stream,
+                                help="読み込んだデータを、値を変えずに小さい型（整数の縮小・カテゴリ型など）へ変換します。")
+        try:
+            if use_stream:
+                stream, data_key = load_uploaded(uploaded_file, parse=stream_csv)
+                df = stream.sample
+                src = stream.source_format
+            else:
+                df, data_key = load_uploaded(uploaded_file, parse=parse_csv_compact if use_compact else parse_csv)
+                src = df.attrs.get("source_format", {})
+            with telemetry.stage("profile"):
+                profile = get_profile_cache().get_or_build(data_key, df, stream)
+            catalog = profile
+            if src:
+                sep_label = {"\t": "タブ", ",": "カンマ", ";": "セミコロン", "|": "パイプ"}.get(src["sep"], src["sep"])
+                st.caption(f"文字コード: {src['encoding']} / 区切り: {sep_label}" + (" / ヘッダーなし" if src["header"] is None else ""))
+            c_stats = get_parse_cache().stats()
+            st.caption(f"キャッシュ: ヒット {c_stats['hits']} / ミス {c_stats['misses']} ({c_stats['entries']}件, {c_stats['bytes'] / 1024 ** 2:.1f} MB)")
+            st.caption(f"メモリ上 {c_stats['bytes'] / 1024 ** 2:.1f} / {c_stats['max_bytes'] / 1024 ** 2:.0f} MB ・ "
+                       f"ディスク退避 {c_stats['spilled_entries']}件 {c_stats['spilled_bytes'] / 1024 ** 2:.1f} MB ・ "
+                       f"利用中 {c_stats['sessions']}セッション（共有 {c_stats['shared']}件）")
         except Exception as e:
             st.error(f"Error: {e}")
 
-    if df is not None:
+    if catalog is not None:
         st.divider()
         st.header("Axis Settings")
-        chart_type = st.selectbox("Chart Type (グラフの種類)", [
-            "折れ線グラフ", "散布図", "棒グラフ", "複合グラフ", "ヒストグラム", "円グラフ", "箱ひげ図", "バイオリンプロット"
-        ])
+        chart_type = st.selectbox("Chart Type (グラフの種類)", CHART_TYPES)
+        render_mode = "image"
+        if chart_type in INTERACTIVE_TYPES:
+            render_mode = st.radio("表示方法", list(RENDER_MODES), format_func=RENDER_MODES.get, horizontal=True,
+                                   help="インタラクティブ: ブラウザで描画するので、拡大・移動してもサーバーで描き直しません。保存する画像は今まで通りmatplotlibで作ります。")
+        hist_bins = None
         
         # グラフの種類に応じて設定項目を変える
         if chart_type in ["折れ線グラフ", "散布図", "棒グラフ", "複合グラフ"]:
-            x_axis = st.selectbox("X-Axis (横軸)", df.columns)
+            x_axis = st.selectbox("X-Axis (横軸)", catalog.columns)
             
             # 数値列を優先的にリストアップ
-            numeric_cols = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c]) and c != x_axis]
-            other_cols = [c for c in df.columns if not pd.api.types.is_numeric_dtype(df[c]) and c != x_axis]
+            numeric_cols = catalog.numeric_cols(exclude=x_axis)
+            other_cols = catalog.other_cols(exclude=x_axis)
             selectable_y = numeric_cols + other_cols
             
             y_axes = st.multiselect("Y-Axis (縦軸: 複数選択可)", selectable_y, default=[numeric_cols[0]] if numeric_cols else [])
-            
-            # デフォルト配色
-            default_colors = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf"]
-            
-            y_configs = {}
-            if y_axes:
-                with st.expander("Series Settings (個別の設定)", expanded=True):
-                    for i, col in enumerate(y_axes):
-                        st.write(f"**{col}**")
-                        c_typ, c_col, c_siz, c_leg = st.columns([2, 1, 1, 1])
-                        
-                        # プロットの種類
-                        if chart_type == "複合グラフ":
-                            p_type = c_typ.selectbox("Type", ["Line", "Scatter", "Bar"], key=f"type_{col}")
-                        else:
-                            p_type = "Line" if chart_type == "折れ線グラフ" else ("Scatter" if chart_type == "散布図" else "Bar")
-                        
-                        # 色
-                        p_color = c_col.color_picker("Color", default_colors[i % len(default_colors)], key=f"color_{col}")
-                        
-                        # サイズ
-                        if p_type == "Bar":
-                            p_size = c_siz.number_input("Width Scale", 0.1, 2.0, 1.0, step=0.1, format="%g", key=f"size_{col}")
-                        else:
-                            p_size = c_siz.number_input("Size", 1.0, 50.0, 8.0 if p_type == "Scatter" else 3.0, step=1.0, format="%g", key=f"size_{col}")
-                        
-                        # 凡例表示
-                        p_leg = c_leg.checkbox("Legend", value=True, key=f"leg_{col}")
-                        
-                        y_configs[col] = {"type": p_type, "color": p_color, "size": p_size, "show_legend": p_leg}
-
-            y_axis_mapping = {}
-            axis_configs = {0: {"name": y_axes[0] if y_axes else "", "unit": "", "min": None, "max": None, "label_size": 18, "tick_size": 14}}
-            
-            if y_axes and chart_type != "円グラフ":
-                with st.expander("Axis Allocation & Settings (軸の設定)", expanded=False):
-                    active_ids = {0}
-                    for col in y_axes:
-                        y_axis_mapping[col] = st.number_input(f"Axis for {col} (0:左, 1:右, 2+:右オフセット)", 0, 5, 0, key=f"axis_{col}")
-                        active_ids.add(y_axis_mapping[col])
-                    
-                    st.divider()
-                    for idx in sorted(list(active_ids)):
-                        st.write(f"**Axis {idx} Config**")
-                        c_n, c_u = st.columns(2)
-                        a_name = c_n.text_input(f"Name", value=y_axes[0] if idx==0 and y_axes else "", key=f"aname_{idx}")
-                        a_unit = c_u.text_input(f"Unit", key=f"aunit_{idx}")
-                        
-                        c_mi, c_ma = st.columns(2)
-                        a_min = c_mi.number_input(f"Min", value=None, step=1.0, format="%g", key=f"amin_{idx}")
-                        a_max = c_ma.number_input(f"Max", value=None, step=1.0, format="%g", key=f"amax_{idx}")
-                        
-                        c_fl, c_ft = st.columns(2)
-                        a_font_l = c_fl.number_input(f"Label Size", 10, 40, 18, step=1, key=f"afont_l_{idx}")
-                        a_font_t = c_ft.number_input(f"Tick Size", 8, 30, 14, step=1, key=f"afont_t_{idx}")
-                        
-                        axis_configs[idx] = {"name": a_name, "unit": a_unit, "min": a_min, "max": a_max, "label_size": a_font_l, "tick_size": a_font_t}
-            else:
-                for col in y_axes: y_axis_mapping[col] = 0
         elif chart_type == "円グラフ":
-            x_axis = st.selectbox("Labels (ラベルにする列)", df.columns)
+            x_axis = st.selectbox("Labels (ラベルにする列)", catalog.columns)
             
-            numeric_cols = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c]) and c != x_axis]
-            other_cols = [c for c in df.columns if not pd.api.types.is_numeric_dtype(df[c]) and c != x_axis]
+            numeric_cols = catalog.numeric_cols(exclude=x_axis)
+            other_cols = catalog.other_cols(exclude=x_axis)
             selectable_y = numeric_cols + other_cols
             
             y_axes = st.multiselect("Values (数値の列: 1つ選択)", selectable_y, default=[numeric_cols[0]] if numeric_cols else [], max_selections=1)
         elif chart_type == "ヒストグラム":
             x_axis = None
-            y_axes = st.multiselect("Data (対象の列: 複数選択可)", df.columns, default=[df.columns[0]])
+            y_axes = st.multiselect("Data (対象の列: 複数選択可)", catalog.columns, default=catalog.columns[:1])
             hist_bins = st.number_input("Bins (階級数)", 1, 100, 20, step=1)
         else: # 箱ひげ図, バイオリンプロット
             x_axis = None
-            y_axes = st.multiselect("Data (対象の列: 複数選択可)", df.columns, default=df.columns.tolist()[:3])
+            y_axes = st.multiselect("Data (対象の列: 複数選択可)", catalog.columns, default=catalog.columns[:3])
+
+        faceting = chart_type in FACET_TYPES and render_mode == "image"
+        if df is None:
+            # 列ファイル：グラフに使う列（X軸・Y軸・分割表示の列）だけを読み込む。選び直すと、その列の組み合わせで読み直す
+            # （分割表示の列は下で選ぶが、選んだ値は再実行の前に session_state に入っている）
+            facet_choice = st.session_state.get("facet_col") if faceting else None
+            wanted = [c for c in dict.fromkeys([x_axis, *y_axes, facet_choice]) if c in catalog.columns] or catalog.columns[:1]
+            options["columns"] = wanted if len(wanted) < len(catalog.columns) else None
+            try:
+                df, data_key = load_uploaded(uploaded_file, parse=PARSERS[kind], **options)
+            except Exception as e:
+                st.error(f"Error: {e}")
+                st.stop()
+            with telemetry.stage("profile"):
+                profile = get_profile_cache().get_or_build(data_key, df)
+            st.caption(f"読み込んだ列: {', '.join(map(str, df.columns))}（{len(df):,}行）")
+
+        # カテゴリカルなX軸の集計方法（合計・平均など）と、種類が多い場合の「その他」へのまとめ
+        reducer, top_n = "sum", None
+        if x_axis is not None and not profile.is_numeric(x_axis) and not profile.is_datetime(x_axis):
+            with st.expander("Aggregation (集計)", expanded=False):
+                reducer = st.selectbox("重複する値の集計方法", list(REDUCERS), format_func=REDUCERS.get)
+                if chart_type in ["棒グラフ", "円グラフ"]:
+                    top_n = st.number_input("上位の件数（残りは「その他」にまとめる。0で全て表示）", 0, 1000, 0, step=1) or None
+
+        # 日時のX軸：点が多い場合のまとめ方と、表示する期間（期間外の行は描画に使わない）
+        resample, time_window = "mean", None
+        if x_axis is not None and profile.is_datetime(x_axis) and chart_type in ["折れ線グラフ", "散布図", "棒グラフ", "複合グラフ"]:
+            with st.expander("Time Axis (時間軸)", expanded=False):
+                resample = st.selectbox("点が多い場合のまとめ方", list(RESAMPLE_METHODS), format_func=RESAMPLE_METHODS.get)
+                t_stats = profile.stats(x_axis)
+                if t_stats["min"] is not None and t_stats["max"] > t_stats["min"]:
+                    t_min, t_max = t_stats["min"].to_pydatetime(), t_stats["max"].to_pydatetime()
+                    window = st.slider("表示する期間", t_min, t_max, (t_min, t_max), key=f"window_{x_axis}",
+                                       step=max((t_max - t_min) / 1000, timedelta(seconds=1)), format="YYYY-MM-DD HH:mm")
+                    if tuple(window) != (t_min, t_max):
+                        time_window = [window[0].isoformat(), window[1].isoformat()]
+
+        # 分割表示：選んだ列の値ごとにパネルを分けて格子状に並べる（画像で表示する場合だけ）
+        facet, facet_share, facet_cols = None, "both", None
+        if faceting:
+            with st.expander("Facet (分割表示)", expanded=False):
+                facet_options = ["なし"] + [c for c in catalog.columns if c not in [x_axis] + list(y_axes)]
+                facet = st.selectbox("パネルを分ける列", facet_options, key="facet_col",
+                                     help=f"値の種類が{MAX_FACETS}より多い場合は、行数の多い順に{MAX_FACETS}件だけを並べます。")
+                facet = None if facet == "なし" else facet
+                if facet is not None:
+                    facet_share = st.selectbox("軸の範囲", list(FACET_SHARE), format_func=FACET_SHARE.get)
+                    facet_cols = st.number_input("1行に並べるパネルの数（0で自動）", 0, MAX_FACETS, 0, step=1) or None
+
+    # 計測の結果は再実行の最後に書き込む
+    debug_panel = st.container() if debug else None
+
+# --- データの詳細（ページ送りや列の集計ではこの部分だけを再実行する） ---
+@st.fragment
+@fragment_stage("preview")
+def show_data_details(df, stream, profile, selected_cols):
+    with st.expander("📊 アップロードされたデータの詳細を確認", expanded=False):
+        st.subheader("データ概要")
+        if "memory" in df.attrs:
+            mem = df.attrs["memory"]
+            st.caption(f"メモリ使用量: {mem['before'] / 1024:,.1f} KB → {mem['after'] / 1024:,.1f} KB（省メモリモード）")
+        # 各列の情報をまとめる（列が多い場合は選択中の列から集計し、残りはボタンで集計）
+        for col in selected_cols:
+            profile.stats(col)
+        if not profile.lazy:
+            profile.compute_all()
+        elif not profile.complete:
+            st.caption(f"列が多いため、選択中の列だけを集計しています（全{len(profile.columns)}列）")
+            if st.button("すべての列を集計", key="profile_all"):
+                profile.compute_all()
+        info_df = profile.table()
+        st.table(info_df)
         
+        st.subheader("データの数値参照")
+        if stream is not None and stream.stride > 1:
+            st.caption(f"大容量モード: 全{stream.row_count}行から、{stream.stride}行ごとの区間の先頭と各列の最小・最大の行だけを表示しています")
+        total_rows = len(df)
+        if total_rows > 50:
+            page_size = 50
+            num_pages = (total_rows - 1) // page_size + 1
+            
+            # セッション状態でのページ管理（データが変わって範囲外になったら丸める）
+            if "page_num" not in st.session_state:
+                st.session_state.page_num = 1
+            st.session_state.page_num = min(max(st.session_state.page_num, 1), num_pages)
+            current = st.session_state.page_num
 
-        st.divider()
-        st.header("Label Settings")
+            # --- 現在のページの前後だけ番号を出す（ページ数が増えてもボタンの数は一定） ---
+            page_window = 7
+            first_page = max(1, min(current - page_window // 2, num_pages - page_window + 1))
+            window = range(first_page, min(first_page + page_window, num_pages + 1))
+            targets = [("«", 1, "pg_first"), ("‹", current - 1, "pg_prev")]
+            targets += [(str(i), i, f"pg_{i}") for i in window]
+            targets += [("›", current + 1, "pg_next"), ("»", num_pages, "pg_last")]
+            p_cols = st.columns([1] * len(targets) + [3, 3])
+
+            for col, (label, target, key) in zip(p_cols, targets):
+                with col:
+                    st.markdown("<div class='page-num-row'>", unsafe_allow_html=True)
+                    if target == current and label.isdigit():
+                        # 現在のページは数字のみ（リンクにしない）
+                        st.markdown(f"<div style='text-align:center; color:white; font-size:18px; font-weight:bold; margin-top:5px;'>{label}</div>", unsafe_allow_html=True)
+                    elif 1 <= target <= num_pages and target != current:
+                        if st.button(label, key=key):
+                            st.session_state.page_num = target
+                            st.rerun(scope="fragment")
+                    st.markdown("</div>", unsafe_allow_html=True)
+
+            # ページ番号を直接指定して移動
+            with p_cols[-1]:
+                jump = st.number_input(f"ページへ移動 (全{num_pages}ページ)", 1, num_pages, current, step=1)
+                if jump != current:
+                    st.session_state.page_num = jump
+                    st.rerun(scope="fragment")
+
+            # 表示するページの行だけを取り出す
+            page_num = current
+            start_idx = (page_num - 1) * page_size
+            end_idx = min(start_idx + page_size, total_rows)
+            st.caption(f"{total_rows}行中 {start_idx + 1} 〜 {end_idx} 行目を表示しています")
+            st.dataframe(df.iloc[start_idx:end_idx], use_container_width=True)
+        else:
+            st.dataframe(df, use_container_width=True)
+
+# --- 画像の書き出し（形式を選んで押したときだけ別スレッドで描画し、グラフ本体は再実行しない） ---
+@st.fragment
+@fragment_stage("export")
+def show_export(df, stream, profile, chart_spec, render_key, preview_png):
+    exporter = get_exporter()
+    exports = st.session_state.setdefault("exports", {})  # ファイル名 -> 書き出しキャッシュのキー
+    c_fmt, c_dpi, c_btn = st.columns([1, 1, 2])
+    file_format = c_fmt.selectbox("形式", ["png", "svg", "pdf"], format_func=str.upper, key="export_format")
+    dpi = c_dpi.number_input("DPI", 72, 600, RENDER_DPI, step=50, key="export_dpi", disabled=file_format != "png")
+    key = export_key(render_key, file_format, dpi)
+    if preview_png is not None and file_format == "png" and dpi == RENDER_DPI and exporter.get(key) is None:
+        # 画面表示用のPNGと同じなので描き直さない
+        exporter.cache.put(key, preview_png)
+
+    data = exporter.get(key)
+    name = export_filename(chart_spec["title"], render_key, file_format)
+    if data is not None:
+        exports[name] = key
+        c_btn.download_button(f"📁 {file_format.upper()}をダウンロード", data, name, MIME_TYPES[file_format], on_click="ignore")
+    else:
+        future = exporter.pending(key)
+        error = exporter.failure(key) if future is None else None
+        if error is not None:
+            # 失敗は書き出し直すまで表示し続ける（待っている間に終わらなかった失敗も消えない）
+            st.error(f"書き出しに失敗しました: {error}")
+        label = "🔁 もう一度書き出す" if error is not None else f"📁 {file_format.upper()}で書き出す"
+        if future is None and c_btn.button(label):
+            future = exporter.submit(key, df, chart_spec, file_format, dpi, stream=stream, profile=profile)
+        if future is not None:
+            c_btn.caption("書き出し中…")
+            wait([future], timeout=0.5)
+            st.rerun(scope="fragment")
+
+    # このセッションで書き出したものをまとめてダウンロード（キャッシュから消えたものは除く）
+    files = {n: d for n, k in exports.items() if (d := exporter.get(k)) is not None}
+    if len(files) > 1:
+        names = tuple(sorted(files))
+        if st.session_state.get("export_zip", (None,))[0] != names:
+            st.session_state.export_zip = (names, zip_exports(files))
+        st.download_button(f"🗂️ すべてZIPでダウンロード（{len(files)}件）", st.session_state.export_zip[1],
+                           "graphs.zip", "application/zip", on_click="ignore")
+
+# --- グラフの見た目の設定（系列・軸・ラベル・サイズ・目盛）。データの選び方はサイドバー、見た目はグラフの上で変える ---
+def figure_settings(chart_type, x_axis, y_axes):
+    y_configs, y_axis_mapping, axis_configs = {}, {}, {}
+    series_chart = chart_type in ["折れ線グラフ", "散布図", "棒グラフ", "複合グラフ"]
+    tab_names = (["Series (系列)", "Axes (軸)"] if series_chart else []) + ["Labels (ラベル)", "Size (サイズ)", "Scale (範囲)", "Ticks & Grid (目盛)"]
+    tabs = st.tabs(tab_names)
+    if series_chart:
+        tab_series, tab_axes = tabs[0], tabs[1]
+        with tab_series:
+            for i, col in enumerate(y_axes):
+                st.write(f"**{col}**")
+                c_typ, c_col, c_siz, c_leg = st.columns([2, 1, 1, 1])
+
+                # プロットの種類
+                if chart_type == "複合グラフ":
+                    p_type = c_typ.selectbox("Type", ["Line", "Scatter", "Bar"], key=f"type_{col}")
+                else:
+                    p_type = "Line" if chart_type == "折れ線グラフ" else ("Scatter" if chart_type == "散布図" else "Bar")
+
+                # 色
+                p_color = c_col.color_picker("Color", DEFAULT_COLORS[i % len(DEFAULT_COLORS)], key=f"color_{col}")
+
+                # サイズ
+                if p_type == "Bar":
+                    p_size = c_siz.number_input("Width Scale", 0.1, 2.0, 1.0, step=0.1, format="%g", key=f"size_{col}")
+                else:
+                    p_size = c_siz.number_input("Size", 1.0, 50.0, 8.0 if p_type == "Scatter" else 3.0, step=1.0, format="%g", key=f"size_{col}")
+
+                # 凡例表示
+                p_leg = c_leg.checkbox("Legend", value=True, key=f"leg_{col}")
+
+                y_configs[col] = {"type": p_type, "color": p_color, "size": p_size, "show_legend": p_leg}
+
+        axis_configs = {0: {"name": y_axes[0] if y_axes else "", "unit": "", "min": None, "max": None, "label_size": 18, "tick_size": 14}}
+        with tab_axes:
+            active_ids = {0}
+            for col in y_axes:
+                y_axis_mapping[col] = st.number_input(f"Axis for {col} (0:左, 1:右, 2+:右オフセット)", 0, 5, 0, key=f"axis_{col}")
+                active_ids.add(y_axis_mapping[col])
+
+            st.divider()
+            for idx in sorted(list(active_ids)):
+                st.write(f"**Axis {idx} Config**")
+                c_n, c_u, c_mi, c_ma, c_fl, c_ft = st.columns(6)
+                a_name = c_n.text_input("Name", value=y_axes[0] if idx==0 and y_axes else "", key=f"aname_{idx}")
+                a_unit = c_u.text_input("Unit", key=f"aunit_{idx}")
+                a_min = c_mi.number_input("Min", value=None, step=1.0, format="%g", key=f"amin_{idx}")
+                a_max = c_ma.number_input("Max", value=None, step=1.0, format="%g", key=f"amax_{idx}")
+                a_font_l = c_fl.number_input("Label Size", 10, 40, 18, step=1, key=f"afont_l_{idx}")
+                a_font_t = c_ft.number_input("Tick Size", 8, 30, 14, step=1, key=f"afont_t_{idx}")
+
+                axis_configs[idx] = {"name": a_name, "unit": a_unit, "min": a_min, "max": a_max, "label_size": a_font_l, "tick_size": a_font_t}
+        tabs = tabs[2:]
+    tab_label, tab_size, tab_scale, tab_tick = tabs
+
+    with tab_label:
         default_title = f"{chart_type}"
         if y_axes:
             if chart_type in ["折れ線グラフ", "散布図", "棒グラフ"] and x_axis:
                 default_title = f"{', '.join(y_axes)} vs {x_axis}"
             else:
                 default_title = f"{chart_type}: {', '.join(y_axes)}"
-                
+
         chart_title = st.text_input("Graph Title", value=default_title)
-        
+
         c1, c2 = st.columns(2)
         x_name = c1.text_input("X Name", value=x_axis if x_axis else "")
         x_unit = c2.text_input("X Unit", placeholder="s, m, etc.")
-        
-        
-        st.subheader("Global Font Sizes")
+
+        st.write("**Global Font Sizes**")
         f1, f2, f3 = st.columns(3)
         font_title = f1.number_input("Title Size", 10, 50, 24, step=1)
         # Label/Tick sizes are now primarily handled per-axis in Axis Settings
         font_label_global = f2.number_input("Global Label Size", 10, 40, 18, step=1)
         font_tick_global = f3.number_input("Global Tick Size", 8, 30, 14, step=1)
 
-        # Global settings are now handled per-series
-
-        st.divider()
-        st.header("Graph Size")
-        s1, s2 = st.columns(2)
+    with tab_size:
+        s1, s2, s3 = st.columns(3)
         width_val = s1.number_input("Width", 5.0, 30.0, 10.0, step=1.0, format="%g")
         height_val = s2.number_input("Height", 3.0, 30.0, 6.0, step=1.0, format="%g")
-        
-        aspect_choice = st.selectbox("Aspect Ratio (Data)", ["auto", "equal", "custom"], index=0)
+
+        aspect_choice = s3.selectbox("Aspect Ratio (Data)", ["auto", "equal", "custom"], index=0)
         aspect_val = None
         if aspect_choice == "custom":
-            aspect_val = st.number_input("Custom Ratio (Height/Width)", value=1.0, step=0.1, format="%g")
+            aspect_val = s3.number_input("Custom Ratio (Height/Width)", value=1.0, step=0.1, format="%g")
         elif aspect_choice == "equal":
             aspect_val = "equal"
         else:
             aspect_val = "auto"
 
-        st.divider()
-        st.header("Scale Settings")
-        c_sc1, c_sc2 = st.columns(2)
+        downsample_on = st.checkbox("間引き描画（大量データを高速に表示）", value=True,
+                                    help=f"{DOWNSAMPLE_THRESHOLD}点を超える折れ線・散布図を、画面の解像度で見分けられる点だけに減らして描画します。")
+        scatter_style = "点"
+        if chart_type in ["散布図", "複合グラフ"]:
+            scatter_style = st.selectbox("Scatter Style (散布図の表示)", ["自動", "点", "密度"],
+                                         help=f"密度: 点を格子ごとに数えて色の濃さで表します。自動では{DENSITY_THRESHOLD}点を超えると密度表示にします。")
+
+    with tab_scale:
+        c_sc1, c_sc2, c_sc3, c_sc4 = st.columns(4)
         xmin_val = c_sc1.number_input("X Min (Auto if empty)", value=None, step=1.0, format="%g")
         xmax_val = c_sc2.number_input("X Max (Auto if empty)", value=None, step=1.0, format="%g")
-        
-        c_sc3, c_sc4 = st.columns(2)
         ymin_val = c_sc3.number_input("Y Min (Auto if empty)", value=None, step=1.0, format="%g")
         ymax_val = c_sc4.number_input("Y Max (Auto if empty)", value=None, step=1.0, format="%g")
 
-        st.divider()
-        st.header("Tick & Grid Details")
-        with st.expander("X-Axis Ticks"):
-            x_major_step = st.number_input("X Major Interval", value=None, step=1.0, format="%g", key="x_maj")
-            x_minor_step = st.number_input("X Minor Interval", value=None, step=1.0, format="%g", key="x_min")
-        with st.expander("Y-Axis Ticks"):
-            y_major_step = st.number_input("Y Major Interval", value=None, step=1.0, format="%g", key="y_maj")
-            y_minor_step = st.number_input("Y Minor Interval", value=None, step=1.0, format="%g", key="y_min")
-        with st.expander("Grid & Other"):
-            grid_major = st.checkbox("Show Major Grid", value=True)
-            grid_minor = st.checkbox("Show Minor Grid", value=False)
-            tick_dir = st.selectbox("Tick Direction (目盛の向き)", ["in", "out", "inout"], index=0)
+    with tab_tick:
+        c_tx, c_ty, c_gr = st.columns(3)
+        x_major_step = c_tx.number_input("X Major Interval", value=None, step=1.0, format="%g", key="x_maj")
+        x_minor_step = c_tx.number_input("X Minor Interval", value=None, step=1.0, format="%g", key="x_min")
+        y_major_step = c_ty.number_input("Y Major Interval", value=None, step=1.0, format="%g", key="y_maj")
+        y_minor_step = c_ty.number_input("Y Minor Interval", value=None, step=1.0, format="%g", key="y_min")
+        grid_major = c_gr.checkbox("Show Major Grid", value=True)
+        grid_minor = c_gr.checkbox("Show Minor Grid", value=False)
+        tick_dir = c_gr.selectbox("Tick Direction (目盛の向き)", ["in", "out", "inout"], index=0)
+
+    return {
+        "y_configs": y_configs, "y_axis_mapping": y_axis_mapping, "axis_configs": axis_configs,
+        "title": chart_title, "x_name": x_name, "x_unit": x_unit,
+        "fonts": [font_title, font_label_global, font_tick_global],
+        "size": [width_val, height_val], "aspect": aspect_val,
+        "downsample": downsample_on, "scatter_style": scatter_style,
+        "limits": [xmin_val, xmax_val, ymin_val, ymax_val],
+        "ticks": [x_major_step, x_minor_step, y_major_step, y_minor_step],
+        "grid": [grid_major, grid_minor, tick_dir],
+    }
+
+# --- グラフ本体（見た目の設定と描画だけを再実行する。サイドバー・データの詳細は動かさない） ---
+@st.fragment
+@fragment_stage("figure")
+def show_figure(df, stream, profile, data_key, upload, kind, render_mode, selection):
+    # 図を上に、見た目の設定をその下に置く（設定を先に読み取ってから図を描く）
+    figure_area = st.container()
+    with st.expander("🎨 グラフの見た目（変更するとグラフだけを描き直します）", expanded=True):
+        style = figure_settings(selection["chart_type"], selection["x_axis"], selection["y_axes"])
+    # サイドバーで選んだデータと、ここで決めた見た目をひとつのチャート仕様にまとめる（描画キャッシュのキー）
+    chart_spec = {**selection, **style}
+    render_key = chart_spec_key(data_key, chart_spec)
+    with figure_area:
+        if render_mode == "interactive":
+            # ブラウザで描画する（同じ設定のままなら送る表も作り直さない）
+            cached = st.session_state.get("interactive_chart")
+            if cached is None or cached[0] != render_key:
+                try:
+                    with telemetry.stage("interactive_chart"):
+                        cached = st.session_state.interactive_chart = (render_key, *interactive_chart(df, chart_spec, stream=stream, profile=profile))
+                    get_profile_cache().put(data_key, profile)
+                except Exception as e:
+                    cached = None
+                    st.error(f"グラフ生成中にエラーが発生しました: {e}")
+                    st.info("選択したデータが数値として正しく読み込めているか確認してください。")
+
+            if cached is not None:
+                _, data, vega, notices = cached
+                for level, message in notices:
+                    getattr(st, level)(message)
+                st.vega_lite_chart(data, vega, use_container_width=True)
+
+                # 保存する画像は matplotlib で作る
+                show_export(df, stream, profile, chart_spec, render_key, None)
+
+                with st.expander("Vega-Lite Spec"):
+                    st.json(vega)
+        else:
+            render_cache = get_render_cache()
+            rendered = render_cache.get(render_key)
+
+            if rendered is None:
+                try:
+                    png = None
+                    if RENDER_URL and stream is None and kind == "csv":
+                        from render_service import render_remote
+                        try:
+                            with telemetry.stage("render_remote"):
+                                png, code, notices = render_remote(RENDER_URL, chart_spec, {"path": spool_upload(upload)})
+                        except OSError:
+                            # サービスに繋がらない場合はこのプロセスで描画する
+                            png = None
+                    if png is None:
+                        # 前回の図を持ち続け、見た目だけの変更なら作り直さずに更新する
+                        from figure_model import FigureModel
+                        model = st.session_state.get("figure_model")
+                        if model is None:
+                            model = st.session_state.figure_model = FigureModel()
+                        with telemetry.stage("render"):
+                            png, code, notices = model.render(data_key, df, chart_spec, stream=stream, profile=profile)
+                    rendered = render_cache.put(render_key, {"png": png, "code": code, "notices": notices})
+                    # 描画で作り置きした列の配列の分を、列情報キャッシュの予算に反映する
+                    get_profile_cache().put(data_key, profile)
+                except Exception as e:
+                    st.error(f"グラフ生成中にエラーが発生しました: {e}")
+                    st.info("選択したデータが数値として正しく読み込めているか確認してください。")
+
+            if rendered is not None:
+                for level, message in rendered["notices"]:
+                    getattr(st, level)(message)
+
+                # 表示
+                st.image(rendered["png"], use_container_width=True)
+
+                # 保存とコード
+                show_export(df, stream, profile, chart_spec, render_key, rendered["png"])
+
+                with st.expander("Python Code"):
+                    if rendered["code"] is None and st.button("コードを作成", key="make_code"):
+                        # 図を更新しただけの場合は、コードを表示するときに作る
+                        from chart_builder import build_figure
+                        rendered["code"] = build_figure(df, chart_spec, stream=stream, profile=profile)[1]
+                        render_cache.put(render_key, rendered)
+                    if rendered["code"] is not None:
+                        st.code(rendered["code"], language='python')
 
 # --- メインエリア ---
 if df is not None:
     # データ情報の表示
-    with st.expander("📊 アップロードされたデータの詳細を確認", expanded=False):
-        st.subheader("データ概要")
-        # 各列の情報をまとめる
-        info_df = pd.DataFrame({
-            "列名": df.columns,
-            "データ型": [str(t) for t in df.dtypes],
-            "有効データ数": df.count().values,
-            "欠損数": df.isnull().sum().values
-        })
-        st.table(info_df)
-        
-        st.subheader("データの数値参照")
-        total_rows = len(df)
-        if total_rows > 50:
-            page_size = 50
-            num_pages = (total_rows - 1) // page_size + 1
-            
-            # セッション状態でのページ管理
-            if "page_num" not in st.session_state:
-                st.session_state.page_num = 1
-            
-            # --- ページ番号と「次へ」の配置 ---
-            cols_spec = [1] * num_pages + [2, 10]
-            p_cols = st.columns(cols_spec)
-            
-            for i in range(1, num_pages + 1):
-                with p_cols[i-1]:
-                    st.markdown("<div class='page-num-row'>", unsafe_allow_html=True)
-                    if i == st.session_state.page_num:
-                        # 現在のページは数字のみ（リンクにしない）
-                        st.markdown(f"<div style='text-align:center; color:white; font-size:18px; font-weight:bold; margin-top:5px;'>{i}</div>", unsafe_allow_html=True)
-                    else:
-                        if st.button(str(i), key=f"pg_{i}"):
-                            st.session_state.page_num = i
-                            st.rerun()
-                    st.markdown("</div>", unsafe_allow_html=True)
-            
-            # 「次へ」ボタン
-            with p_cols[num_pages]:
-                st.markdown("<div class='page-num-row'>", unsafe_allow_html=True)
-                if st.session_state.page_num < num_pages:
-                    if st.button("次へ >", key="pg_next"):
-                        st.session_state.page_num += 1
-                        st.rerun()
-                st.markdown("</div>", unsafe_allow_html=True)
-                
-            # 指定範囲のデータを表示
-            page_num = st.session_state.page_num
-            start_idx = (page_num - 1) * page_size
-            end_idx = min(start_idx + page_size, total_rows)
-            st.caption(f"{total_rows}行中 {start_idx + 1} 〜 {end_idx} 行目を表示しています")
-            st.dataframe(df.iloc[start_idx:end_idx], use_container_width=True)
-        else:
-            st.dataframe(df, use_container_width=True)
-    
+    telemetry.set_context(rows=profile.row_count, cols=len(profile.columns), bytes=uploaded_file.size,
+                          file_kind=kind, stream=stream is not None, chart_type=chart_type, render_mode=render_mode)
+    show_data_details(df, stream, profile, [c for c in [x_axis] + list(y_axes) if c is not None])
+
     if not y_axes:
         st.info("👈 サイドバーで描画するデータを選択してください。")
     else:
-        # グラフ作成
-        fig, ax = plt.subplots(figsize=(width_val, height_val), facecolor='white')
-        ax.set_facecolor('white')
-        
-        code_snippets = []
-        
-        # ラベル整形用関数
-        def fmt(n, u):
-            if n and u: return f"{n} ({u})"
-            return n if n else (f"({u})" if u else "")
-        
-        # データの数値チェックと集計
-        plot_df = df.copy()
-        if y_axes and chart_type in ["折れ線グラフ", "散布図", "棒グラフ", "複合グラフ", "円グラフ"]:
-            for col in y_axes:
-                if not pd.api.types.is_numeric_dtype(df[col]):
-                    st.warning(f"⚠️ '{col}' は数値データではないため、正しく表示されない可能性があります。数値の列を選択してください。")
-            
-            # カテゴリカルなX軸で重複がある場合、値を合計するオプション（自動適用）
-            if x_axis and not pd.api.types.is_numeric_dtype(df[x_axis]):
-                if df[x_axis].duplicated().any():
-                    st.info(f"💡 '{x_axis}' に重複があるため、値を合計して表示します。")
-                    plot_df = df.groupby(x_axis, sort=False)[y_axes].sum().reset_index()
-        
-        try:
-            if chart_type in ["折れ線グラフ", "散布図", "棒グラフ", "複合グラフ"]:
-                # X軸が数値かどうかを判定
-                is_numeric_x = pd.api.types.is_numeric_dtype(plot_df[x_axis])
-                
-                # 軸の初期化
-                axes = {0: ax}
-                
-                # 座標の決定
-                if is_numeric_x and chart_type != "棒グラフ":
-                    # 実数値ベース
-                    x_plot = plot_df[x_axis].values
-                    use_index_x = False
-                else:
-                    # カテゴリベース
-                    x_plot = np.arange(len(plot_df))
-                    use_index_x = True
-                
-                bar_cols = [c for c, conf in y_configs.items() if conf.get("type") == "Bar"]
-                if bar_cols:
-                    if not use_index_x and len(df) > 1:
-                        # 数値軸の場合、データの最小間隔に合わせて棒の幅を計算
-                        diffs = np.diff(np.sort(x_plot))
-                        min_diff = np.min(diffs[diffs > 0]) if any(diffs > 0) else 1.0
-                        total_width = min_diff * 0.8
-                    else:
-                        total_width = 0.8
-                    width = total_width / len(bar_cols)
-                
-                max_axis_idx = max(y_axis_mapping.values()) if y_axis_mapping else 0
-                for i in range(1, max_axis_idx+1):
-                    new_ax = ax.twinx()
-                    if i > 1:
-                        new_ax.spines["right"].set_position(("axes", 1.0 + (i-1)*0.15))
-                    axes[i] = new_ax
-                    code_snippets.append(f"ax{i} = ax.twinx()")
-                    if i > 1:
-                        code_snippets.append(f"ax{i}.spines['right'].set_position(('axes', {1.0 + (i-1)*0.15}))")
-
-                bar_count = 0
-                for col in y_axes:
-                    conf = y_configs[col]
-                    p_type = conf["type"]
-                    p_color = conf["color"]
-                    p_size = conf["size"]
-                    p_label = col if conf["show_legend"] else "_nolegend_"
-                    
-                    a_idx = y_axis_mapping.get(col, 0)
-                    target_ax = axes[a_idx]
-                    ax_prefix = f"ax{a_idx}" if a_idx > 0 else "ax"
-                    
-                    if p_type == "Line":
-                        target_ax.plot(x_plot, plot_df[col], marker='o', color=p_color, linewidth=p_size, markersize=p_size*2, label=p_label)
-                        code_snippets.append(f"{ax_prefix}.plot(x_plot, plot_df['{col}'], marker='o', color='{p_color}', linewidth={p_size}, markersize={p_size*2}, label='{p_label}')")
-                    elif p_type == "Scatter":
-                        target_ax.scatter(x_plot, plot_df[col], s=p_size*10, color=p_color, label=p_label, alpha=0.7)
-                        code_snippets.append(f"{ax_prefix}.scatter(x_plot, plot_df['{col}'], s={p_size*10}, color='{p_color}', label='{p_label}', alpha=0.7)")
-                    elif p_type == "Bar":
-                        current_width = width * p_size
-                        if len(bar_cols) > 0:
-                            offset = (bar_count - len(bar_cols)/2 + 0.5) * width
-                            target_ax.bar(x_plot + offset, plot_df[col], current_width, color=p_color, label=p_label)
-                            code_snippets.append(f"{ax_prefix}.bar(x_plot + {offset}, plot_df['{col}'], {current_width}, color='{p_color}', label='{p_label}')")
-                            bar_count += 1
-                        else:
-                            target_ax.bar(x_plot, plot_df[col], width=current_width, color=p_color, label=p_label)
-                            code_snippets.append(f"{ax_prefix}.bar(x_plot, plot_df['{col}'], width={current_width}, color='{p_color}', label='{p_label}')")
-                
-                if use_index_x:
-                    ax.set_xticks(x_plot)
-                    ax.set_xticklabels(plot_df[x_axis])
-                    code_snippets.insert(0, f"ax.set_xticks(x_plot)\nax.set_xticklabels(plot_df['{x_axis}'])")
-                
-                code_snippets.insert(0, f"import numpy as np\nx_plot = ... # values or arange\n")
-
-                # 各軸の個別設定を適用
-                for i, target_ax in axes.items():
-                    conf = axis_configs.get(i, {})
-                    a_name = conf.get("name", "")
-                    a_unit = conf.get("unit", "")
-                    a_min = conf.get("min")
-                    a_max = conf.get("max")
-                    a_label_fs = conf.get("label_size", font_label_global)
-                    a_tick_fs = conf.get("tick_size", font_tick_global)
-                    
-                    target_ax.set_ylabel(fmt(a_name, a_unit), fontsize=a_label_fs, color='black')
-                    target_ax.tick_params(axis='y', labelsize=a_tick_fs, colors='black')
-                    
-                    if a_min is not None: target_ax.set_ylim(bottom=a_min)
-                    if a_max is not None: target_ax.set_ylim(top=a_max)
-                    
-                    ax_prefix = f"ax{i}" if i > 0 else "ax"
-                    code_snippets.append(f"{ax_prefix}.set_ylabel('{fmt(a_name, a_unit)}', fontsize={a_label_fs})")
-                    code_snippets.append(f"{ax_prefix}.tick_params(axis='y', labelsize={a_tick_fs})")
-                    if a_min is not None: code_snippets.append(f"{ax_prefix}.set_ylim(bottom={a_min})")
-                    if a_max is not None: code_snippets.append(f"{ax_prefix}.set_ylim(top={a_max})")
-
-            elif chart_type == "ヒストグラム":
-                axes = {0: ax}
-                ax.hist([df[col].dropna() for col in y_axes], bins=hist_bins, label=y_axes, alpha=0.7)
-                code_snippets.append(f"ax.hist([df[col].dropna() for col in {y_axes}], bins={hist_bins}, label={y_axes}, alpha=0.7)")
-                
-            elif chart_type == "円グラフ":
-                axes = {0: ax}
-                val_col = y_axes[0]
-                ax.pie(plot_df[val_col], labels=plot_df[x_axis], autopct='%1.1f%%', startangle=90, counterclock=False)
-                code_snippets.append(f"ax.pie(plot_df['{val_col}'], labels=plot_df['{x_axis}'], autopct='%1.1f%%', startangle=90, counterclock=False)")
-                
-            elif chart_type == "箱ひげ図":
-                axes = {0: ax}
-                ax.boxplot([df[col].dropna() for col in y_axes], labels=y_axes)
-                code_snippets.append(f"ax.boxplot([df[col].dropna() for col in {y_axes}], labels={y_axes})")
-                
-            elif chart_type == "バイオリンプロット":
-                axes = {0: ax}
-                parts = ax.violinplot([df[col].dropna() for col in y_axes], showmeans=True)
-                ax.set_xticks(range(1, len(y_axes) + 1))
-                ax.set_xticklabels(y_axes)
-                code_snippets.append(f"ax.violinplot([df[col].dropna() for col in {y_axes}], showmeans=True)")
-
-
-            if chart_type != "円グラフ":
-                ax.set_xlabel(fmt(x_name, x_unit) or (x_axis if x_axis else ""), fontsize=font_label_global, color='black')
-            
-            ax.set_title(chart_title, fontsize=font_title, color='black', pad=20)
-            
-            if len(y_axes) > 1 and chart_type not in ["円グラフ", "ヒストグラム"]:
-                # 全ての軸から凡例情報を収集
-                h_all, l_all = [], []
-                for a_idx in sorted(axes.keys()):
-                    h, l = axes[a_idx].get_legend_handles_labels()
-                    h_all.extend(h)
-                    l_all.extend(l)
-                if h_all:
-                    ax.legend(h_all, l_all)
-            elif chart_type == "ヒストグラム":
-                ax.legend()
-                
-            ax.tick_params(labelsize=font_tick_global, colors='black')
-            
-            # --- 目盛・グリッドの詳細設定適用 ---
-            if chart_type not in ["円グラフ", "ヒストグラム", "箱ひげ図", "バイオリンプロット"]:
-                # 先に補助目盛を有効化（後から呼ぶとLocatorがリセットされるため）
-                if x_minor_step or y_minor_step or grid_minor:
-                    ax.minorticks_on()
-                
-                # 目盛間隔の設定
-                if x_major_step: ax.xaxis.set_major_locator(MultipleLocator(x_major_step))
-                if x_minor_step: ax.xaxis.set_minor_locator(MultipleLocator(x_minor_step))
-                if y_major_step: ax.yaxis.set_major_locator(MultipleLocator(y_major_step))
-                if y_minor_step: ax.yaxis.set_minor_locator(MultipleLocator(y_minor_step))
-                
-                # 目盛自体の見た目調整
-                ax.tick_params(which='major', labelsize=font_tick_global, colors='black', length=6, direction=tick_dir)
-                ax.tick_params(which='minor', colors='black', length=3, direction=tick_dir)
-                
-                # グリッド
-                if grid_major:
-                    ax.grid(True, which='major', linestyle='--', alpha=0.3, color='gray')
-                else:
-                    ax.grid(False, which='major')
-                if grid_minor:
-                    ax.grid(True, which='minor', linestyle=':', alpha=0.2, color='gray')
-                else:
-                    ax.grid(False, which='minor')
-
-            if chart_type in ["折れ線グラフ", "散布図", "棒グラフ", "複合グラフ", "ヒストグラム", "箱ひげ図", "バイオリンプロット"]:
-                if xmin_val is not None: ax.set_xlim(left=xmin_val)
-                if xmax_val is not None: ax.set_xlim(right=xmax_val)
-                if ymin_val is not None: ax.set_ylim(bottom=ymin_val)
-                if ymax_val is not None: ax.set_ylim(top=ymax_val)
-                ax.set_aspect(aspect_val)
-            
-            # 表示
-            st.pyplot(fig)
-            
-            # 保存とコード
-            cx1, cx2 = st.columns(2)
-            buf = io.BytesIO()
-            fig.savefig(buf, format="png", dpi=150, bbox_inches='tight')
-            cx1.download_button("📁 画像をダウンロード", buf.getvalue(), f"graph.png", "image/png")
-            
-            with st.expander("Python Code"):
-                # データの集計ロジックをコードにも追加
-                agg_snippet = ""
-                if x_axis and chart_type in ["折れ線グラフ", "散布図", "棒グラフ", "複合グラフ", "円グラフ"] and not pd.api.types.is_numeric_dtype(df[x_axis]):
-                    if df[x_axis].duplicated().any():
-                        agg_snippet = f"plot_df = df.groupby('{x_axis}', sort=False)[{y_axes}].sum().reset_index()"
-                    else:
-                        agg_snippet = "plot_df = df.copy()"
-                else:
-                    agg_snippet = "plot_df = df.copy()"
-
-                full_code = f"""import pandas as pd
-import matplotlib.pyplot as plt
-import japanize_matplotlib
-import numpy as np
-
-# データを読み込む
-df = pd.read_csv('data.csv')
-
-# 集計 (カテゴリカルなX軸で重複がある場合)
-{agg_snippet}
-
-fig, ax = plt.subplots(figsize=({width_val}, {height_val}))
-
-{chr(10).join(code_snippets)}
-
-ax.set_title('{chart_title}', fontsize={font_title})
-"""
-                if chart_type != "円グラフ":
-                    full_code += f"ax.set_xlabel('{fmt(x_name, x_unit)}', fontsize={font_label_global})\n"
-                
-                full_code += f"ax.tick_params(labelsize={font_tick_global})\n"
-                
-                # 凡例のコード生成
-                if len(y_axes) > 1 and chart_type not in ["円グラフ", "ヒストグラム"]:
-                    full_code += """
-# 全ての軸から凡例情報を収集
-lines_all, labels_all = [], []
-for i in range(6): # ax, ax1, ..., ax5 をチェック
-    ax_name = 'ax' if i == 0 else f'ax{i}'
-    if ax_name in locals():
-        target_ax = locals()[ax_name]
-        lns, lbs = target_ax.get_legend_handles_labels()
-        lines_all.extend(lns)
-        labels_all.extend(lbs)
-ax.legend(lines_all, labels_all)
-"""
-                elif chart_type == "ヒストグラム":
-                    full_code += "ax.legend()\n"
-                    full_code += "from matplotlib.ticker import MultipleLocator\n"
-                    if x_major_step: full_code += f"ax.xaxis.set_major_locator(MultipleLocator({x_major_step}))\n"
-                    if x_minor_step: full_code += f"ax.xaxis.set_minor_locator(MultipleLocator({x_minor_step}))\n"
-                    if y_major_step: full_code += f"ax.yaxis.set_major_locator(MultipleLocator({y_major_step}))\n"
-                    if y_minor_step: full_code += f"ax.yaxis.set_minor_locator(MultipleLocator({y_minor_step}))\n"
-                    
-                    if grid_major:
-                        full_code += "ax.grid(True, which='major', linestyle='--', alpha=0.3)\n"
-                    if grid_minor:
-                        full_code += "ax.minorticks_on()\n"
-                        full_code += "ax.grid(True, which='minor', linestyle=':', alpha=0.2)\n"
-                    
-                    full_code += f"ax.tick_params(which='both', direction='{tick_dir}')\n"
-
-                
-                # スケール設定をコードに追加
-                if chart_type in ["折れ線グラフ", "散布図", "棒グラフ", "複合グラフ", "ヒストグラム", "箱ひげ図", "バイオリンプロット"]:
-                    if xmin_val is not None: full_code += f"ax.set_xlim(left={xmin_val})\n"
-                    if xmax_val is not None: full_code += f"ax.set_xlim(right={xmax_val})\n"
-                    if ymin_val is not None: full_code += f"ax.set_ylim(bottom={ymin_val})\n"
-                    if ymax_val is not None: full_code += f"ax.set_ylim(top={ymax_val})\n"
-                    if aspect_val != 'auto':
-                        val_str = f"'{aspect_val}'" if isinstance(aspect_val, str) else aspect_val
-                        full_code += f"ax.set_aspect({val_str})\n"
-
-                full_code += "plt.show()"
-                
-                st.code(full_code, language='python')
-                
-        except Exception as e:
-            st.error(f"グラフ生成中にエラーが発生しました: {e}")
-            st.info("選択したデータが数値として正しく読み込めているか確認してください。")
+        # データの選び方（サイドバー）。見た目の設定はグラフと一緒に show_figure の中で読む
+        selection = {
+            "chart_type": chart_type, "x_axis": x_axis, "y_axes": y_axes, "hist_bins": hist_bins,
+            "reducer": reducer, "top_n": top_n,
+            "resample": resample, "time_window": time_window,
+            "facet": facet, "facet_share": facet_share, "facet_cols": facet_cols,
+        }
+        show_figure(df, stream, profile, data_key, uploaded_file, kind, render_mode, selection)
 
 else:
     # ファイル未アップロード時の表示
@@ -611,42 +699,44 @@ else:
     st.markdown("グラフの種類に合わせたサンプルCSVをダウンロードして、使い心地を確認できます。")
     
     col_s1, col_s2, col_s3 = st.columns(3)
-    
+    samples = get_sample_files()
+
     with col_s1:
         st.write("**実験・変化データ**")
         st.caption("折れ線グラフ・散布図向き")
-        # 120行の時系列データ
-        rows = 120
-        exp_df = pd.DataFrame({
-            "時間(s)": np.arange(rows) * 5,
-            "温度A(℃)": (20 + np.cumsum(np.random.normal(0.3, 0.5, rows))).round(1),
-            "温度B(℃)": (18 + np.cumsum(np.random.normal(0.2, 0.4, rows))).round(1)
-        })
-        st.download_button("🌡️ 実験データのDL", exp_df.to_csv(index=False).encode('utf-8-sig'), "sample_experiment.csv", "text/csv")
+        st.download_button("🌡️ 実験データのDL", samples["sample_experiment.csv"], "sample_experiment.csv", "text/csv", on_click="ignore")
 
     with col_s2:
         st.write("**分類・割合データ**")
         st.caption("棒グラフ・円グラフ向き")
-        # 120行の記録データ（項目を繰り返して日付風に）
-        items = ["食費", "光熱費", "通信費", "遊び", "その他"]
-        rows = 120
-        cat_df = pd.DataFrame({
-            "通番": np.arange(1, rows + 1),
-            "項目": [items[i % len(items)] for i in range(rows)],
-            "金額(円)": np.random.randint(100, 5000, rows),
-            "満足度": np.random.randint(1, 6, rows)
-        })
-        st.download_button("📊 分類データのDL", cat_df.to_csv(index=False).encode('utf-8-sig'), "sample_category.csv", "text/csv")
+        st.download_button("📊 分類データのDL", samples["sample_category.csv"], "sample_category.csv", "text/csv", on_click="ignore")
 
     with col_s3:
         st.write("**分布・統計データ**")
         st.caption("ヒスト（箱・バイオリン）向き")
-        # 120行の統計用データ
-        rows = 120
-        np.random.seed(42)
-        stat_df = pd.DataFrame({
-            "グループ1": np.random.normal(70, 10, rows),
-            "グループ2": np.random.normal(60, 15, rows),
-            "グループ3": np.random.normal(80, 5, rows)
-        }).round(1)
-        st.download_button("統計データのDL", stat_df.to_csv(index=False).encode('utf-8-sig'), "sample_stats.csv", "text/csv")
+        st.download_button("統計データのDL", samples["sample_stats.csv"], "sample_stats.csv", "text/csv", on_click="ignore")
+
+# --- 診断用パネル：この再実行の段階ごとの計測と、cProfile の記録 ---
+if recorder is not None:
+    telemetry.activate(None)
+    if profiler is not None:
+        st.session_state.cprofile = telemetry.finish_profile(profiler)
+    recorder.log()
+    recorder.close()
+    with (debug_panel or st.sidebar):
+        with st.expander("🛠 Debug（段階ごとの計測）", expanded=True):
+            st.radio("メモリの測り方", ["rss", "tracemalloc"], key="telemetry_memory", horizontal=True,
+                     help="rss: プロセスの常駐メモリの増減。tracemalloc: Pythonが確保した量（次の再実行から。計測が遅くなります）")
+            top = [r for r in recorder.records if r["depth"] == 0]
+            st.caption(f"最後のスクリプト全体の再実行: 合計 {sum(r.get('wall_ms', 0.0) for r in top):.0f} ms"
+                       f"（CPU {sum(r.get('cpu_ms', 0.0) for r in top):.0f} ms）。"
+                       "グラフの見た目の変更・ページ送り・書き出しはその部分だけを再実行するので、計測はその部分の下に出ます。")
+            st.dataframe(recorder.table(), hide_index=True, use_container_width=True)
+            if st.button("次の再実行を cProfile で記録", help="その部分だけの再実行（グラフの見た目の変更など）も記録します"):
+                st.session_state.profile_next_run = True
+            if st.session_state.get("profile_next_run"):
+                st.caption("次の操作で再実行される部分を cProfile で記録します")
+            if "cprofile" in st.session_state:
+                text, raw = st.session_state.cprofile
+                st.download_button("📄 cProfile の結果（.prof）", raw, "graphypad.prof", "application/octet-stream", on_click="ignore")
+                st.code(text)
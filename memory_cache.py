@@ -0,0 +1,61 @@
+import threading
+from collections import OrderedDict
+
+
+# --- 件数とメモリ量の両方に上限を持つLRUキャッシュ ---
+class BudgetedLRU:
+    def __init__(self, max_entries=8, max_bytes=1024 ** 3):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def sizeof(self, value):
+        # サブクラスで値の大きさの測り方を決める
+        return len(value)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        nbytes = self.sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)[1]
+            # 予算を超える単体の値はキャッシュしない（呼び出し側にはそのまま返す）
+            if nbytes > self.max_bytes:
+                return value
+            self._entries[key] = (value, nbytes)
+            self._total_bytes += nbytes
+            self._evict()
+        return value
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self._total_bytes -= nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,216 @@
+import sys
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from aggregation import GroupIndex, group_stats
+from column_stats import ColumnStats
+from memory_cache import BudgetedLRU
+
+# 列数がこれを超える場合は、選ばれた列から順に集計する
+LAZY_PROFILE_COLUMNS = 50
+
+
+def datetime_days(s):
+    # 日時を1970-01-01からの日数（float、欠損はNaN）にする。タイムゾーン付きはUTCにそろえる
+    if getattr(s.dt, "tz", None) is not None:
+        s = s.dt.tz_convert(None)
+    stamps = s.to_numpy(dtype="datetime64[ns]")
+    days = stamps.astype(np.int64) / 86_400e9
+    days[np.isnat(stamps)] = np.nan
+    return days
+
+
+def timestamp_days(value):
+    ts = pd.Timestamp(value)
+    if ts.tz is not None:
+        ts = ts.tz_convert(None)
+    return ts.value / 86_400e9
+
+
+# --- データセットごとの列情報（型は読み込み時に1回、集計は列ごとに必要になった時に1回） ---
+class ColumnProfile:
+    def __init__(self, df, stream=None):
+        self._source = None
+        self._arrays = {}  # 描画用の配列（列ごと）
+        self._views = set()  # そのうちデータ本体を参照しているだけの列（大きさに数えない）
+        self.bind(df, stream)
+        if stream is not None:
+            self.columns = list(stream.columns)
+            self.dtypes = dict(zip(stream.columns, stream.dtypes))
+            self.row_count = stream.row_count
+        else:
+            self.columns = list(df.columns)
+            self.dtypes = dict(zip(df.columns, df.dtypes))
+            self.row_count = len(df)
+        self.numeric = {c: pd.api.types.is_numeric_dtype(t) for c, t in self.dtypes.items()}
+        self.datetime = {c: pd.api.types.is_datetime64_any_dtype(t) for c, t in self.dtypes.items()}
+        self.lazy = len(self.columns) > LAZY_PROFILE_COLUMNS
+        self._stats = {}
+        self._groups = {}  # X列ごとのグループ分けと、(X列, 列) ごとの集計値
+        self._summaries = {}  # 列ごとの分布の要約（ColumnStats）
+        self._sorted = {}
+
+    def bind(self, df, stream=None):
+        # データ本体は弱参照で持つ（パース結果のキャッシュから消えたら一緒に解放されるように）
+        self._is_stream = stream is not None
+        self._source = weakref.ref(stream if stream is not None else df)
+        # 前のデータ本体を参照している配列は捨てる（残すと、解放されたはずのデータを大きさに数えないまま持ち続ける）
+        for col in self._views:
+            self._arrays.pop(col, None)
+        self._views.clear()
+
+    def numeric_cols(self, exclude=None):
+        return [c for c in self.columns if self.numeric[c] and c != exclude]
+
+    def other_cols(self, exclude=None):
+        return [c for c in self.columns if not self.numeric[c] and c != exclude]
+
+    def is_numeric(self, col):
+        return self.numeric[col]
+
+    def is_datetime(self, col):
+        return self.datetime[col]
+
+    def _frame(self):
+        source = self._source()
+        return source.sample if self._is_stream else source
+
+    def values(self, col):
+        # 描画用の連続したfloat64配列（欠損はNaN）。列ごとに1回だけ作り、読み取り専用で使い回す
+        # float64の列はデータ本体のメモリをそのまま参照する（コピーしない）。整数・日時・文字列の列は
+        # float64に変換したコピーを1つ作り、プロファイルと一緒にキャッシュする（1行あたり8バイト）
+        arr = self._arrays.get(col)
+        if arr is None:
+            s = self._frame()[col]
+            if self.datetime[col]:
+                arr = datetime_days(s)
+            else:
+                if not self.numeric[col]:
+                    s = pd.to_numeric(s, errors="coerce")  # 数値でない列は数値に読めるものだけを使う
+                arr = np.ascontiguousarray(s.to_numpy(dtype=float, na_value=np.nan))
+                if self.numeric[col] and np.may_share_memory(arr, s.to_numpy()):
+                    self._views.add(col)
+            arr.flags.writeable = False
+            self._arrays[col] = arr
+        return arr
+
+    def is_sorted(self, col):
+        # 値が昇順に並んでいるか（日時の範囲を二分探索で切り出せるか）
+        if col not in self._sorted:
+            values = self.values(col)
+            self._sorted[col] = not np.isnan(values).any() and bool(np.all(values[1:] >= values[:-1]))
+        return self._sorted[col]
+
+    def finite(self, col):
+        # 欠損を除いて昇順に並べた値（ヒストグラム・箱ひげ図・バイオリンプロット用。並び順は描画に関係しない）
+        # 元の列とは別のコピーで、列ごとに1つキャッシュに残る（分位点・度数を描き直しのたびに並べ替えないため）
+        key = (col, "finite")
+        arr = self._arrays.get(key)
+        if arr is None:
+            values = self.values(col)
+            arr = np.sort(values[~np.isnan(values)])
+            arr.flags.writeable = False
+            self._arrays[key] = arr
+        return arr
+
+    def column_stats(self, col):
+        # 度数・分位点・KDEは列ごとに1回だけ求める（階級数を変えても生データは読み直さない）
+        stats = self._summaries.get(col)
+        if stats is None:
+            stats = self._summaries[col] = ColumnStats(self.finite(col))
+        return stats
+
+    def group_index(self, x_col):
+        index = self._groups.get(x_col)
+        if index is None:
+            index = self._groups[x_col] = GroupIndex(self._frame()[x_col])
+        return index
+
+    def group_stats(self, x_col, col):
+        # 合計・平均・中央値など全種類の集計値をまとめて1回だけ求める（集計方法を変えても再計算しない）
+        key = (x_col, col)
+        stats = self._groups.get(key)
+        if stats is None:
+            stats = self._groups[key] = group_stats(self.group_index(x_col), self.values(col))
+        return stats
+
+    def _compute(self, col):
+        source = self._source()
+        if self._is_stream:
+            # 大容量モードでは読み込み時に数えた全行分の値を使う
+            non_null = source.non_null[col]
+            summary = source.summaries.get(col)
+            groups = source.group_counts.get(col)
+            return {
+                "non_null": non_null,
+                "nulls": self.row_count - non_null,
+                "min": summary.min if summary is not None and summary.count else None,
+                "max": summary.max if summary is not None and summary.count else None,
+                "unique": len(groups) if groups is not None else None,
+            }
+        s = source[col]
+        non_null = int(s.count())
+        stats = {"non_null": non_null, "nulls": self.row_count - non_null, "min": None, "max": None,
+                 "unique": int(s.nunique())}
+        if (self.numeric[col] or self.datetime[col]) and non_null:
+            stats["min"], stats["max"] = s.min(), s.max()
+        return stats
+
+    def stats(self, col):
+        if col not in self._stats:
+            self._stats[col] = self._compute(col)
+        return self._stats[col]
+
+    def compute_all(self):
+        for col in self.columns:
+            self.stats(col)
+
+    @property
+    def complete(self):
+        return len(self._stats) == len(self.columns)
+
+    def has_duplicates(self, col):
+        stats = self.stats(col)
+        if stats["unique"] is None:
+            # 種類が多すぎて集計していない列は、間引いたデータで判定する
+            return bool(self._source().sample[col].duplicated().any())
+        # 欠損値は2つ以上あれば重複とみなす（DataFrame.duplicated と同じ扱い）
+        return stats["unique"] + min(stats["nulls"], 1) < self.row_count
+
+    def table(self):
+        # 未集計の列は空欄にする（lazy の場合）
+        rows = [self._stats.get(c, {}) for c in self.columns]
+        return pd.DataFrame({
+            "列名": self.columns,
+            "データ型": [str(self.dtypes[c]) for c in self.columns],
+            "有効データ数": pd.array([r.get("non_null") for r in rows], dtype="Int64"),
+            "欠損数": pd.array([r.get("nulls") for r in rows], dtype="Int64"),
+            "最小値": [r.get("min") for r in rows],
+            "最大値": [r.get("max") for r in rows],
+            "種類数": pd.array([r.get("unique") for r in rows], dtype="Int64"),
+        })
+
+    def nbytes(self):
+        # キャッシュの予算管理用のおおよその大きさ（データ本体と、それを参照するだけの配列は含めない）
+        return (sys.getsizeof(self._stats) + len(self.columns) * 512
+                + sum(arr.nbytes for key, arr in list(self._arrays.items()) if key not in self._views)
+                + sum(g.nbytes() if isinstance(g, GroupIndex) else sum(a.nbytes for a in g.values())
+                      for g in list(self._groups.values()))
+                + sum(stats.nbytes() for stats in list(self._summaries.values())))
+
+
+# --- 列情報のキャッシュ（データセットのキーごと） ---
+class ProfileCache(BudgetedLRU):
+    def sizeof(self, value):
+        return value.nbytes()
+
+    def get_or_build(self, key, df, stream=None):
+        profile = self.get(key)
+        if profile is None:
+            profile = self.put(key, ColumnProfile(df, stream))
+        elif profile._source() is None:
+            # 同じキーなら中身も同じなので、今のデータに付け替える
+            profile.bind(df, stream)
+        return profile
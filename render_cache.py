@@ -0,0 +1,17 @@
+import hashlib
+import json
+
+from memory_cache import BudgetedLRU
+
+
+# --- グラフ設定（チャート仕様）とデータの指紋から描画キャッシュのキーを作る ---
+def chart_spec_key(data_key, spec):
+    payload = json.dumps(spec, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.blake2b(f"{data_key}\n{payload}".encode("utf-8"), digest_size=20).hexdigest()
+
+
+# --- 描画済みPNGのキャッシュ ---
+# 値は {"png": bytes, "code": str, "notices": [(level, message), ...]}（code は作り直さずに更新した図では None）
+class RenderCache(BudgetedLRU):
+    def sizeof(self, value):
+        return len(value["png"]) + len((value["code"] or "").encode("utf-8"))
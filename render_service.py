@@ -0,0 +1,252 @@
+import argparse
+import base64
+import io
+import json
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from exporter import MIME_TYPES
+
+# --- 常駐の描画サービス ---
+# 重いimport（pandas・matplotlib・日本語フォント）を済ませたワーカープロセスを用意しておき、
+# チャート仕様とデータの場所を受け取って画像のバイト列を返す。
+#   POST /render  {"spec": {...}, "data": {"path": "..."} または {"csv": "..."}, "format": "png", "dpi": 150}
+#   GET  /health  ワーカー数・待ち数・処理件数など
+# Accept: application/json の場合は {"image": base64, "code", "notices", "elapsed"} を返す。
+# "path" で読めるのはデータ置き場（--data-root。既定は画面がアップロードを書き出す一時フォルダ）の中のファイルだけ。
+SPOOL_DIR = os.path.join(tempfile.gettempdir(), "graphypad")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class RenderTimeout(Exception):
+    pass
+
+
+def resolve_data_path(path, data_root):
+    # データ置き場の中を指す実際のパスを返す（シンボリックリンク・".." で外に出るものは断る）
+    root = os.path.realpath(data_root)
+    real = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([real, root]) != root:
+        raise PermissionError(f"データ置き場の外のファイルは読めません: {path}")
+    return real
+
+
+# --- ワーカープロセス側 ---
+def _warm_up():
+    # import と日本語フォントの読み込みを、最初の依頼が来る前に済ませておく
+    import pandas as pd
+    from chart_builder import render_figure
+    render_figure(pd.DataFrame({"時間": [0, 1], "値": [0, 1]}),
+                  {"chart_type": "折れ線グラフ", "x_axis": "時間", "y_axes": ["値"], "title": "準備"})
+
+
+def _handle(request, cache):
+    from chart_builder import render_figure
+    from data_loader import load_path, parse_csv
+    data = request["data"]
+    if "path" in data:
+        df = load_path(data["path"], cache)
+    else:
+        df = parse_csv(data["csv"].encode("utf-8"))
+    start = time.perf_counter()
+    image, code, notices = render_figure(df, request["spec"], file_format=request.get("format", "png"),
+                                         dpi=request.get("dpi", 150))
+    return {"image": image, "code": code, "notices": notices, "elapsed": time.perf_counter() - start}
+
+
+def _worker_main(conn, cache_bytes):
+    from data_loader import ParseCache
+    _warm_up()
+    cache = ParseCache(max_entries=4, max_bytes=cache_bytes)
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        try:
+            conn.send({"ok": True, **_handle(request, cache)})
+        except Exception as e:
+            conn.send({"ok": False, "error": f"{type(e).__name__}: {e}"})
+
+
+# --- 親プロセス側：ワーカーの管理（待ち行列・時間制限・入れ替え） ---
+class RenderWorker:
+    def __init__(self, ctx, cache_bytes):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child, cache_bytes), daemon=True)
+        self.process.start()
+        child.close()
+        self.jobs = 0
+
+    def stop(self, kill=False):
+        try:
+            if kill:
+                self.process.kill()
+            else:
+                self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+class RenderPool:
+    def __init__(self, workers=2, timeout=60.0, max_jobs=200, max_queue=32, cache_bytes=512 * 1024 ** 2):
+        # spawn で起動する（HTTPサーバーのスレッドごとforkしないように）
+        self._ctx = multiprocessing.get_context("spawn")
+        self.timeout = timeout
+        self.max_jobs = max_jobs
+        self.cache_bytes = cache_bytes
+        self.size = workers
+        self._idle = queue.Queue()
+        # 実行中 + 待ちの合計がこれを超えたら受け付けない
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self.stats = {"served": 0, "failed": 0, "timeouts": 0, "recycled": 0, "rejected": 0, "waiting": 0}
+        for _ in range(workers):
+            self._idle.put(RenderWorker(self._ctx, cache_bytes))
+
+    def _count(self, name, delta=1):
+        with self._lock:
+            self.stats[name] += delta
+
+    def render(self, request):
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            raise QueueFull("描画の待ちが多すぎます")
+        try:
+            self._count("waiting")
+            worker = self._idle.get()
+            self._count("waiting", -1)
+            try:
+                worker.conn.send(request)
+                if not worker.conn.poll(self.timeout):
+                    # 時間切れのワーカーは止めて新しいものと入れ替える
+                    worker.stop(kill=True)
+                    worker = RenderWorker(self._ctx, self.cache_bytes)
+                    self._count("timeouts")
+                    raise RenderTimeout(f"{self.timeout}秒以内に描画が終わりませんでした")
+                result = worker.conn.recv()
+                worker.jobs += 1
+                if worker.jobs >= self.max_jobs:
+                    # メモリの断片化やキャッシュの肥大を避けるため、一定件数ごとに入れ替える
+                    worker.stop()
+                    worker = RenderWorker(self._ctx, self.cache_bytes)
+                    self._count("recycled")
+            except (EOFError, BrokenPipeError, OSError):
+                worker.stop(kill=True)
+                worker = RenderWorker(self._ctx, self.cache_bytes)
+                raise
+            finally:
+                self._idle.put(worker)
+        finally:
+            self._slots.release()
+        self._count("served" if result["ok"] else "failed")
+        if not result["ok"]:
+            raise ValueError(result["error"])
+        return result
+
+    def close(self):
+        for _ in range(self.size):
+            self._idle.get().stop()
+
+
+# --- HTTPの入り口 ---
+class RenderHandler(BaseHTTPRequestHandler):
+    pool = None
+
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, obj):
+        self._send(status, json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8"))
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._send_json(404, {"error": "not found"})
+        self._send_json(200, {"workers": self.pool.size, "idle": self.pool._idle.qsize(), **self.pool.stats})
+
+    def do_POST(self):
+        if self.path != "/render":
+            return self._send_json(404, {"error": "not found"})
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            file_format = request.setdefault("format", "png")
+            if file_format not in MIME_TYPES:
+                return self._send_json(400, {"error": f"unsupported format: {file_format}"})
+            data = request.get("data")
+            if not isinstance(data, dict) or not ("path" in data or "csv" in data):
+                return self._send_json(400, {"error": "data must be {\"path\": ...} or {\"csv\": ...}"})
+            if "path" in data:
+                data["path"] = resolve_data_path(str(data["path"]), self.data_root)
+            result = self.pool.render(request)
+        except PermissionError as e:
+            return self._send_json(403, {"error": str(e)})
+        except QueueFull as e:
+            return self._send_json(503, {"error": str(e)})
+        except RenderTimeout as e:
+            return self._send_json(504, {"error": str(e)})
+        except Exception as e:
+            return self._send_json(400, {"error": str(e)})
+        if "application/json" in self.headers.get("Accept", ""):
+            return self._send_json(200, {"image": base64.b64encode(result["image"]).decode("ascii"),
+                                         "code": result["code"], "notices": result["notices"],
+                                         "elapsed": result["elapsed"]})
+        self._send(200, result["image"], MIME_TYPES[file_format])
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host="127.0.0.1", port=8765, data_root=SPOOL_DIR, **pool_options):
+    RenderHandler.data_root = data_root
+    RenderHandler.pool = RenderPool(**pool_options)
+    server = ThreadingHTTPServer((host, port), RenderHandler)
+    try:
+        server.serve_forever()
+    finally:
+        RenderHandler.pool.close()
+
+
+# --- クライアント（Streamlit画面やバッチから使う） ---
+def render_remote(url, spec, data, file_format="png", dpi=150, timeout=120):
+    # data は {"path": サービスのデータ置き場の中のデータファイル（CSV・Parquet・Arrow・Excel）のパス} または {"csv": CSVの文字列}
+    body = json.dumps({"spec": spec, "data": data, "format": file_format, "dpi": dpi},
+                      ensure_ascii=False, default=str).encode("utf-8")
+    req = urllib.request.Request(url.rstrip("/") + "/render", data=body, method="POST",
+                                 headers={"Content-Type": "application/json", "Accept": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as res:
+        result = json.load(io.TextIOWrapper(res, encoding="utf-8"))
+    return base64.b64decode(result["image"]), result["code"], [tuple(n) for n in result["notices"]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="GraphyPad の常駐描画サービス")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=60.0, help="1件あたりの描画時間の上限（秒）")
+    parser.add_argument("--max-jobs", type=int, default=200, help="ワーカーを入れ替えるまでの処理件数")
+    parser.add_argument("--max-queue", type=int, default=32, help="待たせておける依頼の数")
+    parser.add_argument("--data-root", default=SPOOL_DIR, help="\"path\" で読んでよいフォルダ（この外のファイルは断る）")
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, data_root=args.data_root, workers=args.workers, timeout=args.timeout,
+          max_jobs=args.max_jobs, max_queue=args.max_queue)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# --- 起動時間（import時間）のレポート ---
+# 新しいPythonプロセスで `-X importtime` を使い、画面の段階ごとに何の読み込みに時間がかかっているかを表示する。
+#   landing: ファイル未アップロードの画面で main.py が読み込むもの
+#   chart:   最初のグラフを描くときに追加で読み込むもの（matplotlib・日本語フォント）
+STAGES = {
+    "landing": ["streamlit", "data_loader", "render_cache", "profiling", "streaming", "downsample", "chart_spec", "exporter", "dataset_store", "columnar", "interactive", "telemetry"],
+    "chart": ["chart_builder", "figure_model", "facets"],
+}
+
+
+def import_times(modules, preloaded=()):
+    # preloaded は先に読み込んでおき、その段階で増えた分だけを測る
+    code = "".join(f"import {m}\n" for m in preloaded)
+    code += "import sys\nprint('--- start ---', file=sys.stderr, flush=True)\n"
+    code += "".join(f"import {m}\n" for m in modules)
+    # -c のコードは作業ディレクトリから読み込むので、どこから実行してもアプリのモジュールが見つかるようにする
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          capture_output=True, text=True, check=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
+    times = []
+    started = False
+    for line in proc.stderr.splitlines():
+        if line == "--- start ---":
+            started = True
+        elif started and line.startswith("import time:") and "|" in line:
+            # "import time: self [us] | cumulative | imported package"
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            if self_us.strip().isdigit():
+                times.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    return times
+
+
+def print_stage(name, times, top, out=sys.stdout):
+    # 最上位（インデントなし）のimportの累積時間の合計が、その段階の所要時間
+    total = sum(cumulative for module, _, cumulative in times if not module.startswith("  "))
+    print(f"[{name}] {total / 1e6:.2f}s, {len(times)} modules", file=out)
+    for module, self_us, _ in sorted(times, key=lambda t: -t[1])[:top]:
+        print(f"  {self_us / 1e3:>8.1f}ms  {module.strip()}", file=out)
+    return total / 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="GraphyPad の起動時のimport時間を段階ごとに表示します。")
+    parser.add_argument("--top", type=int, default=10, help="段階ごとに表示する遅いモジュールの数")
+    parser.add_argument("--budget", type=float, default=None, help="landing段階の目標時間（秒）。超えたら終了コード1")
+    args = parser.parse_args(argv)
+
+    preloaded = []
+    totals = {}
+    for name, modules in STAGES.items():
+        totals[name] = print_stage(name, import_times(modules, preloaded), args.top)
+        preloaded += modules
+    if args.budget is not None and totals["landing"] > args.budget:
+        print(f"landing stage took {totals['landing']:.2f}s, over the {args.budget:.2f}s budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from column_stats import gaussian_smooth, histogram_edges, scott_bandwidth
+from data_loader import SNIFF_BYTES, sniff_csv
+from downsample import bucket_extremes
+
+# --- 大容量ファイル用のチャンク読み込み ---
+# 全行をDataFrameとして保持せず、グラフの種類ごとに必要な集計だけを残す
+CHUNK_ROWS = 200_000
+FINE_BINS = 4096
+SAMPLE_SIZE = 4096
+MAX_SERIES_POINTS = 200_000
+MAX_GROUPS = 10_000
+STREAM_THRESHOLD_BYTES = 100 * 1024 ** 2
+
+
+# --- 範囲が自動で広がる細かいヒストグラム（階級数の変更や分位点の計算に使う） ---
+class FineHistogram:
+    def __init__(self, n_bins=FINE_BINS):
+        self.n_bins = n_bins
+        self.counts = np.zeros(n_bins, dtype=np.int64)
+        self.lo = None
+        self.width = None
+
+    @property
+    def hi(self):
+        return self.lo + self.n_bins * self.width
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    def edges(self):
+        return self.lo + np.arange(self.n_bins + 1) * self.width
+
+    def _grow(self, vmin, vmax):
+        # 範囲を2倍にして隣り合う階級をまとめる（値の範囲に収まるまで繰り返す）
+        while vmin < self.lo or vmax >= self.hi:
+            doubled = np.zeros(self.n_bins * 2, dtype=np.int64)
+            if vmin < self.lo:
+                doubled[self.n_bins:] = self.counts
+                self.lo -= self.n_bins * self.width
+            else:
+                doubled[:self.n_bins] = self.counts
+            self.counts = doubled.reshape(-1, 2).sum(axis=1)
+            self.width *= 2
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if not values.size:
+            return
+        vmin, vmax = float(values.min()), float(values.max())
+        if self.lo is None:
+            span = vmax - vmin
+            self.lo = vmin
+            self.width = span / (self.n_bins - 1) if span > 0 else max(abs(vmin), 1.0) / self.n_bins
+        self._grow(vmin, vmax)
+        idx = ((values - self.lo) / self.width).astype(np.int64)
+        np.clip(idx, 0, self.n_bins - 1, out=idx)
+        self.counts += np.bincount(idx, minlength=self.n_bins)
+
+    def merge(self, other):
+        if other.lo is None:
+            return
+        if self.lo is None:
+            self.lo, self.width, self.counts = other.lo, other.width, other.counts.copy()
+            return
+        self._grow(other.lo, other.hi - other.width * 1e-9)
+        self.counts += np.round(other.rebin(self.edges())).astype(np.int64)
+
+    def _cdf(self):
+        return np.concatenate([[0], np.cumsum(self.counts)]).astype(float)
+
+    def rebin(self, edges):
+        # 細かい階級内では一様分布とみなして、累積度数を線形補間する
+        if self.lo is None:
+            return np.zeros(len(edges) - 1)
+        return np.diff(np.interp(edges, self.edges(), self._cdf()))
+
+    def quantile(self, q):
+        q = np.atleast_1d(np.asarray(q, dtype=float))
+        if self.lo is None:
+            return np.full(q.shape, np.nan)
+        cdf = self._cdf()
+        target = q * cdf[-1]
+        idx = np.clip(np.searchsorted(cdf, target, side="left"), 1, self.n_bins)
+        below = cdf[idx - 1]
+        in_bin = np.maximum(self.counts[idx - 1], 1)
+        return self.lo + (idx - 1 + np.clip((target - below) / in_bin, 0, 1)) * self.width
+
+
+# --- 1列分の要約（件数・合計・最小最大・ヒストグラム・無作為標本） ---
+class ColumnSummary:
+    def __init__(self, sample_size=SAMPLE_SIZE, seed=0):
+        self.count = 0
+        self.nulls = 0
+        # 平均と偏差の二乗和はチャンクごとに求めて統合する（二乗の合計から引くと、
+        # 日時の数値や1e9前後の値のように散らばりより桁の大きいデータで精度がなくなる）
+        self.mean = np.nan
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.hist = FineHistogram()
+        self.sample_size = sample_size
+        self._rng = np.random.default_rng(seed)
+        self._sample_keys = np.empty(0)
+        self.sample = np.empty(0)
+
+    def update(self, series):
+        values = pd.to_numeric(series, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        finite = values[np.isfinite(values)]
+        self.nulls += int(values.size - finite.size)
+        if not finite.size:
+            return
+        n_a, n_b = self.count, int(finite.size)
+        mean_b = float(finite.mean())
+        m2_b = float(np.square(finite - mean_b).sum())
+        if n_a == 0:
+            self.mean, self.m2 = mean_b, m2_b
+        else:
+            delta = mean_b - self.mean
+            self.mean += delta * n_b / (n_a + n_b)
+            self.m2 += m2_b + delta ** 2 * n_a * n_b / (n_a + n_b)
+        self.count = n_a + n_b
+        self.min = min(self.min, float(finite.min()))
+        self.max = max(self.max, float(finite.max()))
+        self.hist.update(finite)
+        # 乱数キーの小さい順にk個残す（チャンク同士でもそのまま統合できる）
+        keys = np.concatenate([self._sample_keys, self._rng.random(finite.size)])
+        vals = np.concatenate([self.sample, finite])
+        if keys.size > self.sample_size:
+            keep = np.argpartition(keys, self.sample_size)[:self.sample_size]
+            keys, vals = keys[keep], vals[keep]
+        self._sample_keys, self.sample = keys, vals
+
+    @property
+    def std(self):
+        if self.count < 2:
+            return 0.0
+        return float(np.sqrt(self.m2 / (self.count - 1)))
+
+    def box_stats(self, label, whis=1.5):
+        # ax.bxp にそのまま渡せる形式
+        q1, med, q3 = self.hist.quantile([0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        whislo = max(self.min, q1 - whis * iqr)
+        whishi = min(self.max, q3 + whis * iqr)
+        fliers = self.sample[(self.sample < whislo) | (self.sample > whishi)]
+        if self.min < whislo:
+            fliers = np.append(fliers, self.min)
+        if self.max > whishi:
+            fliers = np.append(fliers, self.max)
+        return {"label": label, "med": med, "q1": q1, "q3": q3, "whislo": whislo, "whishi": whishi,
+                "mean": self.mean, "fliers": fliers}
+
+    def violin_stats(self, points=100):
+        # ax.violin にそのまま渡せる形式（細かいヒストグラムをガウス核で平滑化。帯域幅は全データを読む場合と同じ）
+        coords = np.linspace(self.min, self.max, points)
+        width = self.hist.width
+        bandwidth = scott_bandwidth(self.std, self.count) if self.count > 1 else width
+        smooth = gaussian_smooth(self.hist.counts.astype(float), max(bandwidth / width, 1.0))
+        centers = self.hist.edges()[:-1] + width / 2
+        density = np.interp(coords, centers, smooth) / max(self.count * width, 1e-300)
+        median = float(self.hist.quantile(0.5)[0])
+        return {"coords": coords, "vals": density, "mean": self.mean, "median": median,
+                "min": self.min, "max": self.max}
+
+
+# --- 間引いた行の保持（上限を超えたら間隔を2倍にする） ---
+# stride 行ごとの区間から、先頭の行に加えて数値列ごとの最小・最大の行も残す（一定間隔で選ぶだけだと山や谷が消える）。
+# 区間を2つ合わせた区間の最小・最大は、元の2つの区間で残した行のどれかなので、間隔を広げても選び直せる。
+class StrideSample:
+    def __init__(self, max_rows=MAX_SERIES_POINTS):
+        self.max_rows = max_rows
+        self.stride = 1
+        self.frame = None
+
+    def _reduce(self, frame, numeric_cols):
+        positions = frame.index.to_numpy()
+        keep = positions % self.stride == 0
+        if self.stride > 1:
+            bucket = positions // self.stride
+            for c in numeric_cols:
+                values = frame[c].to_numpy(dtype=float, na_value=np.nan)
+                rows = np.flatnonzero(~np.isnan(values))
+                if rows.size:
+                    keep[rows[bucket_extremes(bucket[rows], values[rows])]] = True
+        return frame[keep]
+
+    def update(self, chunk, numeric_cols):
+        # chunk の行番号（index）はファイル全体での位置
+        kept = self._reduce(chunk, numeric_cols)
+        self.frame = kept if self.frame is None else pd.concat([self.frame, kept])
+        while len(self.frame) > self.max_rows:
+            self.stride *= 2
+            self.frame = self._reduce(self.frame, numeric_cols)
+
+
+# --- チャンク読み込みの結果 ---
+class StreamedDataset:
+    def __init__(self):
+        self.row_count = 0
+        self.dtypes = None
+        self.columns = []
+        self.numeric_cols = []
+        self.summaries = {}
+        self.non_null = {}
+        self.group_sums = {}
+        self.group_counts = {}
+        self.series = StrideSample()
+        self.source_format = {}
+
+    @property
+    def sample(self):
+        return self.series.frame
+
+    @property
+    def stride(self):
+        return self.series.stride
+
+    def nbytes(self):
+        sample_bytes = int(self.sample.memory_usage(deep=True).sum()) if self.sample is not None else 0
+        hist_bytes = sum(s.hist.counts.nbytes + s.sample.nbytes * 2 for s in self.summaries.values())
+        group_bytes = sum(int(g.memory_usage(deep=True).sum()) for g in self.group_sums.values())
+        return sample_bytes + hist_bytes + group_bytes
+
+    def _update_groups(self, chunk):
+        for key in list(self.group_sums):
+            part = chunk.groupby(key, sort=False)[self.numeric_cols].sum()
+            sizes = chunk.groupby(key, sort=False).size()
+            # sort=False なので最初に出現した順序が保たれる
+            merged = pd.concat([self.group_sums[key], part]).groupby(level=0, sort=False).sum()
+            if len(merged) > MAX_GROUPS:
+                # カテゴリが多すぎる列は集計をあきらめる
+                del self.group_sums[key]
+                del self.group_counts[key]
+                continue
+            self.group_sums[key] = merged
+            self.group_counts[key] = pd.concat([self.group_counts[key], sizes]).groupby(level=0, sort=False).sum()
+
+    def update(self, chunk):
+        if self.dtypes is None:
+            self.dtypes = chunk.dtypes
+            self.columns = list(chunk.columns)
+            self.numeric_cols = [c for c in chunk.columns if pd.api.types.is_numeric_dtype(chunk[c])]
+            self.summaries = {c: ColumnSummary(seed=i) for i, c in enumerate(self.numeric_cols)}
+            self.non_null = {c: 0 for c in chunk.columns}
+            for c in chunk.columns:
+                if c not in self.numeric_cols:
+                    self.group_sums[c] = pd.DataFrame(columns=self.numeric_cols, dtype=float)
+                    self.group_counts[c] = pd.Series(dtype=np.int64)
+        else:
+            # 途中のチャンクで型推論が変わっても、最初のチャンクの数値列は数値として扱う
+            for c in self.numeric_cols:
+                if not pd.api.types.is_numeric_dtype(chunk[c]):
+                    chunk[c] = pd.to_numeric(chunk[c], errors="coerce")
+        chunk.index = pd.RangeIndex(self.row_count, self.row_count + len(chunk))
+        for c, n in chunk.count().items():
+            self.non_null[c] += int(n)
+        for c, summary in self.summaries.items():
+            summary.update(chunk[c])
+        self._update_groups(chunk)
+        self.series.update(chunk, self.numeric_cols)
+        self.row_count += len(chunk)
+
+    def histogram(self, cols, bins):
+        # 全列で共通の階級に細かいヒストグラムを再配分する（列がなければ階級もない）
+        if not cols:
+            return np.zeros(1), []
+        lo = min(self.summaries[c].min for c in cols)
+        hi = max(self.summaries[c].max for c in cols)
+        edges = histogram_edges(lo, hi, bins)
+        return edges, [self.summaries[c].hist.rebin(edges) for c in cols]
+
+    def grouped(self, key, cols):
+        return self.group_sums[key][cols].rename_axis(key).reset_index()
+
+
+def stream_csv(source, chunk_rows=CHUNK_ROWS, **options):
+    # source はバイト列・ファイルパス・ファイルオブジェクトのいずれでもよい
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        sniffed = sniff_csv(source)
+        buffer = io.BytesIO(source)
+    elif isinstance(source, str):
+        with open(source, "rb") as f:
+            sniffed = sniff_csv(f.read(SNIFF_BYTES))
+        buffer = source
+    else:
+        pos = source.tell()
+        sniffed = sniff_csv(source.read(SNIFF_BYTES))
+        source.seek(pos)
+        buffer = source
+    sniffed.update(options)
+    kwargs = dict(sniffed)
+    if kwargs["decimal"] == ".":
+        del kwargs["decimal"]
+
+    result = StreamedDataset()
+    result.source_format = sniffed
+    with pd.read_csv(buffer, chunksize=chunk_rows, **kwargs) as reader:
+        for chunk in reader:
+            if sniffed["header"] is None:
+                chunk.columns = [f"列{i + 1}" for i in range(chunk.shape[1])]
+            result.update(chunk)
+    return result
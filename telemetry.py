@@ -0,0 +1,169 @@
+import contextlib
+import contextvars
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import tempfile
+import threading
+import time
+import tracemalloc
+import weakref
+
+# --- 再実行1回分の段階ごとの計測（診断用。既定では何もしない） ---
+# 各段階の経過時間・CPU時間・メモリの増減を記録し、デバッグ用のパネルと構造化ログ（1段階1行のJSON）に出す。
+# 計測する側は stage("parse") のように書くだけでよく、計測中でなければ何もしない（描画サービス・一括描画でも同じコードを使う）。
+# メモリは既定では常駐メモリ（RSS）の増減、tracemalloc を選ぶとPythonが確保した量を測る（遅くなる）。
+# tracemalloc はプロセス全体で1つなので、使っている Recorder を数えて最後の1つが終わったら止め、
+# tracemalloc で測る最上位の段階は1つずつ順番に実行する（他のセッションの reset_peak や確保が混ざらないように。
+# 計測していないセッションの確保は区別できないので、同時に動いていればその分も含まれる）。
+logger = logging.getLogger("graphypad.telemetry")
+
+_current = contextvars.ContextVar("graphypad_telemetry", default=None)
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_trace_lock = threading.Lock()
+_trace_users = 0
+_trace_started = False  # このモジュールが始めたか（他の道具が始めた tracemalloc は止めない）
+_measure_lock = threading.Lock()  # tracemalloc で測っている最上位の段階
+
+
+def _start_tracing():
+    global _trace_users, _trace_started
+    with _trace_lock:
+        if _trace_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _trace_started = True
+        _trace_users += 1
+
+
+def _stop_tracing():
+    global _trace_users, _trace_started
+    with _trace_lock:
+        _trace_users -= 1
+        if _trace_users == 0 and _trace_started:
+            tracemalloc.stop()
+            _trace_started = False
+
+
+def current_rss():
+    # 今の常駐メモリ（バイト）。/proc がない環境では None
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Recorder:
+    def __init__(self, memory="rss", **context):
+        self.memory = memory
+        self.context = dict(context)  # データの大きさ・グラフの種類など、ログの全行に付ける情報
+        self.records = []
+        self._depth = 0
+        self._release = weakref.finalize(self, _stop_tracing) if memory == "tracemalloc" else None
+        if self._release is not None:
+            _start_tracing()
+
+    def close(self):
+        # tracemalloc の利用をやめる（使っている Recorder がなくなれば止まる）。閉じ忘れても回収時に同じことをする
+        if self._release is not None:
+            self._release()
+
+    def _memory(self):
+        if self.memory == "tracemalloc":
+            return tracemalloc.get_traced_memory()[0]
+        return current_rss()
+
+    @contextlib.contextmanager
+    def measure(self, name, **info):
+        record = {"stage": name, "depth": self._depth, **info}
+        serialized = self.memory == "tracemalloc" and record["depth"] == 0
+        if serialized:
+            _measure_lock.acquire()  # 待った時間は記録に含めない
+        self.records.append(record)  # 入れ子の段階が後に並ぶよう、始めた順に並べる
+        self._depth += 1
+        if serialized:
+            tracemalloc.reset_peak()
+        mem = self._memory()
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield record
+        finally:
+            record["wall_ms"] = (time.perf_counter() - wall) * 1e3
+            record["cpu_ms"] = (time.thread_time() - cpu) * 1e3
+            end = self._memory()
+            record["mem_kb"] = (end - mem) / 1024 if mem is not None and end is not None else None
+            if serialized:
+                record["peak_kb"] = (tracemalloc.get_traced_memory()[1] - mem) / 1024
+                _measure_lock.release()
+            self._depth -= 1
+
+    def table(self):
+        # パネル表示用（入れ子は字下げで表す）
+        return [{"段階": "　" * r["depth"] + r["stage"], "経過(ms)": round(r.get("wall_ms", 0.0), 1),
+                 "CPU(ms)": round(r.get("cpu_ms", 0.0), 1),
+                 "メモリ増減(KB)": None if r.get("mem_kb") is None else round(r["mem_kb"])}
+                for r in self.records]
+
+    def log(self):
+        for r in self.records:
+            logger.info(json.dumps(dict(self.context, **r), ensure_ascii=False, default=str))
+
+
+def log_to_stderr():
+    # 構造化ログを標準エラーに1行ずつ出す（アプリ側の設定がない場合。何度呼んでも1つだけ）
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+def activate(recorder):
+    # このスレッド（Streamlitでは再実行1回分）で stage() が記録する先にする。None なら計測しない
+    # （再実行のたびに呼び、前の再実行の記録先が残らないようにする）
+    _current.set(recorder)
+    return recorder
+
+
+def active():
+    # 今の記録先（計測していなければ None）
+    return _current.get()
+
+
+def stage(name, **info):
+    # 計測中ならその段階を記録する（計測していなければ何もしない）
+    recorder = _current.get()
+    return recorder.measure(name, **info) if recorder is not None else contextlib.nullcontext()
+
+
+def set_context(**context):
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.context.update(context)
+
+
+# --- cProfile による再実行1回分のプロファイル ---
+def start_profile():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def finish_profile(profiler, top=40):
+    # 戻り値は (累積時間の上位の一覧, pstats で読める .prof ファイルの中身)
+    profiler.disable()
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(top)
+    fd, path = tempfile.mkstemp(suffix=".prof")
+    os.close(fd)
+    try:
+        profiler.dump_stats(path)
+        with open(path, "rb") as f:
+            raw = f.read()
+    finally:
+        os.remove(path)
+    return text.getvalue(), raw